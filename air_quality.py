@@ -0,0 +1,118 @@
+"""
+Оценка качества воздуха по компонентам OpenWeather.
+
+``AIR_THRESHOLDS`` — пороги (мкг/м³) по компонентам в порядке возрастания; за каждый
+превышенный порог компонент получает балл. Сумма баллов даёт общий статус
+(``AIR_STATUSES``) — для анализатора, API и уведомлений.
+
+Оценка одного компонента в расширенных данных бота (``grade_component``) — по своей
+таблице ``COMPONENT_BANDS`` с прежними границами бота: у неё другой смысл (норма ВОЗ
+для PM), и общие пороги её не меняют.
+
+``score_components`` оценивает сразу много наборов компонентов — точки подписчиков,
+часы прогноза загрязнения — колонками: значения компонента по всем строкам
+собираются в массив и раскладываются по порогам через ``bisect``.
+"""
+from __future__ import annotations
+
+from array import array
+from bisect import bisect_left, bisect_right
+from typing import Any, Hashable, Sequence
+
+# Компонент -> пороги по возрастанию; значение выше порога — +1 балл.
+AIR_THRESHOLDS: dict[str, tuple[float, ...]] = {
+    "pm2_5": (5.0, 15.0, 35.0),
+    "pm10": (10.0, 25.0, 50.0),
+    "no2": (40.0, 100.0),
+    "o3": (60.0, 120.0),
+}
+
+# Общий статус по сумме баллов: (максимум баллов включительно, статус, пояснение).
+AIR_STATUSES: tuple[tuple[float, str, str], ...] = (
+    (2, "Хорошее", "Качество воздуха в норме."),
+    (5, "Умеренное", "Допустимо для большинства людей."),
+    (8, "Повышенное загрязнение", "Чувствительным группам стоит сократить время на улице."),
+    (float("inf"), "Высокое загрязнение", "Рекомендуется ограничить активность на открытом воздухе."),
+)
+_STATUS_LIMITS = [limit for limit, _, _ in AIR_STATUSES]
+
+# Оценка одного компонента в боте: с какого значения (мкг/м³) «умеренно» и «плохо».
+# Значение на границе — уже следующая оценка (value < 12 — норма).
+COMPONENT_BANDS: dict[str, tuple[float, float]] = {
+    "pm2_5": (12.0, 35.0),
+    "pm10": (20.0, 50.0),
+    "no2": (40.0, 100.0),
+    "o3": (60.0, 120.0),
+}
+
+# Оценка одного компонента: норма, умеренно, плохо.
+COMPONENT_GRADES: tuple[tuple[str, str], ...] = (
+    ("✅ Норма", "в пределах нормы"),
+    ("⚠️ Умеренно", "превышение нормы"),
+    ("❌ Плохо", "значительное превышение нормы"),
+)
+
+
+def _value(row: dict[str, Any], name: str) -> float:
+    value = row.get(name)
+    return float(value) if isinstance(value, (int, float)) else 0.0
+
+
+def score_components(rows: Sequence[dict[str, Any]]) -> list[int]:
+    """Сумма баллов по таблице порогов для каждого набора компонентов."""
+    total = [0] * len(rows)
+    for name, limits in AIR_THRESHOLDS.items():
+        column = array("d", (_value(row, name) for row in rows))
+        for i, value in enumerate(column):
+            # bisect_left: число порогов строго ниже значения, то есть превышенных.
+            total[i] += bisect_left(limits, value)
+    return total
+
+
+def status_index(score: int) -> int:
+    """Индекс статуса в AIR_STATUSES для суммы баллов."""
+    return bisect_left(_STATUS_LIMITS, score)
+
+
+def air_status(score: int) -> tuple[str, str]:
+    """Статус и пояснение для суммы баллов."""
+    _, status, summary = AIR_STATUSES[status_index(score)]
+    return status, summary
+
+
+def grade_component(name: str, value: float) -> tuple[str, str]:
+    """Оценка одного компонента (оценка, описание); "—", если компонента нет в таблице."""
+    bands = COMPONENT_BANDS.get(name)
+    if bands is None:
+        return "—", "нет данных"
+    return COMPONENT_GRADES[bisect_right(bands, float(value))]
+
+
+def worst_statuses(
+    series: dict[Hashable, Sequence[dict[str, Any]]], since: float | None = None, until: float | None = None
+) -> dict[Hashable, dict[str, Any] | None]:
+    """Худший час прогноза загрязнения в окне для каждой точки — все точки одним пакетом.
+
+    ``series`` — точка -> элементы ``list`` ответа /data/2.5/air_pollution/forecast
+    (``dt``, ``components``). Значение — {"dt", "score", "status"} или None, если в окне нет данных.
+    """
+    rows: list[dict[str, Any]] = []
+    owners: list[tuple[Hashable, Any]] = []
+    for key, items in series.items():
+        for item in items:
+            dt = item.get("dt") or 0
+            if not isinstance(item.get("components"), dict):
+                continue
+            if (since is not None and dt < since) or (until is not None and dt > until):
+                continue
+            rows.append(item["components"])
+            owners.append((key, item.get("dt")))
+    worst: dict[Hashable, dict[str, Any] | None] = {key: None for key in series}
+    for (key, dt), score in zip(owners, score_components(rows)):
+        current = worst[key]
+        if current is None or score > current["score"]:
+            worst[key] = {"dt": dt, "score": score}
+    for entry in worst.values():
+        if entry is not None:
+            entry["status"] = air_status(entry["score"])[0]
+    return worst
@@ -0,0 +1,243 @@
+"""
+Уведомления «при изменениях»: сообщение уходит, только когда погода в точке заметно меняется.
+
+Раз в ``interval_s`` подписчики режима ``changes`` группируются по бакету локации,
+и на каждый бакет запрашивается один прогноз (обычно из кэша, который держит
+свежим прогрев) — а не текущая погода на каждого пользователя. Новая версия
+прогноза сворачивается в короткое состояние (``forecast_state``): когда начнутся
+осадки, насколько завтра будет теплее или холоднее; статус качества воздуха —
+худший час прогноза загрязнения, все точки оцениваются одним пакетом
+(``air_quality.worst_statuses``).
+Состояние сравнивается с предыдущим для этого же бакета (``diff_states``);
+сообщение получают подписчики бакета, только если что-то перешло порог.
+
+Состояния хранятся в ``.cache/alert_state.json``: после рестарта сравнение
+продолжается с последнего увиденного прогноза, а не начинается заново.
+"""
+from __future__ import annotations
+
+import os
+import threading
+import time
+from typing import Any, Callable
+
+from air_quality import worst_statuses
+from renderer import condition_code, describe_item
+from storage import UserStorage
+from weather_app import PersistentMap, WeatherClient, location_bucket, metrics
+
+# Осадки позже этого горизонта ещё не повод писать: прогноз на завтра успеет поменяться.
+RAIN_LOOKAHEAD_S = 6 * 3600
+# Разница «завтра в это же время» против «сейчас»: суточный ход температуры её не создаёт.
+SWING_THRESHOLD_C = 6.0
+# Окно прогноза загрязнения: худший час в нём и есть статус точки.
+AIR_LOOKAHEAD_S = 12 * 3600
+# Статусы air_quality.AIR_STATUSES, при которых стоит предупредить.
+BAD_AIR = ("Повышенное загрязнение", "Высокое загрязнение")
+
+metrics.describe("notifications_sent_total", "Notifications sent to users by mode and delivery status")
+metrics.describe("alert_checks_total", "Locations checked by the change notifier by result")
+
+
+def _is_precipitation(item: dict[str, Any]) -> bool:
+    # Группы кодов OpenWeather: 2xx гроза, 3xx морось, 5xx дождь, 6xx снег.
+    return condition_code(item) // 100 in (2, 3, 5, 6)
+
+
+def _temp(item: dict[str, Any]) -> float | None:
+    temp = (item.get("main") or {}).get("temp")
+    return float(temp) if isinstance(temp, (int, float)) else None
+
+
+def forecast_state(forecast: list[dict[str, Any]], now: float) -> dict[str, Any]:
+    """Свести прогноз 5d/3h к сравниваемому состоянию: начало осадков и перепад к завтрашнему дню."""
+    # Текущий трёхчасовой слот тоже считается: он начался до now.
+    slots = sorted(
+        (i for i in forecast if isinstance(i.get("dt"), (int, float)) and i["dt"] >= now - 3 * 3600),
+        key=lambda i: i["dt"],
+    )
+    state: dict[str, Any] = {"rain_at": None, "rain": None, "swing": 0}
+    for item in slots:
+        if item["dt"] > now + RAIN_LOOKAHEAD_S:
+            break
+        if _is_precipitation(item):
+            state["rain_at"] = int(item["dt"])
+            state["rain"] = describe_item(item)
+            break
+    if slots:
+        first = slots[0]
+        tomorrow = min(slots, key=lambda i: abs(i["dt"] - first["dt"] - 86400))
+        t0, t1 = _temp(first), _temp(tomorrow)
+        if t0 is not None and t1 is not None and abs(tomorrow["dt"] - first["dt"] - 86400) <= 3 * 3600:
+            delta = t1 - t0
+            state["swing"] = round(delta) if abs(delta) >= SWING_THRESHOLD_C else 0
+    return state
+
+
+def diff_states(prev: dict[str, Any], new: dict[str, Any], now: float) -> list[str]:
+    """Строки уведомления о переходах через пороги между двумя состояниями одной точки."""
+    events: list[str] = []
+    if new.get("rain_at") and not prev.get("rain_at"):
+        hours = max(1, round((new["rain_at"] - now) / 3600))
+        events.append(f"🌧 В ближайшие {hours} ч ожидаются осадки: {new.get('rain') or 'осадки'}")
+    swing, prev_swing = int(new.get("swing") or 0), int(prev.get("swing") or 0)
+    if swing and (not prev_swing or (swing > 0) != (prev_swing > 0)):
+        events.append(f"🌡 Завтра в это время будет на {abs(swing)}°C {'теплее' if swing > 0 else 'холоднее'}, чем сейчас")
+    air, prev_air = new.get("air"), prev.get("air")
+    if air and prev_air and (air in BAD_AIR) != (prev_air in BAD_AIR):
+        if air in BAD_AIR:
+            hours = max(0, round(((new.get("air_at") or now) - now) / 3600))
+            if hours:
+                events.append(f"😷 Через {hours} ч качество воздуха ухудшится: {air.lower()}")
+            else:
+                events.append(f"😷 Качество воздуха ухудшилось: {air.lower()}")
+        else:
+            events.append(f"🌿 Качество воздуха в ближайшие часы: {air.lower()}")
+    return events
+
+
+class ChangeNotifier:
+    """Background job that diffs successive forecasts per location and notifies only affected subscribers."""
+
+    def __init__(
+        self,
+        client: WeatherClient,
+        storage: UserStorage,
+        send: Callable[[int, str], Any],
+        interval_s: float = 300,
+        state_path: str | os.PathLike[str] | None = None,
+    ) -> None:
+        self.client = client
+        self.storage = storage
+        self.send = send
+        self.interval_s = max(interval_s, 1.0)
+        self.states = PersistentMap(state_path or client.cache.cache_dir / "alert_state.json")
+        self._stop = threading.Event()
+        self._thread: threading.Thread | None = None
+        self.checked = 0
+        self.changed = 0
+        self.sent = 0
+
+    def subscribers(self) -> dict[str, tuple[float, float, list[tuple[int, str | None]]]]:
+        """Подписчики режима changes по бакетам: бакет -> (lat, lon, [(chat_id, название места)])."""
+        buckets: dict[str, tuple[float, float, list[tuple[int, str | None]]]] = {}
+        for user_id, user in self.storage.iter_users():
+            notif = user.get("notifications") or {}
+            if not notif.get("enabled") or notif.get("mode") != "changes":
+                continue
+            lat, lon = user.get("lat"), user.get("lon")
+            if not isinstance(lat, (int, float)) or not isinstance(lon, (int, float)):
+                continue
+            place = user.get("place")
+            name = user.get("city") or (place.get("name") if isinstance(place, dict) else None)
+            entry = buckets.setdefault(location_bucket(lat, lon), (float(lat), float(lon), []))
+            entry[2].append((int(notif.get("chat_id") or user_id), name))
+        return buckets
+
+    def _forecast_state(self, bucket: str, lat: float, lon: float, now: float) -> dict[str, Any] | None:
+        """Состояние по свежему прогнозу точки; None — прогноз тот же, что при прошлой проверке, или его нет."""
+        with self.client.background():
+            forecast = self.client.get_forecast_5d3h(lat, lon)
+        version = self.client.last_version
+        if not forecast or version is None:
+            metrics.inc("alert_checks_total", result="no_data")
+            return None
+        prev = self.states.get(bucket)
+        if prev and prev.get("version") == version[1]:
+            metrics.inc("alert_checks_total", result="unchanged")
+            return None
+        state = forecast_state(forecast, now)
+        state["version"] = version[1]
+        return state
+
+    def _score_air(self, points: dict[str, tuple[float, float]], now: float) -> dict[str, dict[str, Any] | None]:
+        """Худший час прогноза загрязнения в окне AIR_LOOKAHEAD_S — для всех точек одним пакетом."""
+        series = {}
+        for bucket, (lat, lon) in points.items():
+            with self.client.deadline(self.client.deadline_s):
+                series[bucket] = self.client.get_air_pollution_forecast(lat, lon)
+        return worst_statuses(series, since=now - 3600, until=now + AIR_LOOKAHEAD_S)
+
+    def check_locations(
+        self, points: dict[str, tuple[float, float]], now: float | None = None
+    ) -> dict[str, list[str]]:
+        """Сравнить свежие прогнозы точек с предыдущими: бакет -> строки уведомления (только изменившиеся)."""
+        now = time.time() if now is None else now
+        states: dict[str, dict[str, Any]] = {}
+        for bucket, (lat, lon) in points.items():
+            if self._stop.is_set():
+                break
+            # Проверка без пользователя за спиной: общий бюджет, как у обработчика бота.
+            with self.client.deadline(self.client.deadline_s):
+                state = self._forecast_state(bucket, lat, lon, now)
+            if state is not None:
+                states[bucket] = state
+        if not states:
+            return {}
+        # Воздух — только для точек с новым прогнозом, все часы всех точек одним вызовом оценки.
+        air = self._score_air({bucket: points[bucket] for bucket in states}, now)
+        events: dict[str, list[str]] = {}
+        for bucket, state in states.items():
+            prev = self.states.get(bucket)
+            worst = air.get(bucket)
+            if worst is not None:
+                state["air"], state["air_at"] = worst["status"], worst["dt"]
+            elif prev:
+                state["air"], state["air_at"] = prev.get("air"), prev.get("air_at")
+            self.checked += 1
+            # Первое состояние точки — только точка отсчёта.
+            changes = diff_states(prev, state, now) if prev else []
+            metrics.inc("alert_checks_total", result="changed" if changes else "diffed")
+            if changes:
+                events[bucket] = changes
+        self.states.update(states)
+        return events
+
+    def run_once(self, now: float | None = None) -> int:
+        """Один проход по подписчикам; возвращает число отправленных сообщений."""
+        subscribers = self.subscribers()
+        events = self.check_locations({bucket: (lat, lon) for bucket, (lat, lon, _) in subscribers.items()}, now)
+        sent = 0
+        for bucket, changes in events.items():
+            self.changed += 1
+            for chat_id, name in subscribers[bucket][2]:
+                try:
+                    self.send(chat_id, f"🔔 Погода меняется: {name or 'ваша локация'}\n" + "\n".join(changes))
+                except Exception:
+                    # Пользователь заблокировал бота и т. п.: остальным подписчикам это не мешает.
+                    metrics.inc("notifications_sent_total", mode="changes", status="error")
+                    continue
+                metrics.inc("notifications_sent_total", mode="changes", status="ok")
+                sent += 1
+        self.sent += sent
+        return sent
+
+    def _loop(self) -> None:
+        while not self._stop.wait(self.interval_s):
+            try:
+                self.run_once()
+            except Exception:
+                pass
+
+    def start(self) -> None:
+        if self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._loop, name="change-notifier", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+
+    def stats(self) -> dict[str, Any]:
+        return {"checked": self.checked, "changed": self.changed, "sent": self.sent}
+
+
+def start_change_notifier(
+    client: WeatherClient, storage: UserStorage, send: Callable[[int, str], Any]
+) -> ChangeNotifier | None:
+    """Запустить проверку изменений с настройками из окружения; None, если ALERTS=0."""
+    if os.getenv("ALERTS", "1").strip().lower() in ("0", "off", "false", "no"):
+        return None
+    notifier = ChangeNotifier(client, storage, send, interval_s=float(os.getenv("ALERTS_INTERVAL_S", "300")))
+    notifier.start()
+    return notifier
@@ -1,109 +1,224 @@
 from __future__ import annotations
 
 import os
+import threading
 import time
 from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
 from datetime import datetime
-from typing import Any
+from typing import Any, Callable, Iterator
 
 import telebot
 from dotenv import load_dotenv
-from telebot import types
+from telebot import apihelper, types
 
+import profiling
+from air_quality import grade_component
+from alerts import start_change_notifier
+from render_cache import RenderCache
+from renderer import condition_code, describe_item, group_by_day, summarize_day, weather_emoji
 from storage import UserStorage
-from weather_app import AirQualityAnalyzer, WeatherClient
-
-load_dotenv()
+from warmup import start_cache_warmer
+from weather_app import AirQualityAnalyzer, WeatherClient, location_bucket, metrics, start_metrics_server
 
 
 class TelegramWeatherBot:
     def __init__(self) -> None:
+        load_dotenv()
+        profiling.configure_from_env()
         self.bot_token = os.getenv("BOT_TOKEN", "").strip()
         self.ow_api_key = os.getenv("OW_API_KEY", "").strip()
+        # Пул ключей OpenWeather: запросы распределяются по остатку квоты.
+        self.ow_api_keys = [k.strip() for k in os.getenv("OW_API_KEYS", "").split(",") if k.strip()]
         self.default_interval_h = int(os.getenv("DEFAULT_NOTIFICATIONS_INTERVAL_H", "2"))
-        self.request_timeout = int(os.getenv("REQUEST_TIMEOUT", "8"))
-        self.cache_ttl_min = int(os.getenv("CACHE_TTL_MIN", "10"))
         self.miniapp_url = (os.getenv("MINIAPP_URL", "").strip() or "https://193.42.127.176:8443").rstrip("/")
 
         if not self.bot_token:
             raise ValueError("BOT_TOKEN не найден. Добавьте токен в .env")
-        if not self.ow_api_key:
-            raise ValueError("OW_API_KEY не найден. Добавьте ключ OpenWeather в .env")
+        if not self.ow_api_key and not self.ow_api_keys:
+            raise ValueError("OW_API_KEY не найден. Добавьте ключ OpenWeather (или OW_API_KEYS) в .env")
 
         self.bot = telebot.TeleBot(self.bot_token, parse_mode="HTML")
+        # Вызовы Telegram API — отдельный участок в трассах профилирования.
+        apihelper.CUSTOM_REQUEST_SENDER = self._send_telegram_request
+        # Кому доступны служебные команды (/profile): ID через запятую.
+        self.admin_ids = {int(x) for x in os.getenv("ADMIN_IDS", "").split(",") if x.strip().lstrip("-").isdigit()}
         data_dir = os.getenv("BOT_DATA_DIR", "").strip()
         if data_dir:
             os.makedirs(data_dir, exist_ok=True)
         storage_path = os.path.join(data_dir, "User_Data.json") if data_dir else "User_Data.json"
         self.storage = UserStorage(storage_path)
-        self.weather = WeatherClient(
-            api_key=self.ow_api_key,
-            timeout=self.request_timeout,
-            cache_ttl_min=self.cache_ttl_min,
-        )
+        self.weather = WeatherClient.from_env()
+        # Сколько городов-подсказок показывать в inline-режиме (из офлайн-справочника).
+        self.inline_suggestions = int(os.getenv("INLINE_SUGGESTIONS", "3"))
         self.air_analyzer = AirQualityAnalyzer()
 
         self.user_states: dict[int, dict[str, Any]] = defaultdict(dict)
         self.forecast_cache: dict[int, dict[str, list[dict[str, Any]]]] = {}
-
-        # Словарь переводов описаний погоды (fallback если API вернет EN)
-        self.weather_translations = {
-            "clear sky": "ясно",
-            "few clouds": "небольшая облачность",
-            "scattered clouds": "переменная облачность",
-            "broken clouds": "облачно",
-            "overcast clouds": "пасмурно",
-            "light rain": "небольшой дождь",
-            "moderate rain": "умеренный дождь",
-            "heavy rain": "сильный дождь",
-            "light snow": "небольшой снег",
-            "moderate snow": "умеренный снег",
-            "heavy snow": "сильный снег",
-            "mist": "туман",
-            "fog": "туман",
-            "haze": "дымка",
-            "dust": "пыль",
-            "sand": "песок",
-            "thunderstorm": "гроза",
-            "drizzle": "морось",
-        }
+        # Общий для всех пользователей кэш отрендеренных обзоров прогноза.
+        self.render_cache = RenderCache(max_entries=int(os.getenv("RENDER_CACHE_SIZE", "512")))
+        metrics.add_collector(self._collect_render_cache)
+        # Второстепенные вызовы Telegram (typing, ответы на нажатия кнопок) уходят в фоне
+        # и идут параллельно с запросами к OpenWeather: на пути ответа остаётся только сообщение.
+        # Потоки пула живут долго, у каждого своя keep-alive сессия telebot.
+        self._tg_async = ThreadPoolExecutor(
+            max_workers=int(os.getenv("TELEGRAM_ASYNC_WORKERS", "4")),
+            thread_name_prefix="tg-async",
+        )
+        self._handler_state = threading.local()
+        # Сообщения, пролежавшие в очереди дольше этого (бот перегружен или лежал), не обрабатываются
+        # целиком: пользователь получает короткий ответ «занят» и повторяет запрос.
+        self.update_deadline_s = float(os.getenv("BOT_UPDATE_DEADLINE_S", "60"))
 
         self._register_handlers()
 
+    def _collect_render_cache(self) -> None:
+        # Вызывается при каждом опросе /metrics, как api_render_cache в /api/metrics.
+        for name, value in self.render_cache.stats().items():
+            metrics.set_gauge("bot_render_cache", value, stat=name)
+
     def run(self) -> None:
+        # Прогрев кэша для сохранённых точек и упреждающее обновление перед истечением TTL.
+        self.cache_warmer = start_cache_warmer(self.weather, self.storage, role="bot")
+        # Уведомления «при изменениях»: один прогноз на точку, сообщения только затронутым подписчикам.
+        self.change_notifier = start_change_notifier(self.weather, self.storage, self.bot.send_message)
+        metrics_port = int(os.getenv("METRICS_PORT", "0"))
+        if metrics_port:
+            # Prometheus забирает метрики бота с локального порта (в API — /api/metrics).
+            start_metrics_server(metrics_port, os.getenv("METRICS_HOST", "127.0.0.1"))
         self.bot.infinity_polling(skip_pending=True)
 
+    @contextmanager
+    def _track(self, handler: str) -> Iterator[None]:
+        """Время и ошибки обработчика в метриках, дедлайн запросов к OpenWeather; трасса, если включено профилирование."""
+        started = time.perf_counter()
+        profiling.start_trace(f"bot.{handler}")
+        self._handler_state.typing = set()
+        try:
+            # Общий дедлайн на все запросы к OpenWeather из обработчика, а не на каждый по отдельности.
+            with self.weather.deadline(self.weather.deadline_s):
+                yield
+        except Exception:
+            metrics.inc("bot_handler_errors_total", handler=handler)
+            raise
+        finally:
+            self._handler_state.typing = None
+            profiling.finish_trace()
+            metrics.observe("bot_handler_seconds", time.perf_counter() - started, handler=handler)
+
+    def _shed_stale(self, message: types.Message) -> bool:
+        """Ответить «занят» на слишком старое сообщение вместо полной обработки."""
+        if not self.update_deadline_s or time.time() - message.date <= self.update_deadline_s:
+            return False
+        metrics.inc("bot_shed_total", reason="stale_update")
+        self.bot.send_message(message.chat.id, "Бот был перегружен и не успел ответить. Повторите запрос, пожалуйста.")
+        return True
+
+    def _fire(self, method: str, call: Callable[..., Any], *args: Any) -> None:
+        """Вызвать Telegram API в фоне, не дожидаясь ответа."""
+
+        def run() -> None:
+            try:
+                call(*args)
+            except Exception:
+                # Потерянный typing или ответ на нажатие кнопки не должен влиять на обработчик.
+                metrics.inc("bot_telegram_async_errors_total", method=method)
+
+        self._tg_async.submit(run)
+
+    def _typing(self, chat_id: int) -> None:
+        """Статус «печатает» — в фоне и не больше одного раза за обработчик."""
+        sent = getattr(self._handler_state, "typing", None)
+        if sent is not None:
+            if chat_id in sent:
+                return
+            sent.add(chat_id)
+        self._fire("sendChatAction", self.bot.send_chat_action, chat_id, "typing")
+
+    def _ack(self, call_id: str, text: str | None = None) -> None:
+        """Ответ на нажатие кнопки — в фоне, до основной работы обработчика."""
+        self._fire("answerCallbackQuery", self.bot.answer_callback_query, call_id, text)
+
+    @staticmethod
+    def _send_telegram_request(method: str, url: str, **kwargs: Any) -> Any:
+        with profiling.span("telegram." + url.rsplit("/", 1)[-1]):
+            return apihelper._get_req_session().request(method, url, **kwargs)
+
     def _register_handlers(self) -> None:
         @self.bot.message_handler(commands=["start"])
         def start(message: types.Message) -> None:
-            self._check_notifications(message.from_user.id, message.chat.id)
-            self._send_main_menu(
-                chat_id=message.chat.id,
-                text=(
-                    "Привет! Я погодный бот.\n"
-                    "Выберите действие в меню ниже."
-                ),
-            )
+            with self._track("start"):
+                self._check_notifications(message.from_user.id, message.chat.id)
+                self._send_main_menu(
+                    chat_id=message.chat.id,
+                    text=(
+                        "Привет! Я погодный бот.\n"
+                        "Выберите действие в меню ниже."
+                    ),
+                )
+
+        @self.bot.message_handler(commands=["profile"])
+        def profile(message: types.Message) -> None:
+            self._handle_profile_command(message)
 
         @self.bot.message_handler(content_types=["location"])
         def handle_location(message: types.Message) -> None:
-            self._check_notifications(message.from_user.id, message.chat.id)
-            self._handle_location_message(message)
+            with self._track("location"):
+                if self._shed_stale(message):
+                    return
+                self._check_notifications(message.from_user.id, message.chat.id)
+                self._handle_location_message(message)
 
         @self.bot.callback_query_handler(func=lambda call: True)
         def handle_callback(call: types.CallbackQuery) -> None:
-            if call.message and call.from_user:
-                self._check_notifications(call.from_user.id, call.message.chat.id)
-            self._handle_callback(call)
+            with self._track("callback"):
+                if call.message and call.from_user:
+                    self._check_notifications(call.from_user.id, call.message.chat.id)
+                self._handle_callback(call)
 
         @self.bot.message_handler(content_types=["text"])
         def handle_text(message: types.Message) -> None:
-            self._check_notifications(message.from_user.id, message.chat.id)
-            self._handle_text_message(message)
+            with self._track("text"):
+                if self._shed_stale(message):
+                    return
+                self._check_notifications(message.from_user.id, message.chat.id)
+                self._handle_text_message(message)
 
         @self.bot.inline_handler(lambda query: True)
         def handle_inline(query: types.InlineQuery) -> None:
-            self._handle_inline_query(query)
+            with self._track("inline"):
+                self._handle_inline_query(query)
+
+    def _handle_profile_command(self, message: types.Message) -> None:
+        """/profile [on [доля cProfile] | off | mem] — профилирование для администраторов."""
+        if message.from_user.id not in self.admin_ids:
+            self._send_main_menu(message.chat.id, "Не понял команду. Выберите действие из меню.")
+            return
+        args = (message.text or "").split()[1:]
+        action = args[0].lower() if args else "status"
+        if action == "on":
+            rate = None
+            if len(args) > 1:
+                try:
+                    rate = float(args[1])
+                except ValueError:
+                    pass
+            profiling.enable(sample_rate=rate)
+            text = "Профилирование включено."
+        elif action == "off":
+            profiling.disable()
+            text = "Профилирование выключено."
+        elif action == "mem":
+            path = profiling.dump_memory()
+            if path is None:
+                profiling.enable(memory=True)
+                text = "tracemalloc запущен, повторите /profile mem для снимка."
+            else:
+                text = f"Снимок памяти: {path}"
+        else:
+            text = f"Профилирование: {'включено' if profiling.is_enabled() else 'выключено'}."
+        self.bot.send_message(message.chat.id, text)
 
     def _main_menu_markup(self, with_miniapp: bool = True) -> types.ReplyKeyboardMarkup:
         markup = types.ReplyKeyboardMarkup(resize_keyboard=True, row_width=2)
@@ -218,39 +333,48 @@ class TelegramWeatherBot:
         user_data = self.storage.load_user(user_id)
         user_data["lat"] = lat
         user_data["lon"] = lon
+        # Город из прошлого текстового запроса к новой точке уже не относится.
+        user_data.pop("city", None)
+        place = self.weather.reverse_geocode(lat, lon)
+        if place:
+            user_data["place"] = place
+        else:
+            user_data.pop("place", None)
         user_data.setdefault("notifications", {"enabled": False, "interval_h": self.default_interval_h})
         self.storage.save_user(user_id, user_data)
 
         state = self.user_states.get(user_id, {})
         action = state.get("action")
+        place_name = place["name"] if place else None
 
         if action == "current_weather":
-            self._send_current_weather(message.chat.id, lat, lon)
+            self._send_current_weather(message.chat.id, lat, lon, city=place_name)
             self.user_states[user_id] = {}
             return
 
         if action == "forecast":
-            self._send_forecast_menu(message.chat.id, user_id, lat, lon)
+            self._send_forecast_menu(message.chat.id, user_id, lat, lon, city=place_name)
             self.user_states[user_id] = {}
             return
 
         if action == "extended_data":
-            self._send_extended_data(message.chat.id, lat, lon)
+            self._send_extended_data(message.chat.id, lat, lon, city=place_name)
             self.user_states[user_id] = {}
             return
 
         self.bot.send_message(message.chat.id, "Геолокация сохранена.")
 
     def _handle_current_weather_by_city(self, message: types.Message, city: str) -> None:
-        self.bot.send_chat_action(message.chat.id, "typing")
+        self._typing(message.chat.id)
         coords = self.weather.get_coordinates(city)
         if not coords:
-            self.bot.send_message(message.chat.id, "Город не найден.")
+            self.bot.send_message(message.chat.id, self.weather.last_error or "Город не найден.")
             return
 
         lat, lon = coords
         user_data = self.storage.load_user(message.from_user.id)
         user_data["city"] = city
+        user_data.pop("place", None)
         user_data["lat"] = lat
         user_data["lon"] = lon
         user_data.setdefault("notifications", {"enabled": False, "interval_h": self.default_interval_h})
@@ -260,7 +384,7 @@ class TelegramWeatherBot:
         self.user_states[message.from_user.id] = {}
 
     def _send_current_weather(self, chat_id: int, lat: float, lon: float, city: str | None = None) -> None:
-        self.bot.send_chat_action(chat_id, "typing")
+        self._typing(chat_id)
         weather = self.weather.get_current_weather(lat, lon)
         if not weather:
             self.bot.send_message(chat_id, self.weather.last_error or "Не удалось получить погоду.")
@@ -269,9 +393,7 @@ class TelegramWeatherBot:
         city_name = city or weather.get("name", "Неизвестный город")
         main = weather.get("main", {})
         wind = weather.get("wind", {})
-        weather_meta = weather.get("weather", [{}])
-        raw_description = weather_meta[0].get("description") or "нет описания"
-        description = self._translate_weather_description(raw_description).capitalize()
+        description = describe_item(weather).capitalize()
 
         msg = (
             f"<b>Текущая погода: {city_name}</b>\n"
@@ -281,18 +403,38 @@ class TelegramWeatherBot:
             f"🌬 Ветер: {wind.get('speed', '—')} м/с\n"
             f"☁️ Состояние: {description}"
         )
+        trend = self._trend_line(lat, lon, weather)
+        if trend:
+            msg += f"\n{trend}"
         self.bot.send_message(chat_id, msg)
 
+    def _trend_line(self, lat: float, lon: float, weather: dict[str, Any]) -> str | None:
+        """Сравнение со вчерашним наблюдением из локальной истории (без запросов в OpenWeather)."""
+        temp = (weather.get("main") or {}).get("temp")
+        if temp is None:
+            return None
+        now = float(weather.get("dt") or time.time())
+        past = self.weather.get_observation_at(lat, lon, now - 86400, max_gap_s=3600)
+        if not past or past["temp"] != past["temp"]:  # NaN — температура не записана
+            return None
+        delta = float(temp) - past["temp"]
+        if abs(delta) < 0.5:
+            change = "так же"
+        else:
+            change = f"{'теплее' if delta > 0 else 'холоднее'} на {abs(delta):.1f}°C"
+        return f"📈 Вчера в это время: {past['temp']:.1f}°C — сейчас {change}"
+
     def _handle_forecast_by_city(self, message: types.Message, city: str) -> None:
-        self.bot.send_chat_action(message.chat.id, "typing")
+        self._typing(message.chat.id)
         coords = self.weather.get_coordinates(city)
         if not coords:
-            self.bot.send_message(message.chat.id, "Город не найден.")
+            self.bot.send_message(message.chat.id, self.weather.last_error or "Город не найден.")
             return
 
         lat, lon = coords
         user_data = self.storage.load_user(message.from_user.id)
         user_data["city"] = city
+        user_data.pop("place", None)
         user_data["lat"] = lat
         user_data["lon"] = lon
         user_data.setdefault("notifications", {"enabled": False, "interval_h": self.default_interval_h})
@@ -309,42 +451,30 @@ class TelegramWeatherBot:
         lon: float,
         city: str | None = None,
     ) -> None:
-        self.bot.send_chat_action(chat_id, "typing")
+        self._typing(chat_id)
         forecast_list = self.weather.get_forecast_5d3h(lat, lon)
         if not forecast_list:
             self.bot.send_message(chat_id, self.weather.last_error or "Не удалось получить прогноз.")
             return
 
-        grouped: dict[str, list[dict[str, Any]]] = {}
-        for item in forecast_list:
-            dt_txt = str(item.get("dt_txt", ""))
-            day = dt_txt.split(" ")[0] if " " in dt_txt else dt_txt[:10]
-            if day:
-                grouped.setdefault(day, []).append(item)
+        version = self.weather.last_version
+        cache_key = (location_bucket(lat, lon), "forecast_menu", "ru")
+        grouped, overview = self.render_cache.get_or_render(
+            cache_key,
+            version,
+            lambda: self._render_forecast_overview(forecast_list),
+        )
 
         if not grouped:
             self.bot.send_message(chat_id, "Нет данных прогноза.")
             return
 
         self.forecast_cache[user_id] = grouped
-        
-        # Формируем общий прогноз на 5 дней с эмодзи
+
         title_city = city or "выбранной точки"
-        forecast_lines = [f"<b>Прогноз на 5 дней: {title_city}</b>\n"]
-        
-        for day in sorted(grouped.keys())[:5]:  # Берем первые 5 дней
-            day_items = grouped[day]
-            summary = self._get_daily_summary(day_items)
-            day_label = self._format_day_label(day)
-            
-            forecast_lines.append(
-                f"{summary['emoji']} <b>{day_label}</b>\n"
-                f"   {summary['min_temp']}° / {summary['max_temp']}°C - {summary['description']}\n"
-            )
-        
-        forecast_text = "".join(forecast_lines)
+        forecast_text = f"<b>Прогноз на 5 дней: {title_city}</b>\n" + overview
         forecast_text += "\nВыберите день для детального прогноза:"
-        
+
         markup = types.InlineKeyboardMarkup(row_width=1)
         for day in sorted(grouped.keys())[:5]:
             label = self._format_day_label(day)
@@ -353,6 +483,26 @@ class TelegramWeatherBot:
 
         self.bot.send_message(chat_id, forecast_text, reply_markup=markup)
 
+    def _render_forecast_overview(
+        self,
+        forecast_list: list[dict[str, Any]],
+    ) -> tuple[dict[str, list[dict[str, Any]]], str]:
+        """Группирует прогноз по дням и строит текст обзора (без заголовка с городом)."""
+        grouped = group_by_day(forecast_list)
+
+        # Формируем общий прогноз на 5 дней с эмодзи
+        forecast_lines = []
+        for day in sorted(grouped.keys())[:5]:  # Берем первые 5 дней
+            day_items = grouped[day]
+            summary = self._get_daily_summary(day_items)
+            day_label = self._format_day_label(day)
+
+            forecast_lines.append(
+                f"{summary['emoji']} <b>{day_label}</b>\n"
+                f"   {summary['min_temp']}° / {summary['max_temp']}°C - {summary['description']}\n"
+            )
+        return grouped, "".join(forecast_lines)
+
     def _format_day_label(self, day: str) -> str:
         try:
             parsed = datetime.strptime(day, "%Y-%m-%d")
@@ -360,89 +510,23 @@ class TelegramWeatherBot:
         except ValueError:
             return day
 
-    def _translate_weather_description(self, description: str) -> str:
-        """Переводит описание погоды с английского на русский, если нужно."""
-        desc_lower = description.lower().strip()
-        # Если уже на русском (содержит кириллицу), возвращаем как есть
-        if any("\u0400" <= char <= "\u04FF" for char in description):
-            return description
-        
-        # Ищем перевод
-        for en, ru in self.weather_translations.items():
-            if en in desc_lower:
-                return ru
-        
-        # Если не нашли точный перевод, возвращаем оригинал
-        return description
-
-    def _get_weather_emoji(self, weather_code: int) -> str:
-        """Возвращает эмодзи для кода погоды OpenWeather."""
-        # Основные группы кодов погоды OpenWeather
-        if weather_code == 800:  # Clear sky
-            return "☀️"
-        elif weather_code == 801:  # Few clouds
-            return "🌤️"
-        elif weather_code == 802:  # Scattered clouds
-            return "⛅"
-        elif weather_code == 803 or weather_code == 804:  # Broken/Overcast clouds
-            return "☁️"
-        elif weather_code >= 200 and weather_code < 300:  # Thunderstorm
-            return "⛈️"
-        elif weather_code >= 300 and weather_code < 400:  # Drizzle
-            return "🌦️"
-        elif weather_code >= 500 and weather_code < 600:  # Rain
-            return "🌧️"
-        elif weather_code >= 600 and weather_code < 700:  # Snow
-            return "❄️"
-        elif weather_code >= 700 and weather_code < 800:  # Atmosphere (mist, fog, etc.)
-            return "🌫️"
-        else:
-            return "🌡️"
-
     def _get_daily_summary(self, day_items: list[dict[str, Any]]) -> dict[str, Any]:
         """Получает сводку по дню: мин/макс температура, основное состояние погоды."""
         if not day_items:
             return {"min_temp": "—", "max_temp": "—", "emoji": "🌡️", "description": "нет данных"}
-        
-        temps = []
-        weather_codes = []
-        descriptions = []
-        
-        for item in day_items:
-            main = item.get("main", {})
-            temp = main.get("temp")
-            if isinstance(temp, (int, float)):
-                temps.append(float(temp))
-            
-            weather_list = item.get("weather", [])
-            if weather_list and isinstance(weather_list[0], dict):
-                code = weather_list[0].get("id")
-                desc = weather_list[0].get("description", "")
-                if code:
-                    weather_codes.append(code)
-                if desc:
-                    descriptions.append(desc)
-        
-        min_temp = min(temps) if temps else "—"
-        max_temp = max(temps) if temps else "—"
-        
-        # Берем наиболее частый код погоды или первый
-        main_code = weather_codes[0] if weather_codes else 800
-        emoji = self._get_weather_emoji(main_code)
-        
-        # Берем первое описание и переводим если нужно
-        raw_desc = descriptions[0] if descriptions else "нет данных"
-        description = self._translate_weather_description(raw_desc).capitalize()
-        
+
+        summary = summarize_day(day_items)
+        min_temp = summary["temp_min"]
+        max_temp = summary["temp_max"]
         return {
-            "min_temp": f"{min_temp:.1f}" if isinstance(min_temp, float) else min_temp,
-            "max_temp": f"{max_temp:.1f}" if isinstance(max_temp, float) else max_temp,
-            "emoji": emoji,
-            "description": description,
+            "min_temp": f"{min_temp:.1f}" if min_temp is not None else "—",
+            "max_temp": f"{max_temp:.1f}" if max_temp is not None else "—",
+            "emoji": summary["emoji"],
+            "description": (summary["description"] or "нет данных").capitalize(),
         }
 
     def _handle_compare_cities(self, chat_id: int, city_1: str, city_2: str) -> None:
-        self.bot.send_chat_action(chat_id, "typing")
+        self._typing(chat_id)
         coords_1 = self.weather.get_coordinates(city_1)
         coords_2 = self.weather.get_coordinates(city_2)
 
@@ -461,12 +545,8 @@ class TelegramWeatherBot:
         t2 = w2.get("main", {}).get("temp", "—")
         
         # Получаем состояние погоды
-        weather1 = w1.get("weather", [{}])
-        weather2 = w2.get("weather", [{}])
-        raw_desc1 = weather1[0].get("description", "нет данных") if weather1 else "нет данных"
-        raw_desc2 = weather2[0].get("description", "нет данных") if weather2 else "нет данных"
-        desc1 = self._translate_weather_description(raw_desc1).capitalize()
-        desc2 = self._translate_weather_description(raw_desc2).capitalize()
+        desc1 = describe_item(w1, default="нет данных").capitalize()
+        desc2 = describe_item(w2, default="нет данных").capitalize()
 
         msg = (
             f"<b>Сравнение городов</b>\n\n"
@@ -480,56 +560,16 @@ class TelegramWeatherBot:
         self.bot.send_message(chat_id, msg)
 
     def _handle_extended_by_city(self, message: types.Message, city: str) -> None:
-        self.bot.send_chat_action(message.chat.id, "typing")
+        self._typing(message.chat.id)
         coords = self.weather.get_coordinates(city)
         if not coords:
-            self.bot.send_message(message.chat.id, "Город не найден.")
+            self.bot.send_message(message.chat.id, self.weather.last_error or "Город не найден.")
             return
         self._send_extended_data(message.chat.id, coords[0], coords[1], city=city)
         self.user_states[message.from_user.id] = {}
 
-    def _evaluate_air_component(self, component: str, value: float) -> tuple[str, str]:
-        """
-        Оценивает компонент качества воздуха.
-        Возвращает кортеж (оценка, описание).
-        Оценки: "✅ Норма", "⚠️ Умеренно", "❌ Плохо"
-        """
-        if component == "pm2_5":
-            if value < 12:
-                return "✅ Норма", "в пределах нормы ВОЗ"
-            elif value < 35:
-                return "⚠️ Умеренно", "превышение нормы"
-            else:
-                return "❌ Плохо", "значительное превышение нормы"
-        
-        elif component == "pm10":
-            if value < 20:
-                return "✅ Норма", "в пределах нормы ВОЗ"
-            elif value < 50:
-                return "⚠️ Умеренно", "превышение нормы"
-            else:
-                return "❌ Плохо", "значительное превышение нормы"
-        
-        elif component == "no2":
-            if value < 40:
-                return "✅ Норма", "в пределах нормы"
-            elif value < 100:
-                return "⚠️ Умеренно", "превышение нормы"
-            else:
-                return "❌ Плохо", "значительное превышение нормы"
-        
-        elif component == "o3":
-            if value < 60:
-                return "✅ Норма", "в пределах нормы"
-            elif value < 120:
-                return "⚠️ Умеренно", "превышение нормы"
-            else:
-                return "❌ Плохо", "значительное превышение нормы"
-        
-        return "—", "нет данных"
-
     def _send_extended_data(self, chat_id: int, lat: float, lon: float, city: str | None = None) -> None:
-        self.bot.send_chat_action(chat_id, "typing")
+        self._typing(chat_id)
         weather = self.weather.get_current_weather(lat, lon)
         air = self.weather.get_air_pollution(lat, lon)
         if not weather:
@@ -539,8 +579,7 @@ class TelegramWeatherBot:
         analysis = self.air_analyzer.analyze_air_pollution(air, extended=True)
         city_name = city or weather.get("name", "Неизвестный город")
         temp = weather.get("main", {}).get("temp", "—")
-        raw_desc = weather.get("weather", [{}])[0].get("description") or "нет описания"
-        desc = self._translate_weather_description(raw_desc).capitalize()
+        desc = describe_item(weather).capitalize()
 
         details = analysis.get("details", {})
         
@@ -552,16 +591,16 @@ class TelegramWeatherBot:
             no2 = float(details.get('no2', 0))
             o3 = float(details.get('o3', 0))
             
-            eval_pm25, _ = self._evaluate_air_component("pm2_5", pm25)
+            eval_pm25, _ = grade_component("pm2_5", pm25)
             air_details_lines.append(f"• Мелкие частицы PM2.5: {pm25:.2f} мкг/м³ - {eval_pm25}")
             
-            eval_pm10, _ = self._evaluate_air_component("pm10", pm10)
+            eval_pm10, _ = grade_component("pm10", pm10)
             air_details_lines.append(f"• Крупные частицы PM10: {pm10:.2f} мкг/м³ - {eval_pm10}")
             
-            eval_no2, _ = self._evaluate_air_component("no2", no2)
+            eval_no2, _ = grade_component("no2", no2)
             air_details_lines.append(f"• Диоксид азота (NO₂): {no2:.2f} мкг/м³ - {eval_no2}")
             
-            eval_o3, _ = self._evaluate_air_component("o3", o3)
+            eval_o3, _ = grade_component("o3", o3)
             air_details_lines.append(f"• Озон (O₃): {o3:.2f} мкг/м³ - {eval_o3}")
         
         air_details_str = "\n".join(air_details_lines) if air_details_lines else "Данные о компонентах недоступны"
@@ -583,17 +622,26 @@ class TelegramWeatherBot:
         notifications = user_data.get("notifications") or {}
         enabled = bool(notifications.get("enabled", False))
         interval_h = int(notifications.get("interval_h", self.default_interval_h))
+        on_changes = notifications.get("mode") == "changes"
 
         markup = types.InlineKeyboardMarkup(row_width=2)
         toggle_text = "Выключить" if enabled else "Включить"
         markup.add(types.InlineKeyboardButton(toggle_text, callback_data="notif_toggle"))
-        for h in [1, 2, 3, 6]:
-            markup.add(types.InlineKeyboardButton(f"{h} ч", callback_data=f"notif_interval|{h}"))
+        if on_changes:
+            markup.add(types.InlineKeyboardButton("Присылать по расписанию", callback_data="notif_mode|interval"))
+        else:
+            markup.add(types.InlineKeyboardButton("Только при изменениях", callback_data="notif_mode|changes"))
+            for h in [1, 2, 3, 6]:
+                markup.add(types.InlineKeyboardButton(f"{h} ч", callback_data=f"notif_interval|{h}"))
 
+        if on_changes:
+            schedule = "Режим: при изменениях (осадки, резкая смена температуры, качество воздуха)"
+        else:
+            schedule = f"Интервал: {interval_h} ч"
         text = (
             "<b>Уведомления</b>\n"
             f"Статус: {'включены' if enabled else 'выключены'}\n"
-            f"Интервал: {interval_h} ч"
+            f"{schedule}"
         )
         self.bot.send_message(chat_id, text, reply_markup=markup)
 
@@ -604,29 +652,36 @@ class TelegramWeatherBot:
 
         if data.startswith("forecast_day|"):
             day = data.split("|", 1)[1]
-            self.bot.answer_callback_query(call.id, "Загружаю прогноз...")
+            self._ack(call.id, "Загружаю прогноз...")
             self._send_forecast_day(chat_id, user_id, day)
             return
 
         if data == "forecast_back":
+            self._ack(call.id)
             self._send_main_menu(chat_id, "Возвращаю в главное меню.")
-            self.bot.answer_callback_query(call.id)
             return
 
         if data == "notif_toggle":
+            self._ack(call.id, "Статус уведомлений изменен.")
             self._toggle_notifications(user_id)
             self._show_notifications_menu(chat_id, user_id)
-            self.bot.answer_callback_query(call.id, "Статус уведомлений изменен.")
             return
 
         if data.startswith("notif_interval|"):
             interval = int(data.split("|", 1)[1])
+            self._ack(call.id, "Интервал обновлен.")
             self._set_notification_interval(user_id, interval)
             self._show_notifications_menu(chat_id, user_id)
-            self.bot.answer_callback_query(call.id, "Интервал обновлен.")
             return
 
-        self.bot.answer_callback_query(call.id)
+        if data.startswith("notif_mode|"):
+            mode = data.split("|", 1)[1]
+            self._ack(call.id, "Режим уведомлений изменен.")
+            self._set_notification_mode(user_id, chat_id, mode)
+            self._show_notifications_menu(chat_id, user_id)
+            return
+
+        self._ack(call.id)
 
     def _handle_inline_query(self, query: types.InlineQuery) -> None:
         """Обработчик inline-запросов для поиска погоды по городу."""
@@ -648,6 +703,18 @@ class TelegramWeatherBot:
                 self.bot.answer_inline_query(query.id, results, cache_time=1)
                 return
             
+            # Подсказки по префиксу из офлайн-справочника: без запросов геокодинга на каждую букву
+            gazetteer = self.weather.gazetteer
+            if gazetteer is not None and self.inline_suggestions > 0:
+                results = []
+                for city in gazetteer.suggest(query_text, limit=self.inline_suggestions):
+                    weather = self.weather.get_current_weather(city.lat, city.lon)
+                    if weather:
+                        results.append(self._inline_weather_result(city.name, city.lat, city.lon, weather))
+                if results:
+                    self.bot.answer_inline_query(query.id, results, cache_time=300)
+                    return
+
             # Ищем координаты города
             coords = self.weather.get_coordinates(query_text, limit=1)
             
@@ -684,36 +751,8 @@ class TelegramWeatherBot:
                 self.bot.answer_inline_query(query.id, results, cache_time=1)
                 return
             
-            # Формируем карточку с погодой
             city_name = weather.get("name", query_text)
-            main = weather.get("main", {})
-            weather_meta = weather.get("weather", [{}])
-            raw_desc = weather_meta[0].get("description") or "нет описания"
-            description = self._translate_weather_description(raw_desc).capitalize()
-            temp = main.get("temp", "—")
-            
-            # Формируем текст сообщения
-            message_text = (
-                f"<b>Погода в {city_name}</b>\n"
-                f"🌡 {temp}°C\n"
-                f"☁️ {description}"
-            )
-            
-            # Создаем результат inline-запроса
-            # ID должен быть уникальным строковым идентификатором (до 64 символов)
-            result_id = f"weather_{city_name}_{lat:.2f}_{lon:.2f}".replace(" ", "_")[:64]
-            results = [
-                types.InlineQueryResultArticle(
-                    id=result_id,
-                    title=f"Погода в {city_name}",
-                    description=f"{temp}°C, {description}",
-                    input_message_content=types.InputTextMessageContent(
-                        message_text=message_text,
-                        parse_mode="HTML",
-                    ),
-                )
-            ]
-            
+            results = [self._inline_weather_result(city_name, lat, lon, weather)]
             self.bot.answer_inline_query(query.id, results, cache_time=300)
         except Exception as e:
             # В случае ошибки отправляем сообщение об ошибке
@@ -732,8 +771,38 @@ class TelegramWeatherBot:
             except:
                 pass  # Если даже это не сработало, просто игнорируем
 
+    def _inline_weather_result(
+        self,
+        city_name: str,
+        lat: float,
+        lon: float,
+        weather: dict[str, Any],
+    ) -> types.InlineQueryResultArticle:
+        """Карточка inline-результата с текущей погодой."""
+        main = weather.get("main", {})
+        description = describe_item(weather).capitalize()
+        temp = main.get("temp", "—")
+
+        # Формируем текст сообщения
+        message_text = (
+            f"<b>Погода в {city_name}</b>\n"
+            f"🌡 {temp}°C\n"
+            f"☁️ {description}"
+        )
+
+        # ID должен быть уникальным строковым идентификатором (до 64 символов)
+        result_id = f"weather_{city_name}_{lat:.2f}_{lon:.2f}".replace(" ", "_")[:64]
+        return types.InlineQueryResultArticle(
+            id=result_id,
+            title=f"Погода в {city_name}",
+            description=f"{temp}°C, {description}",
+            input_message_content=types.InputTextMessageContent(
+                message_text=message_text,
+                parse_mode="HTML",
+            ),
+        )
+
     def _send_forecast_day(self, chat_id: int, user_id: int, day: str) -> None:
-        self.bot.send_chat_action(chat_id, "typing")
         grouped = self.forecast_cache.get(user_id, {})
         items = grouped.get(day, [])
         if not items:
@@ -745,17 +814,20 @@ class TelegramWeatherBot:
             dt_txt = item.get("dt_txt", "")
             time_str = dt_txt.split(" ")[1][:5] if " " in str(dt_txt) else "??:??"
             temp = item.get("main", {}).get("temp", "—")
-            weather_list = item.get("weather", [{}])
-            weather_code = weather_list[0].get("id", 800) if weather_list else 800
-            raw_desc = weather_list[0].get("description", "нет описания") if weather_list else "нет описания"
-            desc = self._translate_weather_description(raw_desc).capitalize()
-            emoji = self._get_weather_emoji(weather_code)
+            desc = describe_item(item).capitalize()
+            emoji = weather_emoji(condition_code(item))
             lines.append(f"{emoji} {time_str}: {temp}°C - {desc}")
 
         markup = types.InlineKeyboardMarkup()
         markup.add(types.InlineKeyboardButton("Назад", callback_data="forecast_back"))
         self.bot.send_message(chat_id, "\n".join(lines), reply_markup=markup)
 
+    @staticmethod
+    def _user_locality(user_data: dict[str, Any]) -> str | None:
+        """Название места пользователя: введённый город или результат обратного геокодинга."""
+        place = user_data.get("place")
+        return user_data.get("city") or (place.get("name") if isinstance(place, dict) else None)
+
     def _toggle_notifications(self, user_id: int) -> None:
         user_data = self.storage.load_user(user_id)
         notif = user_data.get("notifications", {})
@@ -773,11 +845,24 @@ class TelegramWeatherBot:
         user_data["notifications"] = notif
         self.storage.save_user(user_id, user_data)
 
+    def _set_notification_mode(self, user_id: int, chat_id: int, mode: str) -> None:
+        user_data = self.storage.load_user(user_id)
+        notif = user_data.get("notifications", {})
+        notif["enabled"] = bool(notif.get("enabled", False))
+        notif["mode"] = "changes" if mode == "changes" else "interval"
+        # Фоновая проверка изменений пишет без входящего сообщения: ей нужен чат.
+        notif["chat_id"] = chat_id
+        user_data["notifications"] = notif
+        self.storage.save_user(user_id, user_data)
+
     def _check_notifications(self, user_id: int, chat_id: int) -> None:
         user_data = self.storage.load_user(user_id)
         notif = user_data.get("notifications", {})
         if not bool(notif.get("enabled", False)):
             return
+        if notif.get("mode") == "changes":
+            # Этих подписчиков обслуживает ChangeNotifier (alerts.py).
+            return
 
         interval_h = int(notif.get("interval_h", self.default_interval_h))
         last_sent = float(notif.get("last_sent_ts", 0))
@@ -794,15 +879,15 @@ class TelegramWeatherBot:
         if not weather:
             return
 
-        city = user_data.get("city") or weather.get("name", "вашей локации")
+        city = self._user_locality(user_data) or weather.get("name", "вашей локации")
         temp = weather.get("main", {}).get("temp", "—")
-        raw_desc = weather.get("weather", [{}])[0].get("description", "нет описания")
-        desc = self._translate_weather_description(raw_desc).capitalize()
+        desc = describe_item(weather).capitalize()
         self.bot.send_message(
             chat_id,
             f"🔔 Напоминание о погоде: {city}\n"
             f"Сейчас {temp}°C, {desc}",
         )
+        metrics.inc("notifications_sent_total", mode="interval", status="ok")
 
         notif["last_sent_ts"] = now
         user_data["notifications"] = notif
@@ -0,0 +1,184 @@
+"""
+Офлайн-справочник городов для геокодинга и подсказок inline-режима.
+
+Данные — ``geodata/cities.tsv`` (name_ru, name_en, country, lat, lon, population, aliases).
+Файл отображается в память (mmap); при загрузке строится отсортированный
+список нормализованных ключей (русское и английское название, алиасы,
+транслитерация) со ссылками на смещения записей. Точный поиск и поиск по
+префиксу — бинарный (bisect), записи декодируются из mmap только для
+найденных городов. Промах — повод идти в OpenWeather Geocoding API.
+"""
+from __future__ import annotations
+
+import mmap
+import os
+import re
+from array import array
+from bisect import bisect_left
+from pathlib import Path
+from threading import Lock
+from typing import NamedTuple
+
+DEFAULT_PATH = Path(__file__).resolve().parent / "geodata" / "cities.tsv"
+
+_TRANSLIT = {
+    "а": "a", "б": "b", "в": "v", "г": "g", "д": "d", "е": "e", "ё": "e", "ж": "zh",
+    "з": "z", "и": "i", "й": "y", "к": "k", "л": "l", "м": "m", "н": "n", "о": "o",
+    "п": "p", "р": "r", "с": "s", "т": "t", "у": "u", "ф": "f", "х": "kh", "ц": "ts",
+    "ч": "ch", "ш": "sh", "щ": "shch", "ъ": "", "ы": "y", "ь": "", "э": "e", "ю": "yu",
+    "я": "ya",
+}
+_TRANSLIT_TABLE = str.maketrans(_TRANSLIT)
+_NON_WORD = re.compile(r"[\W_]+", re.UNICODE)
+
+
+def normalize_name(text: str) -> str:
+    """Ключ для сравнения названий: регистр, ё/е, пунктуация и лишние пробелы не важны."""
+    folded = text.casefold().replace("ё", "е")
+    return " ".join(_NON_WORD.sub(" ", folded).split())
+
+
+def split_query(text: str) -> tuple[str, str | None]:
+    """Нормализованное название и (необязательный) код страны из "Город, RU"."""
+    name, _, country = text.partition(",")
+    return normalize_name(name), country.strip().upper() or None
+
+
+def transliterate(text: str) -> str:
+    """Кириллица -> латиница (упрощённая схема, достаточная для поиска)."""
+    return text.translate(_TRANSLIT_TABLE)
+
+
+class City(NamedTuple):
+    name: str
+    name_en: str
+    country: str
+    lat: float
+    lon: float
+    population: int
+
+
+class Gazetteer:
+    """Sorted, memory-mapped city index with exact and prefix lookup."""
+
+    def __init__(self, path: str | Path = DEFAULT_PATH) -> None:
+        self.path = Path(path)
+        self._file = open(self.path, "rb")
+        self._mm = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        self._offsets = array("Q")
+        self._population = array("Q")
+        entries: list[tuple[str, int]] = []
+
+        self._mm.readline()  # заголовок
+        while True:
+            offset = self._mm.tell()
+            line = self._mm.readline()
+            if not line:
+                break
+            fields = line.decode("utf-8").rstrip("\r\n").split("\t")
+            if len(fields) < 6:
+                continue
+            idx = len(self._offsets)
+            self._offsets.append(offset)
+            self._population.append(int(fields[5] or 0))
+            names = [fields[0], fields[1]]
+            if len(fields) > 6 and fields[6]:
+                names.extend(fields[6].split("|"))
+            keys = set()
+            for name in names:
+                key = normalize_name(name)
+                if key:
+                    keys.add(key)
+                    keys.add(transliterate(key))
+            entries.extend((key, idx) for key in keys)
+
+        entries.sort()
+        self._keys = [key for key, _ in entries]
+        self._rows = array("I", (idx for _, idx in entries))
+
+    def __len__(self) -> int:
+        return len(self._offsets)
+
+    def _record(self, idx: int) -> City:
+        # Срез mmap, а не seek/readline: не трогает общую позицию, безопасно из разных потоков.
+        start = self._offsets[idx]
+        end = self._mm.find(b"\n", start)
+        raw = self._mm[start:end if end != -1 else len(self._mm)]
+        fields = raw.decode("utf-8").rstrip("\r").split("\t")
+        return City(
+            name=fields[0],
+            name_en=fields[1],
+            country=fields[2],
+            lat=float(fields[3]),
+            lon=float(fields[4]),
+            population=int(fields[5] or 0),
+        )
+
+    def lookup(self, text: str) -> City | None:
+        """Точное совпадение названия (самый населённый город, если их несколько)."""
+        key, country = split_query(text)
+        if not key:
+            return None
+        best: City | None = None
+        for candidate in {key, transliterate(key)}:
+            pos = bisect_left(self._keys, candidate)
+            while pos < len(self._keys) and self._keys[pos] == candidate:
+                city = self._record(self._rows[pos])
+                pos += 1
+                if country and city.country != country:
+                    continue
+                if best is None or city.population > best.population:
+                    best = city
+        return best
+
+    def suggest(self, prefix: str, limit: int = 5) -> list[City]:
+        """До ``limit`` городов, название которых начинается с ``prefix``, по убыванию населения."""
+        key, country = split_query(prefix)
+        if not key or limit <= 0:
+            return []
+        found: set[int] = set()
+        for candidate in {key, transliterate(key)}:
+            pos = bisect_left(self._keys, candidate)
+            while pos < len(self._keys) and self._keys[pos].startswith(candidate):
+                found.add(self._rows[pos])
+                pos += 1
+        ranked = sorted(found, key=lambda i: self._population[i], reverse=True)
+        cities: list[City] = []
+        for idx in ranked:
+            city = self._record(idx)
+            if country and city.country != country:
+                continue
+            cities.append(city)
+            if len(cities) >= limit:
+                break
+        return cities
+
+    def close(self) -> None:
+        self._mm.close()
+        self._file.close()
+
+
+_default: Gazetteer | None = None
+_default_loaded = False
+_default_lock = Lock()
+
+
+def get_gazetteer() -> Gazetteer | None:
+    """Общий справочник процесса; None, если отключён (GAZETTEER_PATH=off) или файла нет."""
+    global _default, _default_loaded
+    if _default_loaded:
+        return _default
+    with _default_lock:
+        if not _default_loaded:
+            raw_path = os.getenv("GAZETTEER_PATH", "").strip()
+            if raw_path.lower() in ("0", "off", "false", "no"):
+                _default = None
+            else:
+                path = Path(raw_path) if raw_path else DEFAULT_PATH
+                try:
+                    _default = Gazetteer(path)
+                except (OSError, ValueError):
+                    # Без справочника всё работает через OpenWeather Geocoding API.
+                    _default = None
+            _default_loaded = True
+    return _default
@@ -0,0 +1,26 @@
+"""
+Конфиг gunicorn для miniapp_api.
+
+По умолчанию — потоковые воркеры (gthread): медленный ответ OpenWeather или
+пауза после 429 в WeatherClient._request_json блокирует только один поток,
+остальные пользователи Mini App обслуживаются параллельно.
+
+Переменные окружения:
+    GUNICORN_BIND          адрес (по умолчанию 0.0.0.0:5000)
+    GUNICORN_WORKERS       процессов (по умолчанию 2)
+    GUNICORN_THREADS       потоков на процесс для gthread (по умолчанию 32)
+    GUNICORN_WORKER_CLASS  gthread | gevent | sync (по умолчанию gthread;
+                           gevent требует pip install gevent)
+    GUNICORN_TIMEOUT       таймаут запроса, с (по умолчанию 30)
+"""
+import os
+
+bind = os.getenv("GUNICORN_BIND", "0.0.0.0:5000")
+workers = int(os.getenv("GUNICORN_WORKERS", "2"))
+worker_class = os.getenv("GUNICORN_WORKER_CLASS", "gthread")
+threads = int(os.getenv("GUNICORN_THREADS", "32"))
+# Для gevent: сколько одновременных соединений держит один воркер.
+worker_connections = int(os.getenv("GUNICORN_WORKER_CONNECTIONS", "500"))
+timeout = int(os.getenv("GUNICORN_TIMEOUT", "30"))
+graceful_timeout = 10
+keepalive = 5
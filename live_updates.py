@@ -0,0 +1,177 @@
+"""
+Живые обновления Mini App по Server-Sent Events: одна загрузка — всем зрителям точки.
+
+Клиенты подписываются на бакет локации. Один фоновый поток на процесс раз в
+``poll_s`` проходит по бакетам, у которых есть зрители, и спрашивает ``fetch``
+(в API — кэш OpenWeather и кэш рендера) текущую версию данных. Запись кэша
+общая для всех воркеров и прогрева, поэтому обновление, сделанное кем угодно,
+замечается за один проход; истёкшую запись обновляет сам проход — один запрос в
+OpenWeather на точку, сколько бы зрителей у неё ни было. Новая версия
+публикуется один раз, и все ожидающие потоки отдают один и тот же готовый JSON.
+
+Число соединений на процесс ограничено ``max_connections``: в gthread-воркере
+каждое открытое соединение держит поток.
+"""
+from __future__ import annotations
+
+import threading
+from typing import Any, Callable, Hashable, Iterator
+
+from weather_app import metrics
+
+metrics.describe("sse_connections", "Open Server-Sent Events connections in this process")
+metrics.describe("sse_rejected_total", "SSE subscriptions refused because the connection limit was reached")
+metrics.describe("sse_events_total", "Payloads published to SSE subscribers (once per bucket update)")
+
+# fetch(lat, lon) -> (версия, готовое тело) или None, если данных нет.
+Fetch = Callable[[float, float], "tuple[Hashable, bytes] | None"]
+
+
+class _Channel:
+    __slots__ = ("coords", "subscribers", "version", "payload", "changed")
+
+    def __init__(self, coords: tuple[float, float], lock: threading.Lock) -> None:
+        self.coords = coords
+        self.subscribers = 0
+        self.version: Hashable | None = None
+        self.payload: bytes | None = None
+        self.changed = threading.Condition(lock)
+
+
+class LiveUpdates:
+    """Per-process fan-out of fresh payloads to SSE subscribers, one poller for all buckets."""
+
+    def __init__(self, fetch: Fetch, poll_s: float = 5.0, max_connections: int = 16, heartbeat_s: float = 15.0) -> None:
+        self.fetch = fetch
+        self.poll_s = max(poll_s, 0.5)
+        self.max_connections = max_connections
+        # Комментарий-пинг не даёт прокси закрыть тихое соединение и выявляет ушедших клиентов.
+        self.heartbeat_s = heartbeat_s
+        self._lock = threading.Lock()
+        self._channels: dict[str, _Channel] = {}
+        self._connections = 0
+        self._thread: threading.Thread | None = None
+        self._stop = threading.Event()
+        self.published = 0
+        self.rejected = 0
+
+    def subscribe(self, bucket: str, coords: tuple[float, float], version: Hashable, payload: bytes) -> bool:
+        """Занять соединение; False — лимит процесса исчерпан."""
+        with self._lock:
+            if self._connections >= self.max_connections:
+                self.rejected += 1
+                metrics.inc("sse_rejected_total")
+                return False
+            self._connections += 1
+            channel = self._channels.get(bucket)
+            if channel is None:
+                channel = self._channels[bucket] = _Channel(coords, self._lock)
+            channel.subscribers += 1
+            if channel.version != version:
+                # Данные нового подписчика только что прочитаны — они не старее тех, что у канала.
+                channel.version, channel.payload = version, payload
+                channel.changed.notify_all()
+            metrics.set_gauge("sse_connections", self._connections)
+        self._ensure_poller()
+        return True
+
+    def unsubscribe(self, bucket: str) -> None:
+        with self._lock:
+            self._connections -= 1
+            channel = self._channels.get(bucket)
+            if channel is not None:
+                channel.subscribers -= 1
+                if channel.subscribers <= 0:
+                    del self._channels[bucket]
+            metrics.set_gauge("sse_connections", self._connections)
+
+    def wait(self, bucket: str, seen: Hashable | None) -> tuple[Hashable, bytes] | None:
+        """Дождаться версии новее seen (не дольше heartbeat_s); None — пора слать пинг."""
+        with self._lock:
+            channel = self._channels.get(bucket)
+            if channel is None:
+                return None
+            channel.changed.wait_for(lambda: channel.version != seen, timeout=self.heartbeat_s)
+            if channel.version == seen or channel.payload is None:
+                return None
+            return channel.version, channel.payload
+
+    def publish(self, bucket: str, version: Hashable, payload: bytes) -> None:
+        with self._lock:
+            channel = self._channels.get(bucket)
+            if channel is None or channel.version == version:
+                return
+            channel.version, channel.payload = version, payload
+            channel.changed.notify_all()
+        self.published += 1
+        metrics.inc("sse_events_total")
+
+    def poll_once(self) -> int:
+        """Проверить все бакеты со зрителями; возвращает число опубликованных обновлений."""
+        with self._lock:
+            targets = [(bucket, channel.coords, channel.version) for bucket, channel in self._channels.items()]
+        published = 0
+        for bucket, (lat, lon), version in targets:
+            if self._stop.is_set():
+                break
+            fetched = self.fetch(lat, lon)
+            if fetched is not None and fetched[0] != version:
+                self.publish(bucket, *fetched)
+                published += 1
+        return published
+
+    def _loop(self) -> None:
+        while not self._stop.wait(self.poll_s):
+            try:
+                self.poll_once()
+            except Exception:
+                pass
+
+    def _ensure_poller(self) -> None:
+        if self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._loop, name="sse-poller", daemon=True)
+                self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+
+    def stats(self) -> dict[str, Any]:
+        with self._lock:
+            return {
+                "connections": self._connections,
+                "max_connections": self.max_connections,
+                "buckets": len(self._channels),
+                "published": self.published,
+                "rejected": self.rejected,
+            }
+
+
+def format_event(event: str, payload: bytes, event_id: str | None = None) -> bytes:
+    """Кадр SSE: каждая строка данных — отдельное поле ``data:``."""
+    head = f"event: {event}\n" + (f"id: {event_id}\n" if event_id else "")
+    return head.encode("utf-8") + b"".join(b"data: " + line + b"\n" for line in payload.split(b"\n")) + b"\n"
+
+
+def stream_events(
+    hub: LiveUpdates, bucket: str, version: Hashable, payload: bytes | None, event_id: Callable[[Hashable], str | None]
+) -> Iterator[bytes]:
+    """Поток кадров одного соединения: текущие данные (если клиент их не видел), затем обновления и пинги.
+
+    Соединение освобождает вызывающий (``hub.unsubscribe`` при закрытии ответа): генератор,
+    который так и не начали читать, свой finally не выполнит.
+    """
+    seen = version
+    # Клиент переподключается через 5 с после обрыва.
+    yield b"retry: 5000\n\n"
+    if payload is not None:
+        yield format_event("weather", payload, event_id(version))
+    while True:
+        update = hub.wait(bucket, seen)
+        if update is None:
+            yield b": ping\n\n"
+            continue
+        seen, body = update
+        yield format_event("weather", body, event_id(seen))
@@ -14,6 +14,10 @@
     const searchForm = document.getElementById("search-form");
     const cityInput = document.getElementById("city-input");
     const bgLayer = document.getElementById("bg-layer");
+    // Живые обновления: EventSource на /api/weather/stream; без него — редкие повторные запросы.
+    var stream = null;
+    var pollTimer = null;
+    var shownCode = null;
 
     function getQuery() {
         const params = new URLSearchParams(window.location.search);
@@ -32,6 +36,11 @@
         return base + "?city=Москва";
     }
 
+    function buildStreamUrl(etag) {
+        var url = buildApiUrl().replace("/api/weather?", "/api/weather/stream?");
+        return etag ? url + "&since=" + encodeURIComponent(etag) : url;
+    }
+
     function setWeatherTheme(code) {
         document.body.classList.remove(
             "weather-clear", "weather-clouds", "weather-rain", "weather-drizzle",
@@ -238,7 +247,11 @@
         weatherEl.hidden = false;
 
         var code = data.weatherCode != null ? data.weatherCode : 800;
-        runAnimation(code);
+        // Обновление с теми же условиями не перезапускает анимацию фона.
+        if (code !== shownCode) {
+            runAnimation(code);
+            shownCode = code;
+        }
 
         cityNameEl.textContent = data.city || "—";
 
@@ -273,9 +286,8 @@
         if (q.city) cityInput.value = q.city;
     }
 
-    function load() {
-        showLoading();
-        fetch(buildApiUrl())
+    function fetchWeather() {
+        return fetch(buildApiUrl())
             .then(function (r) {
                 return r.text().then(function (text) {
                     if (!r.ok) {
@@ -293,12 +305,59 @@
                         }
                         throw new Error("Неверный ответ сервера.");
                     }
-                    return data;
+                    if (data.error) throw new Error(data.error);
+                    // nginx при сжатии делает ETag слабым (W/"...").
+                    var etag = (r.headers.get("ETag") || "").replace(/^W\//, "").replace(/"/g, "");
+                    return { data: data, etag: etag };
                 });
+            });
+    }
+
+    function refresh() {
+        fetchWeather()
+            .then(function (res) {
+                showWeather(res.data);
             })
-            .then(function (data) {
-                if (data.error) throw new Error(data.error);
-                showWeather(data);
+            .catch(function () {
+                // Фоновое обновление: на экране остаются прежние данные.
+            });
+    }
+
+    function startPolling() {
+        if (!pollTimer) pollTimer = setInterval(refresh, 10 * 60 * 1000);
+    }
+
+    function subscribe(etag) {
+        if (!window.EventSource) {
+            startPolling();
+            return;
+        }
+        if (stream) return;
+        stream = new EventSource(buildStreamUrl(etag));
+        stream.addEventListener("weather", function (e) {
+            var data;
+            try {
+                data = JSON.parse(e.data);
+            } catch (err) {
+                return;
+            }
+            if (!data.error) showWeather(data);
+        });
+        stream.onerror = function () {
+            // Обрыв — браузер переподключится сам; отказ сервера (лимит подключений) закрывает поток.
+            if (stream.readyState === EventSource.CLOSED) {
+                stream = null;
+                startPolling();
+            }
+        };
+    }
+
+    function load() {
+        showLoading();
+        fetchWeather()
+            .then(function (res) {
+                showWeather(res.data);
+                subscribe(res.etag);
             })
             .catch(function (err) {
                 showError(err.message || "Не удалось загрузить погоду.");
@@ -1,23 +1,126 @@
 """
 Минимальный API для Mini App: погода по city или lat/lon.
-Запуск: gunicorn -w 1 -b 0.0.0.0:5000 miniapp_api:app
+Запуск: gunicorn -c gunicorn.conf.py miniapp_api:app
+(потоковые воркеры gthread; модуль потокобезопасен — см. gunicorn.conf.py)
 """
 from __future__ import annotations
 
+import gzip
+import hashlib
 import os
-from datetime import datetime
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+from threading import Lock
 from typing import Any
 
 from dotenv import load_dotenv
 from flask import Flask, jsonify, request
 
-from weather_app import WeatherClient
-
-load_dotenv()
+import profiling
+from gazetteer import split_query
+from live_updates import LiveUpdates, stream_events
+from render_cache import RenderCache
+from renderer import condition_code, describe_item, group_by_day, summarize_day
+from warmup import CacheWarmer, start_cache_warmer
+from weather_app import WeatherClient, location_bucket, metrics
 
 app = Flask(__name__)
 
+# Состояние процесса создаётся при первом обращении, а не при импорте: импорт модуля
+# (gunicorn, бенчмарки, тесты) не читает .env, не заводит пулы и не пишет файлов.
+_state_lock = Lock()
+_settings: dict[str, Any] | None = None
 _weather_client: WeatherClient | None = None
+_weather_client_lock = Lock()
+# Упреждающее обновление популярных точек (один воркер обновляет, остальные передают счётчики).
+_cache_warmer: CacheWarmer | None = None
+# Готовые JSON-ответы /api/weather, общие для всех пользователей одной локации.
+_render_cache: RenderCache | None = None
+# Загрузки локаций /api/weather/batch.
+_batch_executor: ThreadPoolExecutor | None = None
+# Живые обновления /api/weather/stream.
+_live_updates: LiveUpdates | None = None
+
+
+def _get_settings() -> dict[str, Any]:
+    """Настройки API из окружения; первый вызов загружает .env и включает профилирование, если задано."""
+    global _settings
+    if _settings is not None:
+        return _settings
+    with _state_lock:
+        if _settings is None:
+            load_dotenv()
+            profiling.configure_from_env()
+            _settings = {
+                # Сжатие ответов /api/weather (если nginx не сжимает сам).
+                "compress": os.getenv("API_GZIP", "1").strip() not in ("", "0", "false", "no"),
+                "compress_min_bytes": int(os.getenv("API_GZIP_MIN_BYTES", "512")),
+                # Ограничения /api/weather/batch: число локаций, дедлайн.
+                "batch_max_items": int(os.getenv("BATCH_MAX_ITEMS", "10")),
+                "batch_deadline_s": float(os.getenv("BATCH_DEADLINE_S", "6")),
+            }
+    return _settings
+
+
+def _get_render_cache() -> RenderCache:
+    global _render_cache
+    if _render_cache is None:
+        _get_settings()
+        with _state_lock:
+            if _render_cache is None:
+                _render_cache = RenderCache(max_entries=int(os.getenv("RENDER_CACHE_SIZE", "512")))
+    return _render_cache
+
+
+def _get_batch_executor() -> ThreadPoolExecutor:
+    global _batch_executor
+    if _batch_executor is None:
+        _get_settings()
+        with _state_lock:
+            if _batch_executor is None:
+                # Параллельность запросов к OpenWeather на процесс.
+                _batch_executor = ThreadPoolExecutor(
+                    max_workers=int(os.getenv("BATCH_MAX_CONCURRENCY", "4")),
+                    thread_name_prefix="batch",
+                )
+    return _batch_executor
+
+
+def _get_live_updates() -> LiveUpdates:
+    global _live_updates
+    if _live_updates is None:
+        _get_settings()
+        with _state_lock:
+            if _live_updates is None:
+                # Соединение в gthread-воркере держит поток, поэтому лимит на процесс ниже
+                # GUNICORN_THREADS (для тысяч зрителей — воркеры gevent).
+                _live_updates = LiveUpdates(
+                    _live_payload,
+                    poll_s=float(os.getenv("SSE_POLL_S", "5")),
+                    max_connections=int(os.getenv("SSE_MAX_CONNECTIONS", "16")),
+                    heartbeat_s=float(os.getenv("SSE_HEARTBEAT_S", "15")),
+                )
+    return _live_updates
+
+
+@app.before_request
+def _start_timer() -> None:
+    # До трассы: PROFILE из .env действует уже с первого запроса.
+    _get_settings()
+    request.environ["app.started"] = time.perf_counter()
+    profiling.start_trace(f"api {request.path}")
+
+
+@app.after_request
+def _record_metrics(response):
+    started = request.environ.get("app.started")
+    # Шаблон маршрута, а не путь: метка не разрастается от параметров.
+    route = request.url_rule.rule if request.url_rule else "unmatched"
+    metrics.inc("api_requests_total", route=route, status=response.status_code)
+    if started is not None:
+        metrics.observe("api_request_seconds", time.perf_counter() - started, route=route)
+    profiling.finish_trace(status=response.status_code)
+    return response
 
 
 @app.errorhandler(500)
@@ -29,47 +132,29 @@ def handle_error(err):
 
 
 def get_weather_client() -> WeatherClient:
-    global _weather_client
-    if _weather_client is None:
-        api_key = os.getenv("OW_API_KEY", "").strip()
-        if not api_key:
-            raise ValueError("OW_API_KEY не задан")
-        _weather_client = WeatherClient(
-            api_key=api_key,
-            timeout=int(os.getenv("REQUEST_TIMEOUT", "8")),
-            cache_ttl_min=int(os.getenv("CACHE_TTL_MIN", "10")),
-        )
+    global _weather_client, _cache_warmer
+    if _weather_client is not None:
+        return _weather_client
+    with _weather_client_lock:
+        # Повторная проверка: клиент мог создать другой поток, пока мы ждали блокировку.
+        if _weather_client is None:
+            _get_settings()
+            if not os.getenv("OW_API_KEY", "").strip() and not os.getenv("OW_API_KEYS", "").strip(" ,"):
+                raise ValueError("OW_API_KEY не задан")
+            _weather_client = WeatherClient.from_env()
+            _cache_warmer = start_cache_warmer(_weather_client)
     return _weather_client
 
 
-def _weather_code_from_item(item: dict) -> int:
-    """Код погоды OpenWeather (для выбора анимации)."""
-    w = item.get("weather") or []
-    if w and isinstance(w[0], dict):
-        return int(w[0].get("id", 800))
-    return 800
-
-
 def _summarize_day(day_items: list[dict]) -> dict[str, Any]:
     if not day_items:
         return {"temp_min": None, "temp_max": None, "description": "", "code": 800}
-    temps = []
-    codes = []
-    descs = []
-    for i in day_items:
-        m = i.get("main", {})
-        t = m.get("temp")
-        if t is not None:
-            temps.append(float(t))
-        w = i.get("weather") or []
-        if w and isinstance(w[0], dict):
-            codes.append(w[0].get("id", 800))
-            descs.append(w[0].get("description", ""))
+    summary = summarize_day(day_items)
     return {
-        "temp_min": min(temps) if temps else None,
-        "temp_max": max(temps) if temps else None,
-        "description": descs[0] if descs else "",
-        "code": codes[0] if codes else 800,
+        "temp_min": summary["temp_min"],
+        "temp_max": summary["temp_max"],
+        "description": summary["description"],
+        "code": summary["code"],
     }
 
 
@@ -87,35 +172,234 @@ def api_weather():
             coords = (float(lat_s), float(lon_s))
         except ValueError:
             pass
-    if not coords and city:
-        coords = client.get_coordinates(city, limit=1)
-    if not coords:
-        return jsonify({"error": "Укажите city или lat и lon"}), 400
+    # Геокодинг и погода делят один дедлайн: запрос не висит дольше REQUEST_DEADLINE_S.
+    with client.deadline(client.deadline_s):
+        if not coords and city:
+            coords = client.get_coordinates(city, limit=1)
+            if not coords and client.last_shed:
+                return _upstream_error(client, "Город не найден.")
+        if not coords:
+            return jsonify({"error": "Укажите city или lat и lon"}), 400
 
-    lat, lon = coords
+        lat, lon = coords
+        fetched = _fetch_weather(client, lat, lon)
+    if fetched is None:
+        return _upstream_error(client, "Не удалось получить погоду")
+    current, forecast_list, version = fetched
+
+    bucket = location_bucket(lat, lon)
+    etag = _weather_etag(bucket, version)
+    headers = {"Vary": "Accept-Encoding"}
+    if etag:
+        # Слабый ETag: gzip и несжатое тело — одни и те же данные, но не одни и те же байты.
+        headers["ETag"] = f'W/"{etag}"'
+        headers["Cache-Control"] = f"public, max-age={_max_age(client, version)}"
+        if request.if_none_match.contains_weak(etag):
+            # Данные не менялись: клиент/nginx переиспользуют свою копию.
+            return app.response_class(status=304, headers=headers)
+    else:
+        headers["Cache-Control"] = "no-cache"
+
+    body = _weather_body(bucket, version, current, forecast_list)
+    settings = _get_settings()
+    if settings["compress"] and len(body) >= settings["compress_min_bytes"] and "gzip" in request.accept_encodings:
+        body = _get_render_cache().get_or_render(
+            (bucket, "api_weather.gzip", "ru"),
+            version,
+            lambda: gzip.compress(body, compresslevel=6),
+        )
+        headers["Content-Encoding"] = "gzip"
+    return app.response_class(body, mimetype="application/json", headers=headers)
+
+
+def _upstream_error(client: WeatherClient, default: str):
+    """Ошибка OpenWeather для клиента: 503 — очередь к OpenWeather переполнена, 429 — исчерпана квота, иначе 502."""
+    headers = {}
+    if client.last_shed == "busy":
+        status = 503
+        headers["Retry-After"] = "1"
+    elif client.last_shed == "throttled":
+        status = 429
+        headers["Retry-After"] = str(int(client.keys.wait_s()) + 1)
+    else:
+        status = 502
+    return jsonify({"error": client.last_error or default}), status, headers
+
+
+def _fetch_weather(
+    client: WeatherClient,
+    lat: float,
+    lon: float,
+) -> tuple[dict[str, Any], list[dict], tuple] | None:
+    """Текущая погода + прогноз и их версии в кэше; None, если погоду получить не удалось."""
     current = client.get_current_weather(lat, lon)
     if not current:
-        return jsonify({"error": client.last_error or "Не удалось получить погоду"}), 502
-
+        return None
+    current_version = client.last_version
     forecast_list = client.get_forecast_5d3h(lat, lon)
+    return current, forecast_list, (current_version, client.last_version)
+
+
+def _weather_body(bucket: str, version: tuple, current: dict[str, Any], forecast_list: list[dict]) -> bytes:
+    """Сериализованный JSON ответа /api/weather (через кэш рендера)."""
+    return _get_render_cache().get_or_render(
+        (bucket, "api_weather", "ru"),
+        version,
+        lambda: app.json.dumps(_build_weather_payload(current, forecast_list)).encode("utf-8"),
+    )
+
+
+@app.route("/api/weather/batch", methods=["GET", "POST"])
+def api_weather_batch():
+    """
+    Погода для нескольких локаций за один запрос.
+    POST {"items": [{"city": "Москва"}, {"lat": 59.93, "lon": 30.31}]}
+    или GET ?city=Москва&city=Казань&point=59.93,30.31
+    Одинаковые города/близкие точки запрашиваются один раз, разные — параллельно.
+    """
+    items = _parse_batch_items()
+    if items is None:
+        return jsonify({"error": "Передайте items: [{city} | {lat, lon}]"}), 400
+    if not items:
+        return jsonify({"error": "Список локаций пуст"}), 400
+    settings = _get_settings()
+    if len(items) > settings["batch_max_items"]:
+        return jsonify({"error": f"Слишком много локаций, максимум {settings['batch_max_items']}"}), 400
+
+    client = get_weather_client()
+    # Дедупликация: нормализованный город или квантованная точка -> одна задача.
+    keys: list[str | None] = []
+    tasks: dict[str, tuple[str, Any]] = {}
+    for item in items:
+        key = _batch_key(item)
+        keys.append(key)
+        if key is not None and key not in tasks:
+            tasks[key] = item
+
+    deadline = time.monotonic() + settings["batch_deadline_s"]
+    executor = _get_batch_executor()
+    futures = {key: executor.submit(_batch_fetch, client, item, deadline) for key, item in tasks.items()}
+    wait(futures.values(), timeout=max(deadline - time.monotonic(), 0))
+
+    fragments: dict[str, bytes] = {}
+    for key, future in futures.items():
+        if not future.done():
+            fragments[key] = app.json.dumps({"error": "Превышено время ожидания"}).encode("utf-8")
+            continue
+        try:
+            fragments[key] = future.result()
+        except Exception as exc:  # ошибка одной локации не роняет весь ответ
+            fragments[key] = app.json.dumps({"error": str(exc) or "Ошибка сервера"}).encode("utf-8")
+
+    invalid = app.json.dumps({"error": "Укажите city или lat и lon"}).encode("utf-8")
+    # Тела берутся из кэша рендера уже сериализованными — склеиваем без повторного dumps.
+    parts = [
+        b'{"query":' + app.json.dumps(_batch_query(item)).encode("utf-8")
+        + b',"result":' + (fragments[key] if key is not None else invalid) + b"}"
+        for item, key in zip(items, keys)
+    ]
+    body = b'{"count":%d,"distinct":%d,"results":[' % (len(items), len(tasks)) + b",".join(parts) + b"]}"
+    return app.response_class(body, mimetype="application/json")
+
+
+def _parse_batch_items() -> list[tuple[str, Any]] | None:
+    """Элементы батча как ("city", str) / ("point", (lat, lon)) / ("invalid", raw)."""
+    raw_items: list[Any] = []
+    if request.method == "POST":
+        payload = request.get_json(silent=True)
+        if not isinstance(payload, dict) or not isinstance(payload.get("items"), list):
+            return None
+        raw_items = payload["items"]
+    else:
+        raw_items = [{"city": c} for c in request.args.getlist("city")]
+        for point in request.args.getlist("point"):
+            lat_s, _, lon_s = point.partition(",")
+            raw_items.append({"lat": lat_s, "lon": lon_s})
+
+    items: list[tuple[str, Any]] = []
+    for raw in raw_items:
+        if not isinstance(raw, dict):
+            items.append(("invalid", raw))
+            continue
+        lat_v, lon_v = raw.get("lat"), raw.get("lon")
+        if lat_v not in (None, "") and lon_v not in (None, ""):
+            try:
+                items.append(("point", (float(lat_v), float(lon_v))))
+                continue
+            except (TypeError, ValueError):
+                pass
+        city = str(raw.get("city") or "").strip()
+        items.append(("city", city) if city else ("invalid", raw))
+    return items
+
+
+def _batch_key(item: tuple[str, Any]) -> str | None:
+    kind, value = item
+    if kind == "point":
+        return "p:" + location_bucket(*value)
+    if kind == "city":
+        name, country = split_query(value)
+        return f"c:{name},{country}" if country else f"c:{name}"
+    return None
+
+
+def _batch_query(item: tuple[str, Any]) -> Any:
+    kind, value = item
+    if kind == "point":
+        return {"lat": value[0], "lon": value[1]}
+    if kind == "city":
+        return {"city": value}
+    return value
+
+
+def _batch_fetch(client: WeatherClient, item: tuple[str, Any], deadline: float) -> bytes:
+    # Дедлайн батча переходит в поток пула: задача не переживает ответ, которому она уже не нужна.
+    with client.deadline(deadline - time.monotonic()):
+        return _batch_fetch_item(client, item)
+
+
+def _batch_fetch_item(client: WeatherClient, item: tuple[str, Any]) -> bytes:
+    kind, value = item
+    if kind == "city":
+        coords = client.get_coordinates(value, limit=1)
+        if not coords:
+            return app.json.dumps({"error": client.last_error or "Город не найден."}).encode("utf-8")
+    else:
+        # Точки квантуются: соседние запросы попадают в одну запись кэша OpenWeather.
+        coords = tuple(float(c) for c in location_bucket(*value).split(","))
+    lat, lon = coords
+    fetched = _fetch_weather(client, lat, lon)
+    if fetched is None:
+        return app.json.dumps({"error": client.last_error or "Не удалось получить погоду"}).encode("utf-8")
+    current, forecast_list, version = fetched
+    return _weather_body(location_bucket(lat, lon), version, current, forecast_list)
+
+
+def _weather_etag(bucket: str, version: tuple) -> str | None:
+    """ETag из версии закэшированных данных OpenWeather (а не из тела ответа)."""
+    if not all(version):
+        return None
+    raw = repr((bucket, version)).encode("utf-8")
+    return hashlib.sha1(raw).hexdigest()[:20]
+
+
+def _max_age(client: WeatherClient, version: tuple) -> int:
+    """Сколько ещё живёт самая старая из использованных записей кэша."""
+    return int(min(client.cache.ttl_left(created_at) for _, created_at in version))
+
+
+def _build_weather_payload(current: dict[str, Any], forecast_list: list[dict]) -> dict[str, Any]:
     city_name = current.get("name", "")
 
     # Группировка по дням
-    by_day: dict[str, list[dict]] = {}
-    for item in forecast_list:
-        dt_txt = str(item.get("dt_txt", ""))
-        day = dt_txt.split(" ")[0] if " " in dt_txt else dt_txt[:10]
-        if day:
-            by_day.setdefault(day, []).append(item)
+    by_day = group_by_day(forecast_list)
 
     days_sorted = sorted(by_day.keys())
-    today = datetime.utcnow().strftime("%Y-%m-%d") if days_sorted else days_sorted[0]
     tomorrow = days_sorted[1] if len(days_sorted) > 1 else None
     next_3_days = days_sorted[1:4]
 
-    current_code = _weather_code_from_item(current)
-    current_weather = current.get("weather") or [{}]
-    current_desc = current_weather[0].get("description", "") if current_weather else ""
+    current_code = condition_code(current)
+    current_desc = describe_item(current, default="")
 
     tomorrow_summary = None
     if tomorrow and tomorrow in by_day:
@@ -132,7 +416,7 @@ def api_weather():
     main = current.get("main", {})
     wind = current.get("wind", {})
 
-    return jsonify({
+    return {
         "city": city_name,
         "current": {
             "temp": main.get("temp"),
@@ -145,9 +429,122 @@ def api_weather():
         "tomorrow": tomorrow_summary,
         "forecast": forecast_3,
         "weatherCode": current_code,
-    })
+    }
+
+
+def _live_payload(lat: float, lon: float) -> tuple[tuple, bytes] | None:
+    """Версия и готовое тело /api/weather для точки — из кэшей, при истёкшей записи один запрос в OpenWeather."""
+    client = get_weather_client()
+    # Опрос идёт каждые SSE_POLL_S: это не обращения пользователей, спрос и метрики кэша не трогает.
+    with client.deadline(client.deadline_s), client.background():
+        fetched = _fetch_weather(client, lat, lon)
+    if fetched is None:
+        return None
+    current, forecast_list, version = fetched
+    return version, _weather_body(location_bucket(lat, lon), version, current, forecast_list)
+
+
+@app.route("/api/weather/stream", methods=["GET"])
+def api_weather_stream():
+    """Server-Sent Events: данные /api/weather для бакета точки при каждом обновлении кэша."""
+    city = request.args.get("city", "").strip()
+    client = get_weather_client()
+    try:
+        coords = (float(request.args["lat"]), float(request.args["lon"]))
+    except (KeyError, ValueError):
+        coords = None
+    if not coords and city:
+        with client.deadline(client.deadline_s):
+            coords = client.get_coordinates(city, limit=1)
+    if not coords:
+        return jsonify({"error": "Укажите city или lat и lon"}), 400
+
+    # Те же координаты, что у /api/weather: та же запись кэша, версия и ETag. Бакет — только
+    # для раздачи: все зрители бакета смотрят одну запись (клиент спрашивает её центр).
+    bucket = location_bucket(*coords)
+    fetched = _live_payload(*coords)
+    if fetched is None:
+        return _upstream_error(client, "Не удалось получить погоду")
+    version, body = fetched
+    live_updates = _get_live_updates()
+    if not live_updates.subscribe(bucket, coords, version, body):
+        # Лимит соединений: клиент обновляет данные обычными запросами.
+        return jsonify({"error": "Слишком много подключений"}), 503, {"Retry-After": "30"}
+
+    # Клиент уже показывает эти данные (ETag из /api/weather или id последнего события).
+    # EventSource переподключается на тот же URL: ?since= там — ETag первой загрузки,
+    # а Last-Event-ID — id последнего полученного события, он новее.
+    since = request.headers.get("Last-Event-ID") or request.args.get("since")
+    initial = None if since and since == _weather_etag(bucket, version) else body
+    response = app.response_class(
+        stream_events(live_updates, bucket, version, initial, lambda v: _weather_etag(bucket, v)),
+        mimetype="text/event-stream",
+        # X-Accel-Buffering: nginx отдаёт события сразу, а не копит в буфере.
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+    response.call_on_close(lambda: live_updates.unsubscribe(bucket))
+    return response
+
+
+@app.route("/api/weather/history", methods=["GET"])
+def api_weather_history():
+    """Наблюдения точки за последние hours часов (колонками) — из локальной истории, без OpenWeather."""
+    city = request.args.get("city", "").strip()
+    client = get_weather_client()
+    try:
+        coords = (float(request.args["lat"]), float(request.args["lon"]))
+    except (KeyError, ValueError):
+        coords = None
+    try:
+        hours = min(max(float(request.args.get("hours", "24")), 1.0), 48.0)
+    except ValueError:
+        hours = 24.0
+    if not coords and city:
+        with client.deadline(client.deadline_s):
+            coords = client.get_coordinates(city, limit=1)
+    if not coords:
+        return jsonify({"error": "Укажите city или lat и lon"}), 400
+
+    series = client.get_history(*coords, hours=hours)
+    payload = {
+        "bucket": location_bucket(*coords),
+        "hours": hours,
+        # NaN (поле не пришло от OpenWeather) — null, время — целые секунды.
+        **{
+            name: [None if v != v else (int(v) if name in ("ts", "code") else round(v, 1)) for v in values]
+            for name, values in series.items()
+        },
+    }
+    response = jsonify(payload)
+    # Новое наблюдение появляется не чаще раза в несколько минут.
+    response.headers["Cache-Control"] = "public, max-age=60"
+    return response
 
 
 @app.route("/api/health", methods=["GET"])
 def health():
-    return jsonify({"status": "ok"})
+    payload: dict[str, Any] = {"status": "ok", "render_cache": _get_render_cache().stats()}
+    if _weather_client is not None:
+        payload["negative_cache"] = _weather_client.negative.stats()
+        payload["circuit_breaker"] = _weather_client.breaker.stats()
+        payload["api_keys"] = _weather_client.keys.stats()
+        payload["upstream_gate"] = _weather_client.upstream_gate.stats()
+    if _live_updates is not None:
+        payload["live_updates"] = _live_updates.stats()
+    if _cache_warmer is not None:
+        payload["cache_warmer"] = _cache_warmer.stats()
+    return jsonify(payload)
+
+
+@app.route("/api/metrics", methods=["GET"])
+def api_metrics():
+    """Метрики процесса в формате Prometheus (у каждого воркера gunicorn — свои)."""
+    for name, value in _get_render_cache().stats().items():
+        metrics.set_gauge("api_render_cache", value, stat=name)
+    if _weather_client is not None:
+        metrics.set_gauge("weather_negative_cache_entries", _weather_client.negative.stats()["entries"])
+    return app.response_class(
+        metrics.render(),
+        content_type="text/plain; version=0.0.4; charset=utf-8",
+        headers={"Cache-Control": "no-store"},
+    )
@@ -0,0 +1,45 @@
+// Нормализованный ключ микрокэша для /api/weather.
+// city: регистр, лишние пробелы и ё/е не влияют на ключ ("Москва", " москва ", "МОСКВА").
+// lat/lon: округление до 2 знаков (~1 км) — как location_bucket() в weather_app.py.
+
+function arg(r, name) {
+    var v = r.args[name];
+    if (Array.isArray(v)) {
+        v = v[0];
+    }
+    if (v === undefined || v === null) {
+        return "";
+    }
+    v = String(v).replace(/\+/g, " ");
+    if (v.indexOf("%") !== -1) {
+        try {
+            v = decodeURIComponent(v);
+        } catch (e) {
+            // Оставляем как есть: битая кодировка тоже должна давать стабильный ключ.
+        }
+    }
+    return v;
+}
+
+function normCity(v) {
+    return v.trim().replace(/\s+/g, " ").toLowerCase().replace(/ё/g, "е");
+}
+
+function roundCoord(v) {
+    var n = parseFloat(v);
+    if (!isFinite(n)) {
+        return "";
+    }
+    return (Math.round(n * 100) / 100).toFixed(2);
+}
+
+function key(r) {
+    var lat = roundCoord(arg(r, "lat"));
+    var lon = roundCoord(arg(r, "lon"));
+    if (lat && lon) {
+        return "p:" + lat + "," + lon;
+    }
+    return "c:" + normCity(arg(r, "city"));
+}
+
+export default { key };
@@ -0,0 +1,197 @@
+"""
+Профилирование по запросу: трассы запросов по участкам, выборочный cProfile, tracemalloc.
+
+Включается переменной ``PROFILE=1`` или командой администратора ``/profile on`` в боте.
+Переменные окружения читает ``configure_from_env()``: бот и API вызывают её после
+``load_dotenv()``, чтобы настройки из ``.env`` тоже действовали.
+Запрос (обработчик бота, запрос к API) оборачивается в ``trace(name)``, а его
+участки — в ``span(name)``: чтение/запись ``UserStorage``, файловый кэш,
+запрос к OpenWeather, вызов Telegram API. Готовая трасса дописывается строкой
+JSON в ``<PROFILE_DIR>/traces.jsonl``; доля ``PROFILE_SAMPLE_RATE`` запросов
+дополнительно профилируется cProfile (``*.prof``, смотреть через ``pstats``/snakeviz).
+
+Выключенное профилирование стоит одной проверки флага: ``span`` возвращает
+общий пустой контекст и ничего не пишет.
+"""
+from __future__ import annotations
+
+import cProfile
+import json
+import os
+import random
+import re
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager, nullcontext
+from pathlib import Path
+from typing import Any, ContextManager, Iterator
+
+_NULL = nullcontext()
+
+_enabled = False
+_sample_rate = 0.0
+_slow_ms = 0.0
+_out_dir = Path(".profiles")
+_local = threading.local()
+_write_lock = threading.Lock()
+# cProfile профилирует только свой поток и не любит параллельных экземпляров: не больше одного сразу.
+_profiler_lock = threading.Lock()
+
+
+def enable(
+    out_dir: str | Path | None = None,
+    sample_rate: float | None = None,
+    slow_ms: float | None = None,
+    memory: bool = False,
+) -> None:
+    """Включить трассировку (и, при ``memory``, tracemalloc)."""
+    global _enabled, _sample_rate, _slow_ms, _out_dir
+    if out_dir is not None:
+        _out_dir = Path(out_dir)
+    if sample_rate is not None:
+        _sample_rate = min(max(sample_rate, 0.0), 1.0)
+    if slow_ms is not None:
+        _slow_ms = max(slow_ms, 0.0)
+    _out_dir.mkdir(parents=True, exist_ok=True)
+    if memory and not tracemalloc.is_tracing():
+        tracemalloc.start(25)
+    _enabled = True
+
+
+def disable() -> None:
+    global _enabled
+    _enabled = False
+    if tracemalloc.is_tracing():
+        tracemalloc.stop()
+
+
+def is_enabled() -> bool:
+    return _enabled
+
+
+def configure_from_env() -> None:
+    """PROFILE, PROFILE_DIR, PROFILE_SAMPLE_RATE, PROFILE_SLOW_MS, PROFILE_TRACEMALLOC."""
+    if os.getenv("PROFILE", "0").strip().lower() not in ("1", "on", "true", "yes"):
+        return
+    enable(
+        out_dir=os.getenv("PROFILE_DIR", ".profiles"),
+        sample_rate=float(os.getenv("PROFILE_SAMPLE_RATE", "0.01")),
+        slow_ms=float(os.getenv("PROFILE_SLOW_MS", "0")),
+        memory=os.getenv("PROFILE_TRACEMALLOC", "0").strip().lower() in ("1", "on", "true", "yes"),
+    )
+
+
+class _Span:
+    __slots__ = ("name", "spans", "started")
+
+    def __init__(self, name: str, spans: list) -> None:
+        self.name = name
+        self.spans = spans
+
+    def __enter__(self) -> None:
+        self.started = time.perf_counter()
+
+    def __exit__(self, *exc: Any) -> None:
+        self.spans.append((self.name, time.perf_counter() - self.started))
+
+
+def span(name: str) -> ContextManager[None]:
+    """Участок текущей трассы; без активной трассы — пустой контекст."""
+    if not _enabled:
+        return _NULL
+    spans = getattr(_local, "spans", None)
+    if spans is None:
+        return _NULL
+    return _Span(name, spans)
+
+
+def start_trace(name: str) -> None:
+    if not _enabled:
+        return
+    _local.spans = []
+    _local.name = name
+    _local.started = time.perf_counter()
+    _local.profiler = None
+    if _sample_rate and random.random() < _sample_rate and _profiler_lock.acquire(blocking=False):
+        profiler = cProfile.Profile()
+        try:
+            profiler.enable()
+            _local.profiler = profiler
+        except ValueError:
+            # Профилировщик уже активен (например, внешний) — обойдёмся без него.
+            _profiler_lock.release()
+
+
+def finish_trace(**extra: Any) -> None:
+    spans = getattr(_local, "spans", None)
+    if spans is None:
+        return
+    _local.spans = None
+    total = time.perf_counter() - _local.started
+    profiler = getattr(_local, "profiler", None)
+    _local.profiler = None
+    stamp = time.strftime("%Y%m%d-%H%M%S")
+    name = _local.name
+    prof_file = None
+    if profiler is not None:
+        profiler.disable()
+        _profiler_lock.release()
+        safe_name = re.sub(r"[^\w.-]+", "_", name).strip("_")
+        prof_file = _out_dir / f"{stamp}-{safe_name}-{threading.get_ident()}.prof"
+        try:
+            profiler.dump_stats(prof_file)
+        except OSError:
+            prof_file = None
+
+    if not _enabled or total * 1000 < _slow_ms:
+        return
+    # Участки одного имени (несколько чтений кэша) суммируются.
+    by_name: dict[str, float] = {}
+    for span_name, duration in spans:
+        by_name[span_name] = by_name.get(span_name, 0.0) + duration
+    record = {
+        "ts": time.time(),
+        "name": name,
+        "total_ms": round(total * 1000, 3),
+        "spans_ms": {k: round(v * 1000, 3) for k, v in by_name.items()},
+        "other_ms": round((total - sum(by_name.values())) * 1000, 3),
+        **extra,
+    }
+    if prof_file is not None:
+        record["profile"] = prof_file.name
+    line = json.dumps(record, ensure_ascii=False)
+    with _write_lock:
+        try:
+            with open(_out_dir / "traces.jsonl", "a", encoding="utf-8") as fh:
+                fh.write(line + "\n")
+        except OSError:
+            pass
+
+
+@contextmanager
+def trace(name: str) -> Iterator[None]:
+    """Трасса одного запроса: все ``span`` внутри попадают в одну запись."""
+    if not _enabled:
+        yield
+        return
+    start_trace(name)
+    try:
+        yield
+    finally:
+        finish_trace()
+
+
+def dump_memory(limit: int = 50) -> Path | None:
+    """Снимок tracemalloc (топ строк по объёму) в файл; None, если tracemalloc не запущен."""
+    if not tracemalloc.is_tracing():
+        return None
+    snapshot = tracemalloc.take_snapshot()
+    stats = snapshot.statistics("lineno")
+    current, peak = tracemalloc.get_traced_memory()
+    path = _out_dir / f"tracemalloc-{time.strftime('%Y%m%d-%H%M%S')}.txt"
+    lines = [f"current={current / 1024:.1f} KiB peak={peak / 1024:.1f} KiB"]
+    lines.extend(str(stat) for stat in stats[:limit])
+    _out_dir.mkdir(parents=True, exist_ok=True)
+    path.write_text("\n".join(lines) + "\n", encoding="utf-8")
+    return path
@@ -0,0 +1,74 @@
+"""
+Кэш отрендеренных ответов (текст меню прогноза в боте, JSON для Mini App).
+
+Ключ — (бакет локации, представление, язык). Каждое значение хранится вместе
+с версией исходных данных OpenWeather (см. ``WeatherClient.last_version``):
+как только запись кэша OpenWeather обновилась, версия меняется и старый
+рендер автоматически считается устаревшим.
+"""
+from __future__ import annotations
+
+from collections import OrderedDict
+from threading import Lock
+from typing import Any, Callable, Hashable
+
+
+class RenderCache:
+    """Thread-safe LRU cache of rendered views keyed by upstream data version."""
+
+    def __init__(self, max_entries: int = 512) -> None:
+        self.max_entries = max(max_entries, 1)
+        self._entries: OrderedDict[Hashable, tuple[Hashable, Any]] = OrderedDict()
+        self._lock = Lock()
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def get(self, key: Hashable, version: Hashable) -> Any | None:
+        if version is None:
+            return None
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            cached_version, value = entry
+            if cached_version != version:
+                # Данные OpenWeather обновились — рендер больше не актуален.
+                del self._entries[key]
+                self.invalidations += 1
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key: Hashable, version: Hashable, value: Any) -> None:
+        if version is None:
+            return
+        with self._lock:
+            self._entries[key] = (version, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def get_or_render(self, key: Hashable, version: Hashable, render: Callable[[], Any]) -> Any:
+        """Вернуть закэшированный рендер или построить его и запомнить."""
+        value = self.get(key, version)
+        if value is not None:
+            return value
+        value = render()
+        if value is not None:
+            self.set(key, version, value)
+        return value
+
+    def stats(self) -> dict[str, Any]:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "invalidations": self.invalidations,
+                "hit_ratio": round(self.hits / total, 4) if total else 0.0,
+            }
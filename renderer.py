@@ -0,0 +1,182 @@
+"""
+Рендеринг погодных данных по кодам состояний OpenWeather.
+
+Все таблицы (эмодзи, локализованные описания) строятся один раз при импорте
+и дают O(1)-поиск по ``weather[0].id``. Используется и ботом, и Mini App API.
+Коды: https://openweathermap.org/weather-conditions
+"""
+from __future__ import annotations
+
+from typing import Any
+
+DEFAULT_CODE = 800
+DEFAULT_EMOJI = "🌡️"
+
+# id -> (ru, en)
+CONDITIONS: dict[int, tuple[str, str]] = {
+    200: ("гроза с небольшим дождём", "thunderstorm with light rain"),
+    201: ("гроза с дождём", "thunderstorm with rain"),
+    202: ("гроза с сильным дождём", "thunderstorm with heavy rain"),
+    210: ("небольшая гроза", "light thunderstorm"),
+    211: ("гроза", "thunderstorm"),
+    212: ("сильная гроза", "heavy thunderstorm"),
+    221: ("прерывистая гроза", "ragged thunderstorm"),
+    230: ("гроза с мелкой моросью", "thunderstorm with light drizzle"),
+    231: ("гроза с моросью", "thunderstorm with drizzle"),
+    232: ("гроза с сильной моросью", "thunderstorm with heavy drizzle"),
+    300: ("слабая морось", "light intensity drizzle"),
+    301: ("морось", "drizzle"),
+    302: ("сильная морось", "heavy intensity drizzle"),
+    310: ("слабый моросящий дождь", "light intensity drizzle rain"),
+    311: ("моросящий дождь", "drizzle rain"),
+    312: ("сильный моросящий дождь", "heavy intensity drizzle rain"),
+    313: ("ливень с моросью", "shower rain and drizzle"),
+    314: ("сильный ливень с моросью", "heavy shower rain and drizzle"),
+    321: ("ливневая морось", "shower drizzle"),
+    500: ("небольшой дождь", "light rain"),
+    501: ("умеренный дождь", "moderate rain"),
+    502: ("сильный дождь", "heavy intensity rain"),
+    503: ("очень сильный дождь", "very heavy rain"),
+    504: ("проливной дождь", "extreme rain"),
+    511: ("ледяной дождь", "freezing rain"),
+    520: ("небольшой ливень", "light intensity shower rain"),
+    521: ("ливень", "shower rain"),
+    522: ("сильный ливень", "heavy intensity shower rain"),
+    531: ("прерывистый ливень", "ragged shower rain"),
+    600: ("небольшой снег", "light snow"),
+    601: ("снег", "snow"),
+    602: ("сильный снег", "heavy snow"),
+    611: ("мокрый снег", "sleet"),
+    612: ("небольшой мокрый снег", "light shower sleet"),
+    613: ("ливневый мокрый снег", "shower sleet"),
+    615: ("небольшой дождь со снегом", "light rain and snow"),
+    616: ("дождь со снегом", "rain and snow"),
+    620: ("небольшой снегопад", "light shower snow"),
+    621: ("снегопад", "shower snow"),
+    622: ("сильный снегопад", "heavy shower snow"),
+    701: ("туман", "mist"),
+    711: ("дым", "smoke"),
+    721: ("дымка", "haze"),
+    731: ("песчаные вихри", "sand/dust whirls"),
+    741: ("туман", "fog"),
+    751: ("песок", "sand"),
+    761: ("пыль", "dust"),
+    762: ("вулканический пепел", "volcanic ash"),
+    771: ("шквалы", "squalls"),
+    781: ("торнадо", "tornado"),
+    800: ("ясно", "clear sky"),
+    801: ("небольшая облачность", "few clouds"),
+    802: ("переменная облачность", "scattered clouds"),
+    803: ("облачно", "broken clouds"),
+    804: ("пасмурно", "overcast clouds"),
+}
+
+LANGUAGES = ("ru", "en")
+
+# lang -> {id: описание}
+_DESCRIPTIONS: dict[str, dict[int, str]] = {
+    lang: {code: texts[i] for code, texts in CONDITIONS.items()}
+    for i, lang in enumerate(LANGUAGES)
+}
+
+# Английское описание (как его отдаёт API без lang) -> id, для данных без кода.
+_CODE_BY_EN: dict[str, int] = {en: code for code, (_, en) in CONDITIONS.items()}
+
+
+def _emoji_for_code(code: int) -> str:
+    if code == 800:
+        return "☀️"
+    if code == 801:
+        return "🌤️"
+    if code == 802:
+        return "⛅"
+    if code in (803, 804):
+        return "☁️"
+    group = code // 100
+    return {2: "⛈️", 3: "🌦️", 5: "🌧️", 6: "❄️", 7: "🌫️"}.get(group, DEFAULT_EMOJI)
+
+
+_EMOJI_BY_CODE: tuple[str, ...] = tuple(_emoji_for_code(code) for code in range(1000))
+
+
+def weather_emoji(code: int) -> str:
+    """Эмодзи для кода погоды OpenWeather."""
+    if 0 <= code < 1000:
+        return _EMOJI_BY_CODE[code]
+    return DEFAULT_EMOJI
+
+
+def translate_description(description: str, lang: str = "ru") -> str:
+    """Перевод текстового описания без кода; неизвестный текст возвращается как есть."""
+    code = _CODE_BY_EN.get(description.lower().strip())
+    if code is None:
+        return description
+    return _DESCRIPTIONS.get(lang, _DESCRIPTIONS["ru"])[code]
+
+
+def describe(code: int | None, fallback: str = "", lang: str = "ru") -> str:
+    """Локализованное описание по коду; без известного кода — перевод ``fallback``."""
+    table = _DESCRIPTIONS.get(lang, _DESCRIPTIONS["ru"])
+    if code is not None:
+        text = table.get(code)
+        if text is not None:
+            return text
+    return translate_description(fallback, lang) if fallback else fallback
+
+
+def condition(item: dict[str, Any]) -> tuple[int | None, str]:
+    """(id, description) из ``weather[0]`` элемента ответа OpenWeather; id None, если его нет."""
+    weather = item.get("weather") or []
+    if weather and isinstance(weather[0], dict):
+        meta = weather[0]
+        code = meta.get("id")
+        return (int(code) if isinstance(code, (int, float)) else None), str(meta.get("description") or "")
+    return None, ""
+
+
+def condition_code(item: dict[str, Any]) -> int:
+    """Код для эмодзи и анимации; без id — по английскому ``description``, иначе DEFAULT_CODE."""
+    code, raw = condition(item)
+    if code is None:
+        return _CODE_BY_EN.get(raw.lower().strip(), DEFAULT_CODE)
+    return code
+
+
+def describe_item(item: dict[str, Any], lang: str = "ru", default: str = "нет описания") -> str:
+    code, raw = condition(item)
+    if not item.get("weather"):
+        return default
+    return describe(code, raw, lang) or default
+
+
+def group_by_day(forecast_list: list[dict[str, Any]]) -> dict[str, list[dict[str, Any]]]:
+    """Группировка слотов прогноза 5d/3h по дате из ``dt_txt``."""
+    grouped: dict[str, list[dict[str, Any]]] = {}
+    for item in forecast_list:
+        dt_txt = str(item.get("dt_txt", ""))
+        day = dt_txt.split(" ")[0] if " " in dt_txt else dt_txt[:10]
+        if day:
+            grouped.setdefault(day, []).append(item)
+    return grouped
+
+
+def summarize_day(day_items: list[dict[str, Any]], lang: str = "ru") -> dict[str, Any]:
+    """Сводка по дню: мин/макс температура, код, эмодзи и описание первого слота."""
+    temps = []
+    first: dict[str, Any] | None = None
+    for item in day_items:
+        temp = (item.get("main") or {}).get("temp")
+        if isinstance(temp, (int, float)):
+            temps.append(float(temp))
+        if first is None and item.get("weather"):
+            first = item
+    first_code, first_desc = condition(first) if first is not None else (None, "")
+
+    code = condition_code(first) if first is not None else DEFAULT_CODE
+    return {
+        "temp_min": min(temps) if temps else None,
+        "temp_max": max(temps) if temps else None,
+        "code": code,
+        "emoji": weather_emoji(code),
+        "description": describe(first_code, first_desc, lang),
+    }
@@ -0,0 +1,75 @@
+"""
+Микро-бенчмарк рендера полного прогноза на 5 дней (40 слотов по 3 часа).
+
+Запуск: python scripts/bench_render.py [--repeat 2000]
+Меряет путь бота (обзор + детальный прогноз по всем дням) и сборку JSON для Mini App.
+"""
+from __future__ import annotations
+
+import argparse
+import os
+import sys
+import time
+from datetime import datetime, timedelta, timezone
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from renderer import condition_code, describe_item, group_by_day, summarize_day, weather_emoji  # noqa: E402
+
+_CODES = [800, 801, 802, 803, 804, 500, 501, 600, 701, 211]
+
+
+def make_forecast(slots: int = 40) -> list[dict]:
+    start = datetime(2026, 1, 1, tzinfo=timezone.utc)
+    items = []
+    for i in range(slots):
+        dt = start + timedelta(hours=3 * i)
+        code = _CODES[i % len(_CODES)]
+        items.append({
+            "dt": int(dt.timestamp()),
+            "dt_txt": dt.strftime("%Y-%m-%d %H:%M:%S"),
+            "main": {"temp": -3.0 + (i % 9), "feels_like": -6.0 + (i % 9), "humidity": 80},
+            "weather": [{"id": code, "main": "", "description": "облачно", "icon": "04d"}],
+            "wind": {"speed": 3.5},
+        })
+    return items
+
+
+def render_bot(forecast: list[dict]) -> int:
+    grouped = group_by_day(forecast)
+    size = 0
+    for day in sorted(grouped)[:5]:
+        summary = summarize_day(grouped[day])
+        size += len(f"{summary['emoji']} {day} {summary['temp_min']} {summary['temp_max']} {summary['description']}")
+        for item in grouped[day]:
+            line = f"{weather_emoji(condition_code(item))} {item['dt_txt']}: {describe_item(item).capitalize()}"
+            size += len(line)
+    return size
+
+
+def render_api(forecast: list[dict]) -> int:
+    grouped = group_by_day(forecast)
+    days = sorted(grouped)[1:4]
+    return len([summarize_day(grouped[d]) for d in days])
+
+
+def bench(name: str, fn, forecast: list[dict], repeat: int) -> None:
+    fn(forecast)
+    started = time.perf_counter()
+    for _ in range(repeat):
+        fn(forecast)
+    elapsed = time.perf_counter() - started
+    print(f"{name:<12} {elapsed / repeat * 1e6:10.1f} µs/render  ({repeat} повторов)")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=2000)
+    args = parser.parse_args()
+    forecast = make_forecast()
+    bench("bot", render_bot, forecast, args.repeat)
+    bench("miniapp", render_api, forecast, args.repeat)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,353 @@
+"""
+Офлайн-бенчмарки бота, Mini App API, UserStorage и кэша OpenWeather.
+
+Запуск:
+    python scripts/bench_suite.py --out bench-HEAD.json
+    python scripts/bench_suite.py --only storage --users 1000,100000,1000000
+    python scripts/bench_suite.py --compare bench-base.json --out bench-HEAD.json
+
+Поднимает в фоне заглушки OpenWeather (``fake_openweather.py``, задержка,
+доля 429 и фикстуры настраиваются) и Telegram Bot API (``fake_telegram.py``),
+работает во временном каталоге (``.cache``, ``User_Data.json`` не трогают
+рабочую копию). Набор ``startup`` меряет холодный старт процессов API и бота
+и показывает файлы, которые они создают при импорте. Для каждого сценария — число операций, ops/s, p50/p99 в мс.
+Результат — JSON (``--out``), который можно сравнить с прогоном другого
+коммита (``--compare``).
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Any, Callable
+
+SCRIPTS_DIR = Path(__file__).resolve().parent
+REPO_DIR = SCRIPTS_DIR.parent
+sys.path.insert(0, str(REPO_DIR))
+
+import fake_openweather  # noqa: E402
+import fake_telegram  # noqa: E402
+from loadtest import percentile  # noqa: E402
+
+SUITES = ("startup", "cache", "storage", "api", "bot")
+
+# Холодный старт процесса: импорт и создание приложения (без сети и без первого запроса).
+STARTUP_TARGETS = {
+    "api": "import miniapp_api; miniapp_api.app",
+    "bot": "import bot; bot.TelegramWeatherBot()",
+}
+
+
+def measure(name: str, op: Callable[[int], Any], ops: int, budget_s: float) -> dict[str, Any]:
+    """Выполнить ``op(i)`` до ``ops`` раз (но не дольше ``budget_s``) и собрать задержки."""
+    latencies: list[float] = []
+    started = time.perf_counter()
+    for i in range(ops):
+        t0 = time.perf_counter()
+        op(i)
+        latencies.append(time.perf_counter() - t0)
+        if time.perf_counter() - started > budget_s and len(latencies) >= 3:
+            break
+    elapsed = time.perf_counter() - started
+    result = {
+        "ops": len(latencies),
+        "ops_per_s": round(len(latencies) / elapsed, 1) if elapsed else 0.0,
+        "p50_ms": round(percentile(latencies, 50) * 1000, 3),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 3),
+    }
+    print(f"  {name:<34} {result['ops']:>7} ops  {result['ops_per_s']:>10} ops/s  "
+          f"p50 {result['p50_ms']:>9} ms  p99 {result['p99_ms']:>9} ms", flush=True)
+    return result
+
+
+def _random_point(rnd: random.Random) -> tuple[float, float]:
+    return round(rnd.uniform(-60, 70), 4), round(rnd.uniform(-180, 180), 4)
+
+
+def bench_startup(args: argparse.Namespace) -> dict[str, Any]:
+    results: dict[str, Any] = {}
+    env = {**os.environ, "PYTHONPATH": str(REPO_DIR), "PYTHONDONTWRITEBYTECODE": "1"}
+    for name, code in STARTUP_TARGETS.items():
+        clean_dir = Path(tempfile.mkdtemp(prefix=f"startup-{name}-"))
+        cmd = [sys.executable, "-c", code]
+        subprocess.run(cmd, cwd=clean_dir, env=env, check=True)
+        # Что процесс оставил в рабочем каталоге при старте (ожидается — ничего).
+        side_effects = sorted(p.name for p in clean_dir.iterdir())
+        runs = min(args.ops, args.startup_runs)
+        results[f"startup.{name}"] = {
+            **measure(
+                f"старт: {name}",
+                lambda i: subprocess.run(cmd, cwd=clean_dir, env=env, check=True),
+                runs,
+                args.budget * 4,
+            ),
+            "side_effects": side_effects,
+        }
+        if side_effects:
+            print(f"    файлы после старта: {', '.join(side_effects)}")
+    return results
+
+
+def bench_cache(args: argparse.Namespace) -> dict[str, Any]:
+    from weather_app import OpenWeatherCache, project_response
+
+    raw = fake_openweather._forecast({"lat": "55.75", "lon": "37.62"})
+    # В кэш клиент кладёт проекцию; сырой ответ — как при OW_CACHE_RAW=1.
+    payload = project_response("/data/2.5/forecast", raw)
+    cache = OpenWeatherCache(Path("bench-cache"), ttl_seconds=600)
+    for i in range(100):
+        cache.set(f"hit-{i}", payload)
+        cache.set(f"raw-{i}", raw)
+    sizes = {name: cache._cache_file(f"{name}-0").stat().st_size for name in ("hit", "raw")}
+    print(f"  размер записи прогноза: проекция {sizes['hit']} Б, сырой ответ {sizes['raw']} Б")
+    return {
+        "cache.set": measure("cache.set (прогноз 5d/3h)", lambda i: cache.set(f"w-{i}", payload), args.ops, args.budget),
+        "cache.hit": measure("cache.get_entry hit", lambda i: cache.get_entry(f"hit-{i % 100}"), args.ops, args.budget),
+        "cache.hit.raw": measure("cache.get_entry hit (сырой)", lambda i: cache.get_entry(f"raw-{i % 100}"), args.ops, args.budget),
+        "cache.miss": measure("cache.get_entry miss", lambda i: cache.get_entry(f"none-{i}"), args.ops, args.budget),
+        "cache.entry_bytes": {"projected": sizes["hit"], "raw": sizes["raw"]},
+    }
+
+
+def bench_storage(args: argparse.Namespace) -> dict[str, Any]:
+    from storage import UserStorage
+
+    results: dict[str, Any] = {}
+    for users in args.users:
+        path = Path(f"users-{users}.json")
+        rnd = random.Random(users)
+        data = {
+            str(100000 + i): {
+                "city": "Москва",
+                "lat": 55.75 + rnd.random(),
+                "lon": 37.61 + rnd.random(),
+                "notifications": {"enabled": i % 3 == 0, "interval_h": 2, "last_sent_ts": 0},
+            }
+            for i in range(users)
+        }
+        path.write_text(json.dumps(data, ensure_ascii=False), encoding="utf-8")
+        del data
+        storage = UserStorage(path)
+        ids = [100000 + rnd.randrange(users) for _ in range(args.ops)]
+        results[f"storage.load_user.{users}"] = measure(
+            f"storage.load_user ({users} польз.)", lambda i: storage.load_user(ids[i]), args.ops, args.budget
+        )
+        results[f"storage.save_user.{users}"] = measure(
+            f"storage.save_user ({users} польз.)",
+            lambda i: storage.save_user(ids[i], {"city": "Казань", "lat": 55.79, "lon": 49.1}),
+            args.ops,
+            args.budget,
+        )
+        path.unlink(missing_ok=True)
+    return results
+
+
+def bench_api(args: argparse.Namespace) -> dict[str, Any]:
+    import miniapp_api
+
+    client = miniapp_api.app.test_client()
+    rnd = random.Random(1)
+    client.get("/api/weather?city=Москва")
+
+    def cold_point(i: int) -> None:
+        lat, lon = _random_point(rnd)
+        client.get(f"/api/weather?lat={lat}&lon={lon}")
+
+    batch = {"items": [{"city": c} for c in ("Москва", "Казань", "Сочи")] + [{"lat": 59.93, "lon": 30.31}]}
+    client.post("/api/weather/batch", json=batch)
+    return {
+        "api.weather.warm": measure(
+            "GET /api/weather (кэш)", lambda i: client.get("/api/weather?city=Москва"), args.ops, args.budget
+        ),
+        "api.weather.cold": measure("GET /api/weather (промах)", cold_point, args.ops, args.budget),
+        "api.batch.warm": measure(
+            "POST /api/weather/batch (4, кэш)", lambda i: client.post("/api/weather/batch", json=batch), args.ops, args.budget
+        ),
+    }
+
+
+def _user(uid: int) -> dict[str, Any]:
+    return {"id": uid, "is_bot": False, "first_name": "bench"}
+
+
+def _message_update(uid: int, seq: int, **fields: Any) -> dict[str, Any]:
+    return {
+        "update_id": seq,
+        "message": {
+            "message_id": seq,
+            "date": int(time.time()),
+            "chat": {"id": uid, "type": "private"},
+            "from": _user(uid),
+            **fields,
+        },
+    }
+
+
+def _callback_update(uid: int, seq: int, data: str) -> dict[str, Any]:
+    message = _message_update(uid, seq, text="menu")["message"]
+    return {
+        "update_id": seq,
+        "callback_query": {"id": str(seq), "from": _user(uid), "chat_instance": "1", "message": message, "data": data},
+    }
+
+
+def bench_bot(args: argparse.Namespace, telegram: fake_telegram.FakeTelegram) -> dict[str, Any]:
+    from telebot import apihelper, types
+
+    import bot as bot_module
+
+    apihelper.API_URL = telegram.api_url
+    app = bot_module.TelegramWeatherBot()
+    # Обновления обрабатываются в этом потоке, иначе задержку не измерить.
+    app.bot.threaded = False
+    rnd = random.Random(2)
+    seq = iter(range(1, 10**9))
+
+    def process(update: dict[str, Any]) -> None:
+        app.bot.process_new_updates([types.Update.de_json(update)])
+
+    def city_weather(i: int) -> None:
+        uid = 1000 + i % 50
+        app.user_states[uid] = {"action": "current_weather"}
+        process(_message_update(uid, next(seq), text="Москва"))
+
+    def location_cold(i: int) -> None:
+        uid = 2000 + i % 50
+        lat, lon = _random_point(rnd)
+        app.user_states[uid] = {"action": "current_weather"}
+        process(_message_update(uid, next(seq), location={"latitude": lat, "longitude": lon}))
+
+    def forecast_menu(i: int) -> None:
+        uid = 3000 + i % 50
+        app.user_states[uid] = {"action": "forecast"}
+        process(_message_update(uid, next(seq), text="Москва"))
+
+    def inline(i: int) -> None:
+        process({
+            "update_id": next(seq),
+            "inline_query": {"id": str(i), "from": _user(4000), "query": "Мос", "offset": ""},
+        })
+
+    def callback_back(i: int) -> None:
+        process(_callback_update(5000 + i % 50, next(seq), "forecast_back"))
+
+    def callback_day(i: int) -> None:
+        uid = 3000 + i % 50
+        day = next(iter(app.forecast_cache.get(uid) or {"—": []}))
+        process(_callback_update(uid, next(seq), f"forecast_day|{day}"))
+
+    city_weather(0)
+    forecast_menu(0)
+    telegram.reset()
+    results = {
+        "bot.text_city.warm": measure("бот: погода по городу (кэш)", city_weather, args.ops, args.budget),
+        "bot.forecast_menu.warm": measure("бот: меню прогноза (кэш)", forecast_menu, args.ops, args.budget),
+        "bot.location.cold": measure("бот: геолокация (промах)", location_cold, args.ops, args.budget),
+        "bot.inline.warm": measure("бот: inline-подсказки", inline, args.ops, args.budget),
+        "bot.callback.back": measure("бот: кнопка «Назад»", callback_back, args.ops, args.budget),
+        "bot.callback.forecast_day": measure("бот: прогноз на день (кнопка)", callback_day, args.ops, args.budget),
+    }
+    results["bot.telegram_calls"] = telegram.snapshot()
+    return results
+
+
+def _git_commit() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=REPO_DIR, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def compare(current: dict[str, Any], baseline_path: str) -> None:
+    baseline = json.loads(Path(baseline_path).read_text(encoding="utf-8"))
+    print(f"\nСравнение с {baseline.get('commit', baseline_path)} (p50, ops/s):")
+    for name, cur in current["results"].items():
+        base = baseline.get("results", {}).get(name)
+        if not isinstance(cur, dict) or not isinstance(base, dict) or "p50_ms" not in cur or "p50_ms" not in base:
+            continue
+        delta = (cur["p50_ms"] - base["p50_ms"]) / base["p50_ms"] * 100 if base["p50_ms"] else 0.0
+        print(f"  {name:<34} p50 {base['p50_ms']:>9} -> {cur['p50_ms']:>9} ms ({delta:+.1f}%)  "
+              f"ops/s {base['ops_per_s']} -> {cur['ops_per_s']}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Офлайн-бенчмарки погодного бота и API")
+    parser.add_argument("--only", default=",".join(SUITES), help=f"наборы через запятую: {', '.join(SUITES)}")
+    parser.add_argument("--ops", type=int, default=500, help="операций на сценарий (максимум)")
+    parser.add_argument("--budget", type=float, default=5.0, help="секунд на сценарий (максимум)")
+    parser.add_argument("--startup-runs", type=int, default=10, help="запусков процесса на сценарий старта")
+    parser.add_argument("--users", default="1000,100000", help="размеры UserStorage, например 1000,100000,1000000")
+    parser.add_argument("--ow-latency-ms", type=float, default=50.0, help="задержка заглушки OpenWeather")
+    parser.add_argument("--ow-jitter-ms", type=float, default=0.0)
+    parser.add_argument("--ow-rate-429", type=float, default=0.0, help="доля ответов 429")
+    parser.add_argument("--ow-fixtures", default=None, help="папка с JSON-ответами OpenWeather")
+    parser.add_argument("--tg-latency-ms", type=float, default=20.0, help="задержка заглушки Telegram")
+    parser.add_argument("--out", default="", help="файл для JSON-результатов")
+    parser.add_argument("--compare", default="", help="JSON прошлого прогона для сравнения")
+    args = parser.parse_args()
+    args.users = [int(u) for u in args.users.split(",") if u.strip()]
+    suites = [s.strip() for s in args.only.split(",") if s.strip()]
+    out_path = Path(args.out).resolve() if args.out else None
+    compare_path = str(Path(args.compare).resolve()) if args.compare else ""
+    fixtures = str(Path(args.ow_fixtures).resolve()) if args.ow_fixtures else None
+
+    ow = fake_openweather.start_server(
+        latency_ms=args.ow_latency_ms, jitter_ms=args.ow_jitter_ms, rate_429=args.ow_rate_429, fixtures_dir=fixtures
+    )
+    telegram = fake_telegram.start_server(latency_ms=args.tg_latency_ms)
+    workdir = tempfile.mkdtemp(prefix="weather-bench-")
+    os.chdir(workdir)
+    os.environ.update({
+        "OW_API_KEY": "bench",
+        "BOT_TOKEN": "1:bench",
+        "OW_BASE_URL": f"http://127.0.0.1:{ow.server_address[1]}",
+        "BOT_DATA_DIR": workdir,
+        "CACHE_WARMER": "0",
+    })
+
+    results: dict[str, Any] = {}
+    for suite in suites:
+        print(f"[{suite}]", flush=True)
+        if suite == "startup":
+            results.update(bench_startup(args))
+        elif suite == "cache":
+            results.update(bench_cache(args))
+        elif suite == "storage":
+            results.update(bench_storage(args))
+        elif suite == "api":
+            results.update(bench_api(args))
+        elif suite == "bot":
+            results.update(bench_bot(args, telegram))
+    results["openweather_calls"] = ow.snapshot()
+
+    report = {
+        "commit": _git_commit(),
+        "timestamp": int(time.time()),
+        "python": platform.python_version(),
+        "settings": {
+            "ops": args.ops,
+            "budget_s": args.budget,
+            "ow_latency_ms": args.ow_latency_ms,
+            "ow_rate_429": args.ow_rate_429,
+            "tg_latency_ms": args.tg_latency_ms,
+        },
+        "results": results,
+    }
+    if out_path:
+        out_path.write_text(json.dumps(report, ensure_ascii=False, indent=2), encoding="utf-8")
+        print(f"\nРезультаты: {out_path}")
+    if compare_path:
+        compare(report, compare_path)
+
+
+if __name__ == "__main__":
+    main()
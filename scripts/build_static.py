@@ -0,0 +1,192 @@
+"""
+Сборка статики Mini App: хэши в именах файлов и заранее сжатые копии.
+
+Запуск: python scripts/build_static.py [--src miniapp-static] [--out build/miniapp-static]
+
+- ``app.js``, ``styles.css`` копируются как ``app.<hash>.js``, ``styles.<hash>.css``
+  (8 hex-символов SHA-256 содержимого): имя меняется вместе с содержимым, поэтому
+  nginx отдаёт их с ``Cache-Control: immutable`` на год;
+- ссылки в ``index.html`` переписываются на новые имена; сам ``index.html`` остаётся
+  под своим именем и перепроверяется при каждом открытии (он маленький);
+- рядом с каждым файлом кладутся ``.gz`` (для ``gzip_static``) и ``.br`` (если
+  установлен пакет ``brotli`` — для nginx с модулем brotli или CDN);
+- ``manifest.json`` — исходное имя -> имя в сборке (у HTML совпадает с исходным).
+
+Пересборка удаляет из ``--out`` только файлы прошлой сборки по её ``manifest.json``
+(с их ``.gz``/``.br``). Непустой каталог без манифеста, каталог исходников или каталог,
+в котором лежат исходники, скрипт не трогает.
+
+В конце печатаются байты холодной загрузки (index.html + CSS + JS) до и после:
+без сжатия, gzip и brotli. Только стандартная библиотека (+ необязательный brotli).
+"""
+from __future__ import annotations
+
+import argparse
+import gzip
+import hashlib
+import json
+import os
+import re
+import sys
+from pathlib import Path
+
+try:
+    import brotli
+except ImportError:  # .br не собираются, остальное работает
+    brotli = None
+
+ROOT = Path(__file__).resolve().parent.parent
+# Файлы, которые получают хэш в имени; всё остальное копируется как есть.
+HASHED_SUFFIXES = (".js", ".css")
+COMPRESSED_SUFFIXES = (".html", ".js", ".css", ".json", ".svg")
+# Меньше этого сжатие не окупает заголовки и распаковку.
+MIN_COMPRESS_BYTES = 256
+
+
+def content_hash(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()[:8]
+
+
+def hashed_name(name: str, data: bytes) -> str:
+    stem, dot, suffix = name.rpartition(".")
+    return f"{stem}.{content_hash(data)}.{suffix}" if dot else f"{name}.{content_hash(data)}"
+
+
+def rewrite_references(html: str, manifest: dict[str, str]) -> str:
+    """Заменить ссылки src/href на исходные имена ссылками на хэшированные."""
+
+    def replace(match: re.Match[str]) -> str:
+        attr, quote, url = match.group(1), match.group(2), match.group(3)
+        path = url.partition("?")[0]
+        prefix = "/" if path.startswith("/") else ""
+        target = manifest.get(path.lstrip("/"))
+        if target is None:
+            return match.group(0)
+        # Кэш-бастинг через ?v= больше не нужен: версия — в имени.
+        return f"{attr}={quote}{prefix}{target}{quote}"
+
+    return re.sub(r"""\b(src|href)=(["'])([^"']+)\2""", replace, html)
+
+
+def write_compressed(path: Path, data: bytes) -> dict[str, int]:
+    """Положить рядом .gz/.br; вернуть размеры вариантов."""
+    sizes = {"raw": len(data)}
+    if path.suffix not in COMPRESSED_SUFFIXES or len(data) < MIN_COMPRESS_BYTES:
+        return sizes
+    # mtime=0: одинаковый вход даёт побайтно одинаковый .gz (воспроизводимая сборка).
+    gz = gzip.compress(data, compresslevel=9, mtime=0)
+    path.with_name(path.name + ".gz").write_bytes(gz)
+    sizes["gzip"] = len(gz)
+    if brotli is not None:
+        br = brotli.compress(data, quality=11)
+        path.with_name(path.name + ".br").write_bytes(br)
+        sizes["br"] = len(br)
+    return sizes
+
+
+def check_output_dir(src: Path, out: Path) -> None:
+    """ValueError, если сборка в out может удалить или перемешать чужие файлы."""
+    src, out = src.resolve(), out.resolve()
+    if out == src or src.is_relative_to(out) or out.is_relative_to(src):
+        raise ValueError(f"{out}: каталог сборки не должен совпадать с {src} или содержать его (и наоборот)")
+    if out.is_dir() and any(out.iterdir()) and not (out / "manifest.json").is_file():
+        raise ValueError(f"{out}: каталог не пуст и не похож на прошлую сборку (нет manifest.json)")
+
+
+def remove_previous_build(out: Path) -> None:
+    """Удалить файлы прошлой сборки по её manifest.json; остальное в out не трогается."""
+    manifest_path = out / "manifest.json"
+    try:
+        manifest = json.loads(manifest_path.read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return
+    targets = manifest.values() if isinstance(manifest, dict) else ()
+    for target in targets:
+        path = (out / str(target)).resolve()
+        if not path.is_relative_to(out.resolve()):
+            continue
+        for variant in (path, path.with_name(path.name + ".gz"), path.with_name(path.name + ".br")):
+            if variant.is_file():
+                variant.unlink()
+        # Опустевшие подкаталоги тоже убираем, но не выше out.
+        parent = path.parent
+        while parent != out.resolve() and parent.is_dir() and not any(parent.iterdir()):
+            parent.rmdir()
+            parent = parent.parent
+    manifest_path.unlink()
+
+
+def build(src: Path, out: Path) -> dict[str, dict[str, int]]:
+    """Собрать статику из src в out вместо прошлой сборки; размеры по итоговым файлам."""
+    check_output_dir(src, out)
+    # Сам каталог не пересоздаётся: он смонтирован в контейнер nginx, а bind mount держится за inode.
+    out.mkdir(parents=True, exist_ok=True)
+    remove_previous_build(out)
+
+    manifest: dict[str, str] = {}
+    sizes: dict[str, dict[str, int]] = {}
+    pages = []
+    for path in sorted(p for p in src.rglob("*") if p.is_file()):
+        rel = path.relative_to(src).as_posix()
+        if path.suffix == ".html":
+            pages.append(rel)
+            continue
+        data = path.read_bytes()
+        target = hashed_name(rel, data) if path.suffix in HASHED_SUFFIXES else rel
+        manifest[rel] = target
+        dest = out / target
+        dest.parent.mkdir(parents=True, exist_ok=True)
+        dest.write_bytes(data)
+        sizes[target] = write_compressed(dest, data)
+
+    # HTML — последним: ссылки указывают на уже известные имена.
+    for rel in pages:
+        html = (src / rel).read_text(encoding="utf-8")
+        data = rewrite_references(html, manifest).encode("utf-8")
+        dest = out / rel
+        dest.parent.mkdir(parents=True, exist_ok=True)
+        dest.write_bytes(data)
+        sizes[rel] = write_compressed(dest, data)
+
+    manifest.update((rel, rel) for rel in pages)
+    (out / "manifest.json").write_text(json.dumps(manifest, ensure_ascii=False, indent=2) + "\n", encoding="utf-8")
+    return sizes
+
+
+def cold_load_report(src: Path, sizes: dict[str, dict[str, int]]) -> list[str]:
+    """Байты первой загрузки index.html + ассетов: исходные файлы без сжатия против собранных."""
+    before = sum(p.stat().st_size for p in src.rglob("*") if p.is_file() and p.suffix in COMPRESSED_SUFFIXES)
+    lines = [f"{'файл':<28}{'raw':>9}{'gzip':>9}{'br':>9}"]
+    for name, variant in sorted(sizes.items()):
+        lines.append(
+            f"{name:<28}{variant['raw']:>9}{variant.get('gzip', '-'):>9}{variant.get('br', '-'):>9}"
+        )
+    for encoding in ("gzip", "br"):
+        total = sum(v.get(encoding, v["raw"]) for n, v in sizes.items() if Path(n).suffix in COMPRESSED_SUFFIXES)
+        if any(encoding in v for v in sizes.values()):
+            lines.append(f"холодная загрузка: {before} Б без сжатия -> {total} Б ({encoding}), -{100 - 100 * total // before}%")
+    return lines
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Сборка статики Mini App: хэши в именах, .gz/.br")
+    parser.add_argument("--src", default=str(ROOT / "miniapp-static"))
+    parser.add_argument("--out", default=str(ROOT / "build" / "miniapp-static"))
+    args = parser.parse_args()
+
+    src, out = Path(args.src).resolve(), Path(args.out).resolve()
+    if not (src / "index.html").is_file():
+        sys.exit(f"{src}: нет index.html")
+    try:
+        sizes = build(src, out)
+    except ValueError as exc:
+        sys.exit(str(exc))
+    print(f"Собрано в {os.path.relpath(out)}")
+    for line in cold_load_report(src, sizes):
+        print(line)
+    if brotli is None:
+        print("brotli не установлен: .br не собраны (pip install brotli)")
+
+
+if __name__ == "__main__":
+    main()
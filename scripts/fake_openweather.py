@@ -0,0 +1,300 @@
+"""
+Локальная заглушка OpenWeather API для нагрузочных тестов и бенчмарков.
+
+Запуск: python scripts/fake_openweather.py --port 8090 --latency-ms 150 --rate-429 0.05
+``--key-rpm 60`` — лимит запросов в минуту на ключ (``appid``), сверх него 429 с Retry-After.
+Клиенту указать OW_BASE_URL=http://127.0.0.1:8090 (ключ API может быть любым).
+
+Служебные пути: GET /__stats — число запросов по эндпоинтам, POST /__reset — сброс.
+Только стандартная библиотека, чтобы запускаться в голом python-образе.
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import random
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Any
+from urllib.parse import parse_qs, urlparse
+
+_CODES = [800, 801, 802, 803, 804, 500, 501, 600, 701, 211]
+
+
+def _coords(query: dict[str, str]) -> tuple[float, float]:
+    try:
+        return float(query.get("lat", "55.75")), float(query.get("lon", "37.62"))
+    except ValueError:
+        return 55.75, 37.62
+
+
+def _current(query: dict[str, str]) -> dict[str, Any]:
+    lat, lon = _coords(query)
+    seed = int(abs(lat * 100) + abs(lon * 100))
+    code = _CODES[seed % len(_CODES)]
+    return {
+        "coord": {"lat": lat, "lon": lon},
+        "weather": [{"id": code, "main": "Clouds", "description": "облачно", "icon": "04d"}],
+        "base": "stations",
+        "main": {
+            "temp": round(-5 + seed % 20 + random.random(), 2),
+            "feels_like": round(-8 + seed % 20, 2),
+            "temp_min": -6.0,
+            "temp_max": 14.0,
+            "pressure": 1012,
+            "humidity": 40 + seed % 50,
+        },
+        "visibility": 10000,
+        "wind": {"speed": round(1 + seed % 7 + random.random(), 1), "deg": 180},
+        "clouds": {"all": 75},
+        "dt": int(time.time()),
+        "sys": {"country": "RU", "sunrise": 0, "sunset": 0},
+        "timezone": 10800,
+        "id": seed,
+        "name": f"Город {seed % 1000}",
+        "cod": 200,
+    }
+
+
+def _forecast(query: dict[str, str]) -> dict[str, Any]:
+    lat, lon = _coords(query)
+    start = datetime.now(timezone.utc).replace(minute=0, second=0, microsecond=0)
+    items = []
+    for i in range(40):
+        dt = start + timedelta(hours=3 * i)
+        code = _CODES[(i + int(lat)) % len(_CODES)]
+        items.append({
+            "dt": int(dt.timestamp()),
+            "main": {
+                "temp": round(-3 + (i % 9) + random.random(), 2),
+                "feels_like": round(-6 + (i % 9), 2),
+                "temp_min": -6.0,
+                "temp_max": 9.0,
+                "pressure": 1010,
+                "sea_level": 1010,
+                "grnd_level": 990,
+                "humidity": 70 + i % 25,
+                "temp_kf": 0,
+            },
+            "weather": [{"id": code, "main": "Clouds", "description": "облачно", "icon": "04d"}],
+            "clouds": {"all": 60},
+            "wind": {"speed": 3.4, "deg": 200, "gust": 6.1},
+            "visibility": 10000,
+            "pop": round((i % 5) / 5, 2),
+            "sys": {"pod": "d"},
+            "dt_txt": dt.strftime("%Y-%m-%d %H:%M:%S"),
+        })
+    return {
+        "cod": "200",
+        "message": 0,
+        "cnt": len(items),
+        "list": items,
+        "city": {"id": 1, "name": "Город", "coord": {"lat": lat, "lon": lon}, "country": "RU"},
+    }
+
+
+def _air(query: dict[str, str], hours: int = 1) -> dict[str, Any]:
+    lat, lon = _coords(query)
+    now = int(time.time())
+    items = []
+    for i in range(hours):
+        items.append({
+            "dt": now + i * 3600,
+            "main": {"aqi": 1 + (i % 5)},
+            "components": {
+                "co": 230.0, "no": 0.1, "no2": 20.0 + i % 60, "o3": 60.0 + i % 70,
+                "so2": 2.0, "pm2_5": 8.0 + i % 30, "pm10": 15.0 + i % 40, "nh3": 1.0,
+            },
+        })
+    return {"coord": {"lat": lat, "lon": lon}, "list": items}
+
+
+def _geo_direct(query: dict[str, str]) -> list[dict[str, Any]]:
+    name = query.get("q", "").split(",")[0].strip()
+    if not name or name.lower().startswith("zz"):
+        return []
+    seed = sum(ord(c) for c in name.lower())
+    return [{
+        "name": name.title(),
+        "local_names": {"ru": name.title(), "en": name.title()},
+        "lat": round(40 + seed % 20 + (seed % 97) / 100, 4),
+        "lon": round(20 + seed % 40 + (seed % 89) / 100, 4),
+        "country": "RU",
+    }]
+
+
+def _geo_reverse(query: dict[str, str]) -> list[dict[str, Any]]:
+    lat, lon = _coords(query)
+    seed = int(abs(lat * 10) + abs(lon * 10))
+    return [{
+        "name": f"Place {seed}",
+        "local_names": {"ru": f"Место {seed}", "en": f"Place {seed}"},
+        "lat": lat,
+        "lon": lon,
+        "country": "RU",
+    }]
+
+
+ROUTES = {
+    "/geo/1.0/direct": _geo_direct,
+    "/geo/1.0/reverse": _geo_reverse,
+    "/data/2.5/weather": _current,
+    "/data/2.5/forecast": _forecast,
+    "/data/2.5/air_pollution": _air,
+    "/data/2.5/air_pollution/forecast": lambda q: _air(q, hours=96),
+}
+
+
+class FakeOpenWeather(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(
+        self,
+        address: tuple[str, int],
+        latency_ms: float = 0.0,
+        jitter_ms: float = 0.0,
+        rate_429: float = 0.0,
+        fixtures_dir: str | Path | None = None,
+        key_rpm: int = 0,
+    ) -> None:
+        super().__init__(address, _Handler)
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.rate_429 = rate_429
+        self.key_rpm = key_rpm
+        # appid -> (минута, запросов в ней)
+        self._key_usage: dict[str, tuple[int, int]] = {}
+        self.fixtures: dict[str, Any] = {}
+        if fixtures_dir:
+            # Файл fixtures/data__2.5__forecast.json заменяет ответ /data/2.5/forecast.
+            for path in Path(fixtures_dir).glob("*.json"):
+                route = "/" + path.stem.replace("__", "/")
+                self.fixtures[route] = json.loads(path.read_text(encoding="utf-8"))
+        self.stats: dict[str, int] = {}
+        self._stats_lock = threading.Lock()
+
+    def count(self, key: str) -> None:
+        with self._stats_lock:
+            self.stats[key] = self.stats.get(key, 0) + 1
+
+    def over_quota(self, appid: str) -> int:
+        """Секунд до новой минуты, если ключ исчерпал лимит; 0 — запрос проходит."""
+        if not self.key_rpm:
+            return 0
+        now = time.time()
+        minute = int(now // 60)
+        with self._stats_lock:
+            window, used = self._key_usage.get(appid, (minute, 0))
+            if window != minute:
+                used = 0
+            self._key_usage[appid] = (minute, used + 1)
+        return 0 if used < self.key_rpm else int(60 - now % 60) + 1
+
+    def snapshot(self) -> dict[str, int]:
+        with self._stats_lock:
+            return dict(self.stats)
+
+    def reset(self) -> None:
+        with self._stats_lock:
+            self.stats.clear()
+
+
+class _Handler(BaseHTTPRequestHandler):
+    server: FakeOpenWeather
+    protocol_version = "HTTP/1.1"
+    # Заголовки и тело уходят разными send(): без TCP_NODELAY keep-alive ловит задержку ACK ~40 мс.
+    disable_nagle_algorithm = True
+
+    def log_message(self, format: str, *args: Any) -> None:
+        return
+
+    def _send_json(self, status: int, payload: Any, headers: dict[str, str] | None = None) -> None:
+        body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self) -> None:
+        if self.path == "/__reset":
+            self.server.reset()
+            self._send_json(200, {"ok": True})
+            return
+        self._send_json(404, {"cod": 404, "message": "not found"})
+
+    def do_GET(self) -> None:
+        parsed = urlparse(self.path)
+        if parsed.path == "/__stats":
+            self._send_json(200, self.server.snapshot())
+            return
+
+        route = ROUTES.get(parsed.path)
+        if route is None:
+            self._send_json(404, {"cod": 404, "message": "Internal error"})
+            return
+        query = {k: v[0] for k, v in parse_qs(parsed.query).items()}
+
+        self.server.count(parsed.path)
+        delay = self.server.latency_ms + random.uniform(0, self.server.jitter_ms)
+        if delay > 0:
+            time.sleep(delay / 1000)
+        if self.server.rate_429 and random.random() < self.server.rate_429:
+            self.server.count("429")
+            self._send_json(429, {"cod": 429, "message": "rate limit"})
+            return
+        retry_after = self.server.over_quota(query.get("appid", ""))
+        if retry_after:
+            self.server.count("429")
+            self._send_json(429, {"cod": 429, "message": "rate limit"}, {"Retry-After": str(retry_after)})
+            return
+
+        if parsed.path in self.server.fixtures:
+            self._send_json(200, self.server.fixtures[parsed.path])
+            return
+        self._send_json(200, route(query))
+
+
+def start_server(
+    host: str = "127.0.0.1",
+    port: int = 0,
+    latency_ms: float = 0.0,
+    jitter_ms: float = 0.0,
+    rate_429: float = 0.0,
+    fixtures_dir: str | Path | None = None,
+    key_rpm: int = 0,
+) -> FakeOpenWeather:
+    """Поднять заглушку в фоновом потоке (port=0 — свободный порт)."""
+    server = FakeOpenWeather((host, port), latency_ms, jitter_ms, rate_429, fixtures_dir, key_rpm)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Заглушка OpenWeather API")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8090)
+    parser.add_argument("--latency-ms", type=float, default=100.0, help="задержка каждого ответа")
+    parser.add_argument("--jitter-ms", type=float, default=0.0, help="случайная добавка к задержке")
+    parser.add_argument("--rate-429", type=float, default=0.0, help="доля ответов 429 (0..1)")
+    parser.add_argument("--fixtures", default=None, help="папка с JSON-ответами вместо сгенерированных")
+    parser.add_argument("--key-rpm", type=int, default=0, help="лимит запросов в минуту на ключ (0 — без лимита)")
+    args = parser.parse_args()
+
+    server = FakeOpenWeather(
+        (args.host, args.port), args.latency_ms, args.jitter_ms, args.rate_429, args.fixtures, args.key_rpm
+    )
+    print(f"Fake OpenWeather: http://{args.host}:{server.server_address[1]}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
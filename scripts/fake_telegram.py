@@ -0,0 +1,156 @@
+"""
+Локальная заглушка Telegram Bot API для бенчмарков бота.
+
+Запуск: python scripts/fake_telegram.py --port 8091 --latency-ms 30
+Боту указать ``telebot.apihelper.API_URL = "http://127.0.0.1:8091/bot{0}/{1}"``.
+
+Отвечает ``{"ok": true, ...}`` на любые методы: sendMessage/editMessageText
+возвращают правдоподобное сообщение, остальные — ``true``. Служебные пути:
+GET /__stats — число вызовов по методам, POST /__reset — сброс.
+Только стандартная библиотека.
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any
+from urllib.parse import parse_qs, urlparse
+
+_MESSAGE_METHODS = {"sendMessage", "editMessageText", "sendLocation", "sendPhoto"}
+
+
+def _message(params: dict[str, str]) -> dict[str, Any]:
+    chat_id = int(params.get("chat_id", "1") or 1)
+    return {
+        "message_id": random.randint(1, 1 << 30),
+        "date": int(time.time()),
+        "chat": {"id": chat_id, "type": "private"},
+        "from": {"id": 1, "is_bot": True, "first_name": "bench_bot", "username": "bench_bot"},
+        "text": params.get("text", ""),
+    }
+
+
+class FakeTelegram(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address: tuple[str, int], latency_ms: float = 0.0, jitter_ms: float = 0.0) -> None:
+        super().__init__(address, _Handler)
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.stats: dict[str, int] = {}
+        self._stats_lock = threading.Lock()
+
+    @property
+    def api_url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}/bot{{0}}/{{1}}"
+
+    def count(self, key: str) -> None:
+        with self._stats_lock:
+            self.stats[key] = self.stats.get(key, 0) + 1
+
+    def snapshot(self) -> dict[str, int]:
+        with self._stats_lock:
+            return dict(self.stats)
+
+    def reset(self) -> None:
+        with self._stats_lock:
+            self.stats.clear()
+
+
+class _Handler(BaseHTTPRequestHandler):
+    server: FakeTelegram
+    protocol_version = "HTTP/1.1"
+    # Заголовки и тело уходят разными send(): без TCP_NODELAY keep-alive ловит задержку ACK ~40 мс.
+    disable_nagle_algorithm = True
+
+    def log_message(self, format: str, *args: Any) -> None:
+        return
+
+    def _send_json(self, status: int, payload: Any) -> None:
+        body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _params(self, parsed) -> dict[str, str]:
+        params = {k: v[0] for k, v in parse_qs(parsed.query).items()}
+        length = int(self.headers.get("Content-Length") or 0)
+        if length:
+            raw = self.rfile.read(length).decode("utf-8", "replace")
+            if (self.headers.get("Content-Type") or "").startswith("application/json"):
+                try:
+                    params.update({k: str(v) for k, v in json.loads(raw).items()})
+                except (ValueError, AttributeError):
+                    pass
+            else:
+                params.update({k: v[0] for k, v in parse_qs(raw).items()})
+        return params
+
+    def _handle(self) -> None:
+        parsed = urlparse(self.path)
+        if parsed.path == "/__stats":
+            self._send_json(200, self.server.snapshot())
+            return
+        if parsed.path == "/__reset":
+            self.server.reset()
+            self._send_json(200, {"ok": True})
+            return
+
+        method = parsed.path.rsplit("/", 1)[-1]
+        params = self._params(parsed)
+        self.server.count(method)
+        delay = self.server.latency_ms + random.uniform(0, self.server.jitter_ms)
+        if delay > 0:
+            time.sleep(delay / 1000)
+
+        if method == "getMe":
+            result: Any = {"id": 1, "is_bot": True, "first_name": "bench_bot", "username": "bench_bot"}
+        elif method == "getUpdates":
+            result = []
+        elif method in _MESSAGE_METHODS:
+            result = _message(params)
+        else:
+            result = True
+        self._send_json(200, {"ok": True, "result": result})
+
+    do_GET = _handle
+    do_POST = _handle
+
+
+def start_server(
+    host: str = "127.0.0.1",
+    port: int = 0,
+    latency_ms: float = 0.0,
+    jitter_ms: float = 0.0,
+) -> FakeTelegram:
+    """Поднять заглушку в фоновом потоке (port=0 — свободный порт)."""
+    server = FakeTelegram((host, port), latency_ms, jitter_ms)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Заглушка Telegram Bot API")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8091)
+    parser.add_argument("--latency-ms", type=float, default=30.0, help="задержка каждого ответа")
+    parser.add_argument("--jitter-ms", type=float, default=0.0, help="случайная добавка к задержке")
+    args = parser.parse_args()
+
+    server = FakeTelegram((args.host, args.port), args.latency_ms, args.jitter_ms)
+    print(f"Fake Telegram: {server.api_url}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,192 @@
+"""
+Нагрузочный тест /api/weather (через nginx или напрямую в gunicorn).
+
+Пример (nginx с микрокэшем, API смотрит в заглушку OpenWeather):
+    docker compose -f docker-compose.yml -f docker-compose.loadtest.yml up -d --build
+    python scripts/loadtest.py --url http://127.0.0.1:8081 --clients 50 --requests 5000 \\
+        --upstream-stats http://127.0.0.1:8090/__stats
+
+Запросы перемешивают варианты написания города и координаты с «дрожанием»
+в третьем знаке — чтобы было видно, как нормализация ключа кэша схлопывает их.
+Отчёт: RPS, p50/p99, статусы, X-Cache-Status (HIT = до Flask не дошло)
+и число запросов, дошедших до заглушки OpenWeather.
+
+Проверка модели обслуживания (gthread против sync) — прямо в gunicorn,
+со случайными точками (каждый запрос — промах кэша) и 429 от заглушки:
+    python scripts/fake_openweather.py --port 8090 --latency-ms 200 --rate-429 0.05 &
+    OW_API_KEY=x OW_BASE_URL=http://127.0.0.1:8090 gunicorn -c gunicorn.conf.py miniapp_api:app &
+    python scripts/loadtest.py --url http://127.0.0.1:5000 --mode misses --clients 50,200,400
+"""
+from __future__ import annotations
+
+import argparse
+import http.client
+import json
+import random
+import ssl
+import threading
+import time
+import urllib.request
+from collections import Counter
+from urllib.parse import quote, urlparse
+
+CITY_VARIANTS = [
+    "Москва", "москва", " МОСКВА ", "Москва ",
+    "Санкт-Петербург", "санкт-петербург", "САНКТ-ПЕТЕРБУРГ",
+    "Казань", "казань", "Новосибирск", "новосибирск  ",
+    "Екатеринбург", "Сочи", "сочи",
+]
+
+POINTS = [(55.7558, 37.6173), (59.9386, 30.3141), (55.7963, 49.1088), (43.5855, 39.7231)]
+
+
+def build_paths(count: int, seed: int = 42, mode: str = "mixed") -> list[str]:
+    rnd = random.Random(seed)
+    paths = []
+    for _ in range(count):
+        if mode == "misses":
+            lat, lon = rnd.uniform(-60, 70), rnd.uniform(-180, 180)
+            paths.append(f"/api/weather?lat={lat:.4f}&lon={lon:.4f}")
+            continue
+        if rnd.random() < 0.6:
+            paths.append("/api/weather?city=" + quote(rnd.choice(CITY_VARIANTS)))
+        else:
+            lat, lon = rnd.choice(POINTS)
+            lat += rnd.uniform(-0.002, 0.002)
+            lon += rnd.uniform(-0.002, 0.002)
+            paths.append(f"/api/weather?lat={lat:.5f}&lon={lon:.5f}")
+    return paths
+
+
+def percentile(values: list[float], pct: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    idx = min(int(round(pct / 100 * (len(ordered) - 1))), len(ordered) - 1)
+    return ordered[idx]
+
+
+def _connection(base: str, timeout: float) -> http.client.HTTPConnection:
+    parsed = urlparse(base)
+    if parsed.scheme == "https":
+        return http.client.HTTPSConnection(
+            parsed.hostname, parsed.port or 443, timeout=timeout,
+            context=ssl._create_unverified_context(),
+        )
+    return http.client.HTTPConnection(parsed.hostname, parsed.port or 80, timeout=timeout)
+
+
+def fetch_json(url: str) -> dict:
+    try:
+        with urllib.request.urlopen(url, timeout=5) as resp:
+            return json.loads(resp.read().decode("utf-8"))
+    except (OSError, ValueError):
+        return {}
+
+
+def run(base: str, paths: list[str], clients: int, timeout: float) -> dict:
+    latencies: list[float] = []
+    statuses: Counter[str] = Counter()
+    cache_status: Counter[str] = Counter()
+    lock = threading.Lock()
+    cursor = iter(range(len(paths)))
+    cursor_lock = threading.Lock()
+
+    def worker() -> None:
+        conn = _connection(base, timeout)
+        local_lat: list[float] = []
+        local_status: Counter[str] = Counter()
+        local_cache: Counter[str] = Counter()
+        while True:
+            with cursor_lock:
+                idx = next(cursor, None)
+            if idx is None:
+                break
+            started = time.perf_counter()
+            try:
+                conn.request("GET", paths[idx], headers={"Accept-Encoding": "gzip"})
+                resp = conn.getresponse()
+                resp.read()
+                local_status[str(resp.status)] += 1
+                local_cache[resp.getheader("X-Cache-Status") or "-"] += 1
+            except (OSError, http.client.HTTPException):
+                local_status["error"] += 1
+                conn.close()
+                conn = _connection(base, timeout)
+            local_lat.append(time.perf_counter() - started)
+        conn.close()
+        with lock:
+            latencies.extend(local_lat)
+            statuses.update(local_status)
+            cache_status.update(local_cache)
+
+    started = time.perf_counter()
+    threads = [threading.Thread(target=worker) for _ in range(clients)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - started
+
+    return {
+        "requests": len(latencies),
+        "clients": clients,
+        "elapsed_s": round(elapsed, 3),
+        "rps": round(len(latencies) / elapsed, 1) if elapsed else 0.0,
+        "p50_ms": round(percentile(latencies, 50) * 1000, 2),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 2),
+        "max_ms": round(max(latencies, default=0.0) * 1000, 2),
+        "statuses": dict(statuses),
+        "cache_status": dict(cache_status),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Нагрузочный тест /api/weather")
+    parser.add_argument("--url", default="http://127.0.0.1:8081", help="базовый URL nginx или API")
+    parser.add_argument("--clients", default="50", help="число клиентов или список: 50,200,400")
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--timeout", type=float, default=30.0)
+    parser.add_argument("--upstream-stats", default="", help="URL /__stats заглушки OpenWeather")
+    parser.add_argument(
+        "--mode",
+        choices=["mixed", "misses"],
+        default="mixed",
+        help="mixed — города и точки с повторами; misses — уникальные точки (промахи кэша)",
+    )
+    parser.add_argument("--json", action="store_true", help="вывести отчёт одной JSON-строкой")
+    args = parser.parse_args()
+
+    levels = [int(c) for c in str(args.clients).split(",") if c.strip()]
+    for i, clients in enumerate(levels):
+        if i:
+            print()
+        _run_level(args, clients, seed=42 + i)
+
+
+def _run_level(args: argparse.Namespace, clients: int, seed: int) -> None:
+    before = fetch_json(args.upstream_stats) if args.upstream_stats else {}
+    paths = build_paths(args.requests, seed=seed, mode=args.mode)
+    report = run(args.url.rstrip("/"), paths, clients, args.timeout)
+    if args.upstream_stats:
+        after = fetch_json(args.upstream_stats)
+        report["upstream_calls"] = {k: after.get(k, 0) - before.get(k, 0) for k in after}
+
+    # HIT/STALE/UPDATING обслужены nginx без обращения к Flask.
+    served_by_nginx = sum(report["cache_status"].get(k, 0) for k in ("HIT", "STALE", "UPDATING"))
+    report["offload_ratio"] = round(served_by_nginx / report["requests"], 4) if report["requests"] else 0.0
+
+    if args.json:
+        print(json.dumps(report, ensure_ascii=False))
+        return
+    print(f"Запросов: {report['requests']}  клиентов: {report['clients']}  за {report['elapsed_s']} с")
+    print(f"RPS: {report['rps']}  p50: {report['p50_ms']} мс  p99: {report['p99_ms']} мс  max: {report['max_ms']} мс")
+    print(f"Статусы: {report['statuses']}")
+    print(f"X-Cache-Status: {report['cache_status']}")
+    print(f"Обслужено nginx без Flask: {report['offload_ratio'] * 100:.1f}%")
+    if "upstream_calls" in report:
+        print(f"Запросов в OpenWeather: {report['upstream_calls']}")
+
+
+if __name__ == "__main__":
+    main()
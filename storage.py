@@ -5,6 +5,8 @@ from pathlib import Path
 from threading import Lock
 from typing import Any
 
+from profiling import span
+
 
 class UserStorage:
     """Thread-safe JSON storage for user preferences."""
@@ -12,31 +14,31 @@ class UserStorage:
     def __init__(self, file_path: str | Path = "User_Data.json") -> None:
         self.file_path = Path(file_path)
         self._lock = Lock()
-        self._ensure_file()
-
-    def _ensure_file(self) -> None:
-        if not self.file_path.exists():
-            self.file_path.write_text("{}", encoding="utf-8")
 
     def _read_all(self) -> dict[str, Any]:
-        self._ensure_file()
-        raw = self.file_path.read_text(encoding="utf-8").strip()
-        if not raw:
-            return {}
-        try:
-            data = json.loads(raw)
-            if isinstance(data, dict):
-                return data
-            return {}
-        except json.JSONDecodeError:
-            # Corrupted data should not crash the bot.
-            return {}
+        with span("storage.read"):
+            # Файла ещё нет — пользователей тоже; создаётся при первой записи.
+            try:
+                raw = self.file_path.read_text(encoding="utf-8").strip()
+            except FileNotFoundError:
+                return {}
+            if not raw:
+                return {}
+            try:
+                data = json.loads(raw)
+                if isinstance(data, dict):
+                    return data
+                return {}
+            except json.JSONDecodeError:
+                # Corrupted data should not crash the bot.
+                return {}
 
     def _write_all(self, payload: dict[str, Any]) -> None:
-        self.file_path.write_text(
-            json.dumps(payload, ensure_ascii=False, indent=2),
-            encoding="utf-8",
-        )
+        with span("storage.write"):
+            self.file_path.write_text(
+                json.dumps(payload, ensure_ascii=False, indent=2),
+                encoding="utf-8",
+            )
 
     def load_user(self, user_id: int) -> dict[str, Any]:
         key = str(user_id)
@@ -47,6 +49,16 @@ class UserStorage:
                 return user
             return {}
 
+    def iter_users(self) -> list[tuple[int, dict[str, Any]]]:
+        """Snapshot of all users as (user_id, data)."""
+        with self._lock:
+            users = self._read_all()
+        result = []
+        for key, data in users.items():
+            if isinstance(data, dict) and key.lstrip("-").isdigit():
+                result.append((int(key), data))
+        return result
+
     def save_user(self, user_id: int, data: dict[str, Any]) -> None:
         key = str(user_id)
         with self._lock:
@@ -55,12 +67,19 @@ class UserStorage:
             self._write_all(users)
 
 
-_default_storage = UserStorage()
+_default_storage: UserStorage | None = None
+
+
+def _get_default_storage() -> UserStorage:
+    global _default_storage
+    if _default_storage is None:
+        _default_storage = UserStorage()
+    return _default_storage
 
 
 def load_user(user_id: int) -> dict[str, Any]:
-    return _default_storage.load_user(user_id)
+    return _get_default_storage().load_user(user_id)
 
 
 def save_user(user_id: int, data: dict[str, Any]) -> None:
-    _default_storage.save_user(user_id, data)
+    _get_default_storage().save_user(user_id, data)
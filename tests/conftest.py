@@ -0,0 +1,64 @@
+"""Общие фикстуры: клиент OpenWeather с подменённым сетевым вызовом, кэш — во временном каталоге."""
+from __future__ import annotations
+
+import json
+import os
+import sys
+from collections import Counter
+
+import pytest
+import requests
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from weather_app import WeatherClient  # noqa: E402
+
+CURRENT = {
+    "weather": [{"id": 800, "description": "clear sky"}],
+    "main": {"temp": 12.5, "feels_like": 11.0, "humidity": 60, "pressure": 1012},
+    "wind": {"speed": 3.0},
+    "name": "Москва",
+    "dt": 1_700_000_000,
+}
+FORECAST = {
+    "list": [
+        {
+            "dt": 1_700_000_000 + i * 10800,
+            "dt_txt": f"2023-11-{14 + i // 8:02d} {(i % 8) * 3:02d}:00:00",
+            "main": {"temp": 10.0 + i % 8},
+            "weather": [{"id": 800, "description": "clear sky"}],
+        }
+        for i in range(40)
+    ]
+}
+
+
+class FakeUpstream:
+    """Отвечает вместо OpenWeather и считает вызовы по эндпоинтам."""
+
+    def __init__(self) -> None:
+        self.calls: Counter[str] = Counter()
+
+    def __call__(self, url: str, params: dict, timeout: float) -> requests.Response:
+        endpoint = url.split("://", 1)[-1].split("/", 1)[-1]
+        endpoint = "/" + endpoint
+        self.calls[endpoint] += 1
+        body = FORECAST if endpoint.endswith("/forecast") else CURRENT
+        response = requests.Response()
+        response.status_code = 200
+        response._content = json.dumps(body).encode("utf-8")
+        response.headers["Content-Type"] = "application/json"
+        return response
+
+
+@pytest.fixture
+def upstream() -> FakeUpstream:
+    return FakeUpstream()
+
+
+@pytest.fixture
+def client(tmp_path, monkeypatch, upstream) -> WeatherClient:
+    monkeypatch.chdir(tmp_path)
+    weather = WeatherClient(api_key="test", base_url="http://openweather.test")
+    monkeypatch.setattr(weather, "_fetch", upstream)
+    return weather
@@ -0,0 +1,32 @@
+import pytest
+
+from air_quality import grade_component
+
+NORM, MODERATE, BAD = "✅ Норма", "⚠️ Умеренно", "❌ Плохо"
+
+
+@pytest.mark.parametrize(
+    ("name", "value", "grade"),
+    [
+        # Прежние границы бота: строго меньше — норма, на границе — следующая оценка.
+        ("pm2_5", 11.99, NORM),
+        ("pm2_5", 12, MODERATE),
+        ("pm2_5", 34.99, MODERATE),
+        ("pm2_5", 35, BAD),
+        ("pm10", 19.99, NORM),
+        ("pm10", 20, MODERATE),
+        ("pm10", 50, BAD),
+        ("no2", 39.99, NORM),
+        ("no2", 40, MODERATE),
+        ("no2", 100, BAD),
+        ("o3", 59.99, NORM),
+        ("o3", 60, MODERATE),
+        ("o3", 120, BAD),
+    ],
+)
+def test_bot_component_grades_keep_their_bands(name, value, grade):
+    assert grade_component(name, value)[0] == grade
+
+
+def test_unknown_component():
+    assert grade_component("so2", 1.0) == ("—", "нет данных")
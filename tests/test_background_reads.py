@@ -0,0 +1,21 @@
+from weather_app import metrics
+
+POINT = (55.7512, 37.6184)
+
+
+def _lookups() -> str:
+    return "\n".join(line for line in metrics.render().splitlines() if line.startswith("weather_cache_lookups_total"))
+
+
+def test_background_reads_do_not_count_as_demand_or_lookups(client, upstream):
+    client.get_current_weather(*POINT)
+    demand = client.hot_locations()
+    lookups = _lookups()
+
+    with client.background():
+        assert client.get_current_weather(*POINT)
+    assert client.expiring(*POINT, lead_s=60) == ["/data/2.5/forecast"]
+
+    assert client.hot_locations() == demand
+    assert _lookups() == lookups
+    assert upstream.calls["/data/2.5/weather"] == 1
@@ -0,0 +1,44 @@
+import importlib.util
+from pathlib import Path
+
+import pytest
+
+_spec = importlib.util.spec_from_file_location(
+    "build_static", Path(__file__).resolve().parent.parent / "scripts" / "build_static.py"
+)
+build_static = importlib.util.module_from_spec(_spec)
+_spec.loader.exec_module(build_static)
+
+
+@pytest.fixture
+def src(tmp_path):
+    root = tmp_path / "src"
+    root.mkdir()
+    (root / "index.html").write_text('<script src="app.js"></script>', encoding="utf-8")
+    (root / "app.js").write_text("console.log(1);", encoding="utf-8")
+    return root
+
+
+def test_rebuild_removes_only_previous_build(src, tmp_path):
+    out = tmp_path / "out"
+    build_static.build(src, out)
+    old_js = next(out.glob("app.*.js"))
+    (out / "robots.txt").write_text("keep", encoding="utf-8")
+
+    (src / "app.js").write_text("console.log(2);", encoding="utf-8")
+    build_static.build(src, out)
+
+    assert not old_js.exists()
+    assert (out / "robots.txt").read_text(encoding="utf-8") == "keep"
+    assert len(list(out.glob("app.*.js"))) == 1
+
+
+@pytest.mark.parametrize("where", ["same", "parent", "foreign"])
+def test_refuses_dangerous_output_dir(src, tmp_path, where):
+    out = {"same": src, "parent": tmp_path, "foreign": tmp_path / "foreign"}[where]
+    if where == "foreign":
+        out.mkdir()
+        (out / "notes.txt").write_text("mine", encoding="utf-8")
+    with pytest.raises(ValueError):
+        build_static.build(src, out)
+    assert (src / "app.js").exists()
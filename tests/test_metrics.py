@@ -0,0 +1,19 @@
+from render_cache import RenderCache
+from weather_app import MetricsRegistry
+
+
+def test_collector_refreshes_gauges_on_render():
+    registry = MetricsRegistry()
+    cache = RenderCache(max_entries=4)
+
+    def collect():
+        for name, value in cache.stats().items():
+            registry.set_gauge("bot_render_cache", value, stat=name)
+
+    registry.add_collector(collect)
+    cache.get_or_render(("b", "forecast_menu", "ru"), "v1", lambda: "text")
+    cache.get_or_render(("b", "forecast_menu", "ru"), "v1", lambda: "text")
+
+    text = registry.render()
+    assert 'bot_render_cache{stat="hits"} 1' in text
+    assert 'bot_render_cache{stat="misses"} 1' in text
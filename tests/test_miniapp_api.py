@@ -0,0 +1,23 @@
+from __future__ import annotations
+
+import pytest
+
+import miniapp_api
+
+
+@pytest.fixture
+def api(client, monkeypatch):
+    monkeypatch.setattr(miniapp_api, "_weather_client", client)
+    monkeypatch.setattr(miniapp_api, "_render_cache", None)
+    return miniapp_api.app.test_client()
+
+
+def test_shed_request_does_not_leak_into_next_invalid_city(api, client, monkeypatch):
+    # Gunicorn-поток тот же: состояние last_shed у клиента общее между запросами потока.
+    monkeypatch.setattr(client.upstream_gate, "acquire", lambda wait_s=None: False)
+    assert api.get("/api/weather?lat=10.5&lon=20.5").status_code == 503
+    assert client.last_shed == "busy"
+
+    response = api.get("/api/weather?city=!!!")
+    assert response.status_code == 400
+    assert client.last_shed is None
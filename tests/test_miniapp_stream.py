@@ -0,0 +1,70 @@
+from __future__ import annotations
+
+import pytest
+
+import miniapp_api
+from live_updates import LiveUpdates
+
+
+@pytest.fixture
+def api(client, monkeypatch):
+    monkeypatch.setattr(miniapp_api, "_weather_client", client)
+    monkeypatch.setattr(miniapp_api, "_render_cache", None)
+    # Короткий пинг: без события генератор не висит 15 секунд.
+    hub = LiveUpdates(miniapp_api._live_payload, poll_s=60, heartbeat_s=0.05)
+    monkeypatch.setattr(miniapp_api, "_live_updates", hub)
+    yield miniapp_api.app.test_client()
+    hub.stop()
+
+
+def _first_frames(response, count: int = 2) -> list[bytes]:
+    frames = iter(response.response)
+    try:
+        return [next(frames) for _ in range(count)]
+    finally:
+        response.close()
+
+
+def test_since_etag_from_api_weather_suppresses_initial_event(api, upstream):
+    page = api.get("/api/weather?lat=55.7512&lon=37.6184")
+    etag = page.headers["ETag"].removeprefix("W/").strip('"')
+
+    # Другая точка того же бакета, как у клиента, сдвинувшегося на сотню метров.
+    stream = api.get(f"/api/weather/stream?lat=55.7488&lon=37.6221&since={etag}", buffered=False)
+    assert stream.status_code == 200
+    retry, second = _first_frames(stream)
+    assert retry.startswith(b"retry:")
+    assert second == b": ping\n\n"
+    # Поток читает ту же запись кэша, что и /api/weather: лишних запросов в OpenWeather нет.
+    assert upstream.calls["/data/2.5/weather"] == 1
+    assert upstream.calls["/data/2.5/forecast"] == 1
+
+
+def test_stream_without_since_sends_current_data_with_the_same_etag(api):
+    etag = api.get("/api/weather?lat=55.7512&lon=37.6184").headers["ETag"].removeprefix("W/").strip('"')
+    stream = api.get("/api/weather/stream?lat=55.7512&lon=37.6184", buffered=False)
+    _, event = _first_frames(stream)
+    assert event.startswith(b"event: weather\nid: " + etag.encode("ascii") + b"\n")
+
+
+def test_gzip_and_identity_share_weak_etag(api, upstream):
+    url = "/api/weather?lat=55.7512&lon=37.6184"
+    plain = api.get(url)
+    packed = api.get(url, headers={"Accept-Encoding": "gzip"})
+    assert packed.headers.get("Content-Encoding") == "gzip"
+    assert plain.headers["ETag"].startswith('W/"')
+    assert plain.headers["ETag"] == packed.headers["ETag"]
+    # Копия любого варианта ревалидируется в 304.
+    again = api.get(url, headers={"If-None-Match": packed.headers["ETag"], "Accept-Encoding": "gzip"})
+    assert again.status_code == 304
+
+
+def test_reconnect_prefers_last_event_id_over_stale_since(api):
+    etag = api.get("/api/weather?lat=55.7512&lon=37.6184").headers["ETag"].removeprefix("W/").strip('"')
+    # URL со старым ?since= от первой загрузки, но последнее событие клиент уже получил.
+    stream = api.get(
+        "/api/weather/stream?lat=55.7512&lon=37.6184&since=outdated",
+        headers={"Last-Event-ID": etag},
+        buffered=False,
+    )
+    assert _first_frames(stream)[1] == b": ping\n\n"
@@ -0,0 +1,24 @@
+from weather_app import PersistentMap
+
+
+def test_writers_in_different_processes_keep_each_others_keys(tmp_path):
+    path = tmp_path / "geo_aliases.json"
+    a, b = PersistentMap(path), PersistentMap(path)
+    a.get("warm-up")
+    b.get("warm-up")  # оба прочитали пустой файл до записей
+
+    a.update({"moscow": 1})
+    b.update({"paris": 2})
+
+    assert PersistentMap(path)._load() == {"moscow": 1, "paris": 2}
+    assert b.get("moscow") == 1
+
+
+def test_full_map_evicts_oldest_entries(tmp_path):
+    cache = PersistentMap(tmp_path / "geo_reverse.json", max_entries=2)
+    cache.update({"a": 1})
+    cache.update({"b": 2})
+    cache.update({"c": 3})
+
+    assert cache.get("a") is None
+    assert PersistentMap(cache.path)._load() == {"b": 2, "c": 3}
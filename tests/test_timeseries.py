@@ -0,0 +1,26 @@
+from __future__ import annotations
+
+from timeseries import ObservationStore
+
+
+def test_series_is_time_ordered_after_the_ring_wraps(tmp_path):
+    store = ObservationStore(tmp_path / "obs.bin", slots=4, capacity=8, min_interval_s=0)
+    for i in range(20):
+        assert store.record("55.75,37.62", 1000.0 + i * 600, temp=float(i))
+    series = store.series("55.75,37.62")
+    assert series["ts"] == sorted(series["ts"])
+    assert series["temp"] == [float(i) for i in range(12, 20)]
+    assert store.nearest("55.75,37.62", 1000.0 + 15 * 600 + 100)["temp"] == 15.0
+
+
+def test_reader_does_not_resize_a_file_with_another_layout(tmp_path):
+    path = tmp_path / "obs.bin"
+    writer = ObservationStore(path, slots=4, capacity=8, min_interval_s=0)
+    writer.record("55.75,37.62", 1000.0, temp=1.0)
+    writer.close()
+    size = path.stat().st_size
+
+    reader = ObservationStore(path, slots=16, capacity=32)
+    assert reader.series("55.75,37.62") == {name: [] for name in reader.series("x")}
+    assert path.stat().st_size == size
+    assert ObservationStore(path, slots=4, capacity=8).series("55.75,37.62")["temp"] == [1.0]
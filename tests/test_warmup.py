@@ -0,0 +1,83 @@
+from __future__ import annotations
+
+import json
+import time
+
+from warmup import CacheWarmer
+from weather_app import WeatherClient
+
+POINT = (55.7512, 37.6184)
+CENTER = (55.75, 37.62)
+
+
+def _age_cache(client: WeatherClient, seconds: float) -> None:
+    """Сдвинуть время создания всех записей кэша назад."""
+    for path in client.cache.cache_dir.glob("*.json"):
+        try:
+            entry = json.loads(path.read_text(encoding="utf-8"))
+        except ValueError:
+            continue
+        if isinstance(entry, dict) and "created_at" in entry:
+            entry["created_at"] -= seconds
+            path.write_text(json.dumps(entry), encoding="utf-8")
+
+
+def test_point_requested_a_few_times_is_refreshed_before_expiry(client, upstream):
+    for _ in range(3):
+        client.get_current_weather(*POINT)
+        client.get_forecast_5d3h(*POINT)
+    assert upstream.calls["/data/2.5/weather"] == 1
+
+    warmer = CacheWarmer(client, interval_s=30, lead_s=60, rate_per_s=0)
+    ttl = client.cache.ttl_seconds
+    # Проходы планировщика раз в 30 с до окна обновления: счётчик не должен обнулиться.
+    start = time.monotonic()
+    for step in range(1, int((ttl - warmer.lead_s) // warmer.interval_s) + 1):
+        client.decay_demand(warmer.demand_half_life_s, now=start + step * warmer.interval_s)
+    assert [point for point, _ in client.hot_locations()] == [CENTER]
+
+    _age_cache(client, ttl - warmer.lead_s + 1)
+    assert warmer.run_once() == 2
+    assert warmer.refreshed == 2
+    assert upstream.calls["/data/2.5/weather"] == 2
+    assert upstream.calls["/data/2.5/forecast"] == 2
+
+
+def test_demand_decays_by_time_not_by_pass_count(client):
+    client.get_current_weather(*POINT)
+    start = time.monotonic()
+    for step in range(1, 100):
+        client.decay_demand(3600, now=start + step)
+    assert client.hot_locations()
+    client.decay_demand(3600, now=start + 3 * 3600)
+    assert client.hot_locations() == []
+
+
+def test_only_one_warmer_refreshes_and_sees_other_workers_demand(client, upstream):
+    leader = CacheWarmer(client, rate_per_s=0)
+    assert leader.is_leader()
+
+    other = WeatherClient(api_key="test", base_url="http://openweather.test")
+    other._fetch = upstream
+    follower = CacheWarmer(other, rate_per_s=0)
+    # Как у воркера с другим pid.
+    follower.demand_path = follower.demand_dir / "other-worker.json"
+    other.get_current_weather(*POINT)
+    # Второй процесс блокировку не получает и только выкладывает свои счётчики.
+    assert follower.run_pass() == 0
+    assert not follower.stats()["leader"]
+
+    assert CENTER in leader.ranked_locations()
+    calls_before = upstream.calls["/data/2.5/weather"]
+    assert leader.run_once() >= 1
+    assert upstream.calls["/data/2.5/forecast"] == 1
+    assert upstream.calls["/data/2.5/weather"] == calls_before
+
+
+def test_bot_and_api_warmers_sharing_cache_both_lead(client):
+    api = CacheWarmer(client, rate_per_s=0, role="api")
+    bot = CacheWarmer(client, rate_per_s=0, role="bot")
+    assert api.is_leader()
+    # Блокировка API не мешает прогреву сохранённых точек бота.
+    assert bot.is_leader()
+    assert api.demand_dir != bot.demand_dir
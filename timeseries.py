@@ -0,0 +1,276 @@
+"""
+Хранилище наблюдений погоды по локациям — тренды без лишних запросов в OpenWeather.
+
+Каждый успешный запрос текущей погоды попутно записывает наблюдение (время,
+температура, ощущается, влажность, ветер, код погоды) в кольцевой буфер своего
+бакета локации (``weather_app.location_bucket``). Буферы лежат в одном memory-mapped файле
+фиксированного размера: заголовок файла, затем ``slots`` слотов по ``capacity``
+записей. Внутри слота данные хранятся колонками (массив времени, массив
+температур, ...), так что выборка за интервал — бинарный поиск по колонке
+времени и срезы остальных колонок.
+
+Файл общий для процессов с одним каталогом кэша — воркеров gunicorn в контейнере
+API; у бота свой контейнер и свой файл. Запись и выделение слотов идут под
+эксклюзивным ``flock``, чтение — под разделяемым: кольцо, которое как раз
+переписывается, не читается наполовину. Когда слоты кончаются, вытесняется
+локация, которую дольше всех не обновляли.
+"""
+from __future__ import annotations
+
+import math
+import mmap
+import os
+import threading
+import time
+from bisect import bisect_left, bisect_right
+from contextlib import contextmanager
+from pathlib import Path
+from struct import Struct
+from typing import Any, Iterator
+
+try:
+    import fcntl
+except ImportError:  # Windows: остаётся только блокировка внутри процесса
+    fcntl = None  # type: ignore[assignment]
+
+_MAGIC = b"OWOBS\0\0\1"
+_FILE_HEADER = Struct("<8sII")  # magic, slots, capacity
+_FILE_HEADER_SIZE = 64
+_SLOT_HEADER = Struct("<24sIId")  # bucket, head (следующая позиция записи), count, время последней записи
+_EMPTY_KEY = b"\0" * 24
+
+# Колонки слота: имя и формат элемента (array/memoryview). Время — float64, значения — float32.
+COLUMNS: tuple[tuple[str, str], ...] = (
+    ("ts", "d"),
+    ("temp", "f"),
+    ("feels_like", "f"),
+    ("humidity", "f"),
+    ("wind_speed", "f"),
+    ("code", "H"),
+)
+_ITEM_SIZE = {"d": 8, "f": 4, "H": 2}
+
+
+class ObservationStore:
+    """Per-location ring buffers of weather observations in one memory-mapped file."""
+
+    def __init__(
+        self,
+        path: str | Path,
+        slots: int = 1024,
+        capacity: int = 288,
+        min_interval_s: float = 300.0,
+    ) -> None:
+        self.path = Path(path)
+        self.slots = max(int(slots), 1)
+        # 288 записей при шаге ~10 минут (TTL кэша) — двое суток истории на локацию.
+        self.capacity = max(int(capacity), 2)
+        # Чаще этого наблюдения одной локации не пишутся: прогрев и повторы не раздувают буфер.
+        self.min_interval_s = min_interval_s
+        self._column_offsets: dict[str, int] = {}
+        offset = _SLOT_HEADER.size
+        for name, fmt in COLUMNS:
+            self._column_offsets[name] = offset
+            offset += _ITEM_SIZE[fmt] * self.capacity
+        self._slot_size = (offset + 7) // 8 * 8
+        self._size = _FILE_HEADER_SIZE + self.slots * self._slot_size
+        self._index: dict[bytes, int] = {}
+        self._lock = threading.Lock()
+        self._fd: int | None = None
+        self._mm: mmap.mmap | None = None
+
+    def _open(self, create: bool) -> mmap.mmap | None:
+        """Отобразить файл в память; до первой записи файл не создаётся.
+
+        Без ``create`` существующий файл не меняется: файл другой разметки (или чужой) — просто None.
+        """
+        if self._mm is not None:
+            return self._mm
+        with self._lock:
+            if self._mm is not None:
+                return self._mm
+            if not create and not self.path.exists():
+                return None
+            if create:
+                self.path.parent.mkdir(parents=True, exist_ok=True)
+            try:
+                fd = os.open(self.path, os.O_RDWR | (os.O_CREAT if create else 0), 0o644)
+            except FileNotFoundError:
+                return None
+            try:
+                header = _FILE_HEADER.pack(_MAGIC, self.slots, self.capacity)
+                with self._file_lock(fd, shared=not create):
+                    foreign = os.fstat(fd).st_size != self._size or os.pread(fd, _FILE_HEADER.size, 0) != header
+                    if foreign and create:
+                        # Новый файл или другая разметка (сменили slots/capacity): начинаем с пустого.
+                        os.ftruncate(fd, 0)
+                        os.ftruncate(fd, self._size)
+                        os.pwrite(fd, header, 0)
+                if foreign and not create:
+                    os.close(fd)
+                    return None
+                self._mm = mmap.mmap(fd, self._size)
+            except BaseException:
+                os.close(fd)
+                raise
+            self._fd = fd
+            return self._mm
+
+    @contextmanager
+    def _file_lock(self, fd: int | None = None, shared: bool = False) -> Iterator[None]:
+        # flock действует на открытый файл, а не на поток: внутри процесса его дополняет self._lock.
+        fd = self._fd if fd is None else fd
+        if fcntl is None or fd is None:
+            yield
+            return
+        fcntl.flock(fd, fcntl.LOCK_SH if shared else fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(fd, fcntl.LOCK_UN)
+
+    def close(self) -> None:
+        with self._lock:
+            if self._mm is not None:
+                self._mm.close()
+                self._mm = None
+            if self._fd is not None:
+                os.close(self._fd)
+                self._fd = None
+            self._index.clear()
+
+    @staticmethod
+    def _key(bucket: str) -> bytes:
+        return bucket.encode("ascii")[:24].ljust(24, b"\0")
+
+    def _slot_offset(self, slot: int) -> int:
+        return _FILE_HEADER_SIZE + slot * self._slot_size
+
+    def _column(self, mm: mmap.mmap, slot: int, name: str, fmt: str) -> memoryview:
+        start = self._slot_offset(slot) + self._column_offsets[name]
+        return memoryview(mm)[start:start + _ITEM_SIZE[fmt] * self.capacity].cast(fmt)
+
+    def _find_slot(self, mm: mmap.mmap, key: bytes, create: bool) -> int | None:
+        """Слот локации; с create=True — занять свободный или вытеснить самый давний (под flock)."""
+        slot = self._index.get(key)
+        # Индекс локальный для процесса: слот мог достаться другой локации в соседнем процессе.
+        if slot is not None and mm[self._slot_offset(slot):self._slot_offset(slot) + 24] == key:
+            return slot
+        self._index.pop(key, None)
+        free = oldest = None
+        oldest_ts = math.inf
+        for i in range(self.slots):
+            slot_key, _, _, last_ts = _SLOT_HEADER.unpack_from(mm, self._slot_offset(i))
+            if slot_key == key:
+                self._index[key] = i
+                return i
+            if slot_key == _EMPTY_KEY:
+                if free is None:
+                    free = i
+            elif last_ts < oldest_ts:
+                oldest, oldest_ts = i, last_ts
+        if not create:
+            return None
+        slot = free if free is not None else oldest
+        if slot is None:
+            return None
+        _SLOT_HEADER.pack_into(mm, self._slot_offset(slot), key, 0, 0, 0.0)
+        self._index[key] = slot
+        return slot
+
+    def record(
+        self,
+        bucket: str,
+        ts: float,
+        temp: float | None,
+        feels_like: float | None = None,
+        humidity: float | None = None,
+        wind_speed: float | None = None,
+        code: int | None = None,
+    ) -> bool:
+        """Записать наблюдение; False — слишком рано после предыдущего (или файл недоступен)."""
+        values = (
+            float(ts),
+            *(math.nan if v is None else float(v) for v in (temp, feels_like, humidity, wind_speed)),
+            int(code or 0) & 0xFFFF,
+        )
+        key = self._key(bucket)
+        try:
+            mm = self._open(create=True)
+            with self._lock, self._file_lock():
+                slot = self._find_slot(mm, key, create=True)
+                if slot is None:
+                    return False
+                offset = self._slot_offset(slot)
+                _, head, count, last_ts = _SLOT_HEADER.unpack_from(mm, offset)
+                if count and ts < last_ts + self.min_interval_s:
+                    return False
+                for (name, fmt), value in zip(COLUMNS, values):
+                    self._column(mm, slot, name, fmt)[head] = value
+                _SLOT_HEADER.pack_into(
+                    mm, offset, key, (head + 1) % self.capacity, min(count + 1, self.capacity), float(ts)
+                )
+        except (OSError, ValueError):
+            return False
+        return True
+
+    def record_current(self, bucket: str, data: dict[str, Any]) -> bool:
+        """Записать наблюдение из ответа /data/2.5/weather (сырого или проекции)."""
+        main = data.get("main") if isinstance(data.get("main"), dict) else {}
+        if main.get("temp") is None:
+            return False
+        wind = data.get("wind") if isinstance(data.get("wind"), dict) else {}
+        weather = data.get("weather") or [{}]
+        code = weather[0].get("id") if isinstance(weather[0], dict) else None
+        return self.record(
+            bucket,
+            float(data.get("dt") or time.time()),
+            main.get("temp"),
+            main.get("feels_like"),
+            main.get("humidity"),
+            wind.get("speed"),
+            code,
+        )
+
+    def series(
+        self, bucket: str, since: float | None = None, until: float | None = None
+    ) -> dict[str, list[float]]:
+        """Наблюдения локации за [since, until] в порядке времени: колонка -> значения (NaN — нет данных)."""
+        result: dict[str, list[float]] = {name: [] for name, _ in COLUMNS}
+        mm = self._open(create=False)
+        if mm is None:
+            return result
+        key = self._key(bucket)
+        # Под разделяемой блокировкой: запись в соседнем процессе не сдвинет кольцо посреди чтения.
+        with self._lock, self._file_lock(shared=True):
+            slot = self._find_slot(mm, key, create=False)
+            if slot is None:
+                return result
+            slot_key, head, count, _ = _SLOT_HEADER.unpack_from(mm, self._slot_offset(slot))
+            if slot_key != key or not count:
+                return result
+            start = (head - count) % self.capacity
+
+            def ordered(column: memoryview) -> list[float]:
+                if start + count <= self.capacity:
+                    return column[start:start + count].tolist()
+                return column[start:].tolist() + column[:head].tolist()
+
+            ts = ordered(self._column(mm, slot, "ts", "d"))
+            lo = bisect_left(ts, since) if since is not None else 0
+            hi = bisect_right(ts, until) if until is not None else len(ts)
+            if lo >= hi:
+                return result
+            result["ts"] = ts[lo:hi]
+            for name, fmt in COLUMNS[1:]:
+                result[name] = ordered(self._column(mm, slot, name, fmt))[lo:hi]
+        return result
+
+    def nearest(self, bucket: str, ts: float, max_gap_s: float = 1800.0) -> dict[str, float] | None:
+        """Наблюдение, ближайшее ко времени ts (не дальше max_gap_s), или None."""
+        window = self.series(bucket, since=ts - max_gap_s, until=ts + max_gap_s)
+        times = window["ts"]
+        if not times:
+            return None
+        best = min(range(len(times)), key=lambda i: abs(times[i] - ts))
+        return {name: values[best] for name, values in window.items()}
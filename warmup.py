@@ -0,0 +1,235 @@
+"""
+Прогрев кэша OpenWeather и упреждающее обновление популярных точек.
+
+При старте (``warm_up``) подтягиваются отсутствующие в кэше точки сохранённых
+пользователей. Дальше раз в ``interval_s`` планировщик проходит по точкам,
+ранжированным по числу запросов (``WeatherClient.hot_locations``) плюс
+подписчики уведомлений, и перезапрашивает записи, которым до истечения TTL
+осталось меньше ``lead_s``. Запросы в OpenWeather ограничены ``rate_per_s``,
+так что прогрев не съедает лимит API, нужный живым пользователям.
+
+Число запросов к точке затухает со временем (период полураспада
+``demand_half_life_s``), а не за проход: точку, которую спросили несколько раз,
+обновляют ещё долго после того, как её запись вышла из TTL.
+
+В API у каждого воркера gunicorn свой клиент и свой планировщик, но обновляет
+кэш только один — тот, кто держит ``flock`` на ``warmer.lock`` в каталоге
+кэша (умер — блокировку на следующем проходе берёт другой). Остальные раз в
+проход выкладывают свои счётчики в ``demand/<pid>.json``, и ведущий складывает
+их со своими: ранжирование видит запросы всех воркеров.
+"""
+from __future__ import annotations
+
+import json
+import os
+import threading
+import time
+from typing import Any
+
+try:
+    import fcntl
+except ImportError:  # не POSIX: один процесс — сам себе ведущий
+    fcntl = None  # type: ignore[assignment]
+
+from storage import UserStorage
+from weather_app import WeatherClient, bucket_center
+
+# Подписчик уведомлений важнее случайного запроса: его точку запросят наверняка.
+SUBSCRIBER_WEIGHT = 10
+
+
+class CacheWarmer:
+    """Background job that keeps the OpenWeather cache warm for known locations."""
+
+    def __init__(
+        self,
+        client: WeatherClient,
+        storage: UserStorage | None = None,
+        lead_s: float = 60,
+        interval_s: float = 30,
+        rate_per_s: float = 2.0,
+        max_locations: int = 200,
+        demand_half_life_s: float = 3600,
+        role: str = "api",
+    ) -> None:
+        self.client = client
+        self.role = role
+        self.storage = storage
+        self.interval_s = max(interval_s, 1.0)
+        # Запись должна дожить до следующего прохода, иначе обновление опоздает.
+        self.lead_s = max(lead_s, self.interval_s)
+        self.min_gap_s = 1.0 / rate_per_s if rate_per_s > 0 else 0.0
+        self.max_locations = max_locations
+        self.demand_half_life_s = demand_half_life_s
+        # Блокировка и счётчики — на роль: бот и API могут делить один .cache (запуск без Docker),
+        # и у каждого свой источник спроса (сохранённые точки бота и запросы к API).
+        self.lock_path = client.cache.cache_dir / f"warmer-{role}.lock"
+        self.demand_dir = client.cache.cache_dir / "demand" / role
+        self.demand_path = self.demand_dir / f"{os.getpid()}.json"
+        self._lock_fd: int | None = None
+        self._stop = threading.Event()
+        self._thread: threading.Thread | None = None
+        self._last_call = 0.0
+        self.warmed_up = 0
+        self.refreshed = 0
+        self.failed = 0
+
+    def is_leader(self) -> bool:
+        """Этот процесс обновляет кэш: держит (или только что взял) блокировку warmer-<role>.lock."""
+        if self._lock_fd is not None or fcntl is None:
+            return True
+        try:
+            self.lock_path.parent.mkdir(parents=True, exist_ok=True)
+            fd = os.open(self.lock_path, os.O_RDWR | os.O_CREAT, 0o644)
+        except OSError:
+            return False
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            os.close(fd)
+            return False
+        # Блокировка живёт, пока открыт fd, — до конца процесса.
+        self._lock_fd = fd
+        return True
+
+    def export_demand(self) -> None:
+        """Выложить счётчики этого процесса для ведущего."""
+        snapshot = [[lat, lon, score] for (lat, lon), score in self.client.hot_locations(self.max_locations)]
+        tmp_path = self.demand_path.with_suffix(".tmp")
+        try:
+            self.demand_dir.mkdir(parents=True, exist_ok=True)
+            tmp_path.write_text(json.dumps(snapshot), encoding="utf-8")
+            os.replace(tmp_path, self.demand_path)
+        except OSError:
+            pass
+
+    def _shared_demand(self) -> dict[tuple[float, float], float]:
+        """Счётчики других процессов; снимки старше трёх проходов (воркер умер) удаляются."""
+        scores: dict[tuple[float, float], float] = {}
+        if not self.demand_dir.is_dir():
+            return scores
+        horizon = time.time() - 3 * self.interval_s
+        for path in self.demand_dir.glob("*.json"):
+            try:
+                # Свой снимок (процесс был ведомым) — уже в hot_locations.
+                if path == self.demand_path or path.stat().st_mtime < horizon:
+                    path.unlink()
+                    continue
+                snapshot = json.loads(path.read_text(encoding="utf-8"))
+            except (OSError, ValueError):
+                continue
+            for lat, lon, score in snapshot if isinstance(snapshot, list) else []:
+                key = (float(lat), float(lon))
+                scores[key] = scores.get(key, 0.0) + float(score)
+        return scores
+
+    def _user_locations(self) -> dict[tuple[float, float], float]:
+        if self.storage is None:
+            return {}
+        scores: dict[tuple[float, float], float] = {}
+        for _, user in self.storage.iter_users():
+            lat, lon = user.get("lat"), user.get("lon")
+            if not isinstance(lat, (int, float)) or not isinstance(lon, (int, float)):
+                continue
+            notifications = user.get("notifications") or {}
+            weight = SUBSCRIBER_WEIGHT if notifications.get("enabled") else 1
+            key = bucket_center(lat, lon)
+            scores[key] = scores.get(key, 0) + weight
+        return scores
+
+    def ranked_locations(self) -> list[tuple[float, float]]:
+        """Точки для обновления: по убыванию (запросы всех процессов + вес сохранённых пользователей)."""
+        scores = self._user_locations()
+        for point, count in self._shared_demand().items():
+            scores[point] = scores.get(point, 0) + count
+        for point, count in self.client.hot_locations(self.max_locations):
+            scores[point] = scores.get(point, 0) + count
+        ranked = sorted(scores, key=scores.get, reverse=True)
+        return ranked[: self.max_locations]
+
+    def _throttle(self) -> None:
+        wait = self._last_call + self.min_gap_s - time.monotonic()
+        if wait > 0:
+            self._stop.wait(wait)
+        self._last_call = time.monotonic()
+
+    def run_once(self, lead_s: float | None = None) -> int:
+        """Один проход: обновить истекающие записи. Возвращает число запросов в OpenWeather."""
+        lead = self.lead_s if lead_s is None else lead_s
+        calls = 0
+        for lat, lon in self.ranked_locations():
+            for endpoint in self.client.expiring(lat, lon, lead):
+                if self._stop.is_set():
+                    return calls
+                self._throttle()
+                calls += 1
+                if self.client.refresh(endpoint, lat, lon):
+                    self.refreshed += 1
+                else:
+                    self.failed += 1
+        return calls
+
+    def warm_up(self) -> int:
+        """Подтянуть только отсутствующие записи (после деплоя/рестарта)."""
+        return self.run_once(lead_s=0)
+
+    def run_pass(self) -> int:
+        """Проход планировщика: ведущий обновляет кэш, остальные выкладывают свои счётчики."""
+        self.client.decay_demand(self.demand_half_life_s)
+        if not self.is_leader():
+            self.export_demand()
+            return 0
+        return self.run_once()
+
+    def _loop(self) -> None:
+        # Прогрев — оптимизация: его сбой не должен ронять бота или API.
+        try:
+            if self.is_leader():
+                self.warmed_up = self.warm_up()
+        except Exception:
+            pass
+        while not self._stop.wait(self.interval_s):
+            try:
+                self.run_pass()
+            except Exception:
+                pass
+
+    def start(self) -> None:
+        if self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._loop, name="cache-warmer", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+
+    def stats(self) -> dict[str, Any]:
+        return {
+            "role": self.role,
+            "leader": self._lock_fd is not None or fcntl is None,
+            "warmed_up": self.warmed_up,
+            "refreshed": self.refreshed,
+            "failed": self.failed,
+        }
+
+
+def start_cache_warmer(
+    client: WeatherClient,
+    storage: UserStorage | None = None,
+    role: str = "api",
+) -> CacheWarmer | None:
+    """Запустить прогрев с настройками из окружения; None, если CACHE_WARMER=0."""
+    if os.getenv("CACHE_WARMER", "1").strip().lower() in ("0", "off", "false", "no"):
+        return None
+    warmer = CacheWarmer(
+        client,
+        storage=storage,
+        lead_s=float(os.getenv("WARMUP_LEAD_S", "60")),
+        interval_s=float(os.getenv("WARMUP_INTERVAL_S", "30")),
+        rate_per_s=float(os.getenv("WARMUP_RATE", "2")),
+        max_locations=int(os.getenv("WARMUP_MAX_LOCATIONS", "200")),
+        demand_half_life_s=float(os.getenv("WARMUP_DEMAND_HALF_LIFE_S", "3600")),
+        role=role,
+    )
+    warmer.start()
+    return warmer
@@ -3,14 +3,171 @@ from __future__ import annotations
 import hashlib
 import json
 import os
+import threading
 import time
+from bisect import bisect_left
+from collections import Counter
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from contextlib import contextmanager
 from pathlib import Path
-from typing import Any
+from typing import TYPE_CHECKING, Any, Callable, Iterator
 
-import requests
-from dotenv import load_dotenv
+from air_quality import air_status, score_components
+from gazetteer import Gazetteer, get_gazetteer, normalize_name, split_query, transliterate
+from profiling import span
+from timeseries import ObservationStore
 
-load_dotenv()
+try:
+    import fcntl
+except ImportError:  # Windows: остаётся только блокировка внутри процесса
+    fcntl = None  # type: ignore[assignment]
+
+if TYPE_CHECKING:
+    from http.server import ThreadingHTTPServer
+
+    import requests
+
+# Модуль импортируется без побочных эффектов: .env, клиент по умолчанию, каталог кэша
+# и тяжёлые зависимости (requests, http.server) — при первом использовании.
+
+
+def _escape_label(value: Any) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(labels: tuple[tuple[str, str], ...], extra: str = "") -> str:
+    parts = [f'{k}="{_escape_label(v)}"' for k, v in labels]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+class MetricsRegistry:
+    """In-process counters, gauges and latency histograms rendered in Prometheus text format."""
+
+    DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+    def __init__(self, buckets: tuple[float, ...] = DEFAULT_BUCKETS) -> None:
+        self.buckets = tuple(sorted(buckets))
+        self._lock = threading.Lock()
+        self._help: dict[str, str] = {}
+        self._counters: dict[str, dict[tuple, float]] = {}
+        self._gauges: dict[str, dict[tuple, float]] = {}
+        # name -> labels -> [счётчики по корзинам (+Inf последней), сумма, количество]
+        self._histograms: dict[str, dict[tuple, list]] = {}
+        self._collectors: list[Callable[[], None]] = []
+
+    def describe(self, name: str, help_text: str) -> None:
+        self._help[name] = help_text
+
+    def inc(self, name: str, value: float = 1.0, **labels: Any) -> None:
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            series = self._counters.setdefault(name, {})
+            series[key] = series.get(key, 0.0) + value
+
+    def set_gauge(self, name: str, value: float, **labels: Any) -> None:
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            self._gauges.setdefault(name, {})[key] = float(value)
+
+    def observe(self, name: str, value: float, **labels: Any) -> None:
+        key = tuple(sorted(labels.items()))
+        idx = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._histograms.setdefault(name, {})
+            state = series.get(key)
+            if state is None:
+                state = series[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            state[0][idx] += 1
+            state[1] += value
+            state[2] += 1
+
+    @contextmanager
+    def timer(self, name: str, **labels: Any) -> Iterator[None]:
+        """Observe the duration of the ``with`` block in seconds."""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - started, **labels)
+
+    def add_collector(self, collect: Callable[[], None]) -> None:
+        """Call ``collect`` before every render, e.g. to refresh gauges from live objects."""
+        self._collectors.append(collect)
+
+    def render(self) -> str:
+        for collect in self._collectors:
+            collect()
+        lines: list[str] = []
+        with self._lock:
+            for kind, store in (("counter", self._counters), ("gauge", self._gauges)):
+                for name in sorted(store):
+                    if name in self._help:
+                        lines.append(f"# HELP {name} {self._help[name]}")
+                    lines.append(f"# TYPE {name} {kind}")
+                    for labels, value in store[name].items():
+                        lines.append(f"{name}{_format_labels(labels)} {value:g}")
+            for name in sorted(self._histograms):
+                if name in self._help:
+                    lines.append(f"# HELP {name} {self._help[name]}")
+                lines.append(f"# TYPE {name} histogram")
+                for labels, (counts, total, count) in self._histograms[name].items():
+                    cumulative = 0
+                    for bound, bucket_count in zip((*self.buckets, "+Inf"), counts):
+                        cumulative += bucket_count
+                        le = bound if isinstance(bound, str) else f"{bound:g}"
+                        bucket_labels = _format_labels(labels, 'le="' + le + '"')
+                        lines.append(f"{name}_bucket{bucket_labels} {cumulative}")
+                    lines.append(f"{name}_sum{_format_labels(labels)} {total:g}")
+                    lines.append(f"{name}_count{_format_labels(labels)} {count}")
+        return "\n".join(lines) + "\n"
+
+
+# Общий реестр процесса: клиент OpenWeather, бот и API пишут сюда.
+metrics = MetricsRegistry()
+metrics.describe("weather_cache_lookups_total", "OpenWeather file cache lookups by result")
+metrics.describe("weather_upstream_requests_total", "Requests to OpenWeather by endpoint and HTTP status")
+metrics.describe("weather_upstream_seconds", "OpenWeather request latency")
+metrics.describe("weather_upstream_throttled_total", "HTTP 429 responses from OpenWeather")
+metrics.describe("weather_negative_cache_hits_total", "Requests answered from the negative cache")
+metrics.describe("weather_geocode_local_total", "Geocoding answered without OpenWeather")
+metrics.describe("weather_upstream_hedged_total", "Hedged duplicate requests sent to OpenWeather")
+metrics.describe("weather_deadline_exceeded_total", "OpenWeather calls abandoned because the caller's deadline ran out")
+metrics.describe("weather_circuit_rejected_total", "OpenWeather calls skipped while the circuit breaker is open")
+metrics.describe("weather_api_key_requests_total", "OpenWeather requests per API key (masked)")
+metrics.describe("weather_api_key_throttled_total", "HTTP 429 responses per API key (masked)")
+metrics.describe("weather_circuit_open", "1 while the OpenWeather circuit breaker is open")
+metrics.describe("weather_circuit_opened_total", "Times the OpenWeather circuit breaker opened")
+metrics.describe("admission_shed_total", "Calls rejected by an admission gate (queue full or queue-time deadline)")
+metrics.describe("admission_queue_seconds", "Time spent waiting for an admission gate slot")
+metrics.describe("admission_in_flight", "Calls holding an admission gate slot")
+metrics.describe("weather_stale_served_total", "Expired cache entries served because OpenWeather failed")
+
+
+def start_metrics_server(port: int, host: str = "127.0.0.1") -> ThreadingHTTPServer:
+    """Serve ``metrics`` at http://host:port/metrics from a daemon thread."""
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def log_message(self, format: str, *args: Any) -> None:
+            return
+
+        def do_GET(self) -> None:
+            if self.path.split("?")[0] not in ("/metrics", "/"):
+                self.send_error(404)
+                return
+            body = metrics.render().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+    server = ThreadingHTTPServer((host, port), MetricsHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="metrics", daemon=True).start()
+    return server
 
 
 class OpenWeatherCache:
@@ -18,104 +175,932 @@ class OpenWeatherCache:
 
     def __init__(self, cache_dir: str | Path = ".cache", ttl_seconds: int = 600) -> None:
         self.cache_dir = Path(cache_dir)
-        self.cache_dir.mkdir(parents=True, exist_ok=True)
         self.ttl_seconds = ttl_seconds
+        # Каталог создаётся при первой записи, а не при импорте/создании клиента.
+        self._dir_ready = False
 
     def _cache_file(self, key: str) -> Path:
         digest = hashlib.sha256(key.encode("utf-8")).hexdigest()
         return self.cache_dir / f"{digest}.json"
 
     def get(self, key: str) -> Any | None:
-        file_path = self._cache_file(key)
-        if not file_path.exists():
+        entry = self.get_entry(key)
+        if entry is None:
             return None
-        try:
-            payload = json.loads(file_path.read_text(encoding="utf-8"))
-            created_at = float(payload.get("created_at", 0))
-            if time.time() - created_at > self.ttl_seconds:
+        return entry[0]
+
+    def get_entry(self, key: str) -> tuple[Any, float] | None:
+        """Return ``(data, created_at)`` for a fresh entry, ``None`` otherwise."""
+        with span("cache.read"):
+            return self._read_entry(key)
+
+    def peek(self, key: str) -> tuple[Any, float] | None:
+        """Same as ``get_entry`` without counting a lookup: for the warmer's and pollers' own probes."""
+        with span("cache.read"):
+            return self._read_entry(key, count=False)
+
+    def get_stale(self, key: str) -> tuple[Any, float] | None:
+        """Return ``(data, created_at)`` whatever its age: last-known-good data when OpenWeather fails."""
+        with span("cache.read"):
+            try:
+                payload = json.loads(self._cache_file(key).read_text(encoding="utf-8"))
+                data = payload.get("data")
+                return (data, float(payload.get("created_at", 0))) if data is not None else None
+            except (json.JSONDecodeError, OSError, TypeError, ValueError, AttributeError):
                 return None
-            return payload.get("data")
-        except (json.JSONDecodeError, OSError, TypeError, ValueError):
-            return None
 
-    def set(self, key: str, data: Any) -> None:
+    def _read_entry(self, key: str, count: bool = True) -> tuple[Any, float] | None:
+        result = "miss"
+        entry = None
+        file_path = self._cache_file(key)
+        if file_path.exists():
+            try:
+                payload = json.loads(file_path.read_text(encoding="utf-8"))
+                created_at = float(payload.get("created_at", 0))
+                data = payload.get("data")
+                if time.time() - created_at > self.ttl_seconds:
+                    result = "expired"
+                elif data is not None:
+                    result, entry = "hit", (data, created_at)
+            except (json.JSONDecodeError, OSError, TypeError, ValueError):
+                result = "error"
+        if count:
+            metrics.inc("weather_cache_lookups_total", result=result)
+        return entry
+
+    def ttl_left(self, created_at: float) -> float:
+        """Seconds until an entry created at ``created_at`` expires."""
+        return max(self.ttl_seconds - (time.time() - created_at), 0.0)
+
+    def set(self, key: str, data: Any) -> float:
         file_path = self._cache_file(key)
-        payload = {"created_at": time.time(), "data": data}
+        created_at = time.time()
+        payload = {"created_at": created_at, "data": data}
+        # Write-then-rename: concurrent readers never see a half-written file.
+        tmp_path = file_path.with_suffix(f".{os.getpid()}.{threading.get_ident()}.tmp")
         try:
-            file_path.write_text(
-                json.dumps(payload, ensure_ascii=False),
-                encoding="utf-8",
-            )
+            if not self._dir_ready:
+                self.cache_dir.mkdir(parents=True, exist_ok=True)
+                self._dir_ready = True
+            with span("cache.write"):
+                tmp_path.write_text(
+                    json.dumps(payload, ensure_ascii=False, separators=(",", ":")),
+                    encoding="utf-8",
+                )
+                os.replace(tmp_path, file_path)
+            metrics.inc("weather_cache_writes_total", result="ok")
         except OSError:
             # Cache must never block weather retrieval.
+            metrics.inc("weather_cache_writes_total", result="error")
+        return created_at
+
+
+class PersistentMap:
+    """Small JSON-backed dict shared by threads and processes; updates are merged into the file atomically."""
+
+    def __init__(self, path: str | Path, max_entries: int = 50_000) -> None:
+        self.path = Path(path)
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._loaded: dict[str, Any] | None = None
+
+    @property
+    def _data(self) -> dict[str, Any]:
+        # Файл читается при первом обращении.
+        if self._loaded is None:
+            with self._lock:
+                if self._loaded is None:
+                    self._loaded = self._load()
+        return self._loaded
+
+    def _load(self) -> dict[str, Any]:
+        try:
+            loaded = json.loads(self.path.read_text(encoding="utf-8"))
+            if isinstance(loaded, dict):
+                return loaded
+        except (json.JSONDecodeError, OSError, ValueError):
+            pass
+        return {}
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def get(self, key: str) -> Any | None:
+        return self._data.get(key)
+
+    @contextmanager
+    def _file_lock(self) -> Iterator[None]:
+        # Файл заменяется через os.replace, поэтому блокируется соседний .lock, а не он сам.
+        if fcntl is None:
+            yield
             return
+        fd = os.open(self.path.with_name(self.path.name + ".lock"), os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX)
+            yield
+        finally:
+            os.close(fd)
+
+    def update(self, items: dict[str, Any]) -> None:
+        data = self._data
+        with self._lock:
+            changed = {k: v for k, v in items.items() if data.get(k) != v}
+            if not changed:
+                return
+            try:
+                self.path.parent.mkdir(parents=True, exist_ok=True)
+                with self._file_lock():
+                    # Файл пишут и бот, и воркеры API: сливаем с тем, что на диске сейчас,
+                    # иначе последний писатель затирает чужие ключи.
+                    merged = self._load()
+                    for key, value in changed.items():
+                        # Свежие ключи — в конец: при переполнении вытесняются самые старые.
+                        merged.pop(key, None)
+                        merged[key] = value
+                    while len(merged) > self.max_entries:
+                        del merged[next(iter(merged))]
+                    tmp_path = self.path.with_suffix(f".{os.getpid()}.{threading.get_ident()}.tmp")
+                    tmp_path.write_text(json.dumps(merged, ensure_ascii=False), encoding="utf-8")
+                    os.replace(tmp_path, self.path)
+            except OSError:
+                # Диск недоступен: изменения остаются в памяти процесса.
+                data.update(changed)
+                return
+            self._loaded = merged
+
+
+class NegativeCache:
+    """In-memory short-lived cache of failed lookups: typos and upstream errors are not retried on every request."""
+
+    def __init__(self, not_found_ttl: float = 300, error_ttl: float = 15, max_entries: int = 10_000) -> None:
+        self.not_found_ttl = not_found_ttl
+        self.error_ttl = error_ttl
+        self.max_entries = max(max_entries, 1)
+        self._entries: dict[str, tuple[float, str | None, Any]] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+
+    def get(self, key: str) -> tuple[str | None, Any] | None:
+        """Return ``(error, data)`` for a live entry, ``None`` otherwise."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, error, data = entry
+            if time.monotonic() >= expires_at:
+                del self._entries[key]
+                return None
+            self.hits += 1
+            return error, data
+
+    def set(self, key: str, error: str | None, ttl: float, data: Any = None) -> None:
+        if ttl <= 0:
+            return
+        now = time.monotonic()
+        with self._lock:
+            if len(self._entries) >= self.max_entries:
+                self._entries = {k: v for k, v in self._entries.items() if v[0] > now}
+                if len(self._entries) >= self.max_entries:
+                    # Все записи живые — выбрасываем самую старую (dict хранит порядок вставки).
+                    del self._entries[next(iter(self._entries))]
+            self._entries[key] = (now + ttl, error, data)
+
+    def stats(self) -> dict[str, Any]:
+        with self._lock:
+            return {"entries": len(self._entries), "hits": self.hits}
+
+
+class LatencyTracker:
+    """Smoothed upstream latency (TCP RTO style): timeout = srtt + 4 * rttvar, clamped to [min, max]."""
+
+    def __init__(self, min_timeout: float = 1.0, max_timeout: float = 8.0, warmup_samples: int = 5) -> None:
+        self.min_timeout = min_timeout
+        self.max_timeout = max(max_timeout, min_timeout)
+        self.warmup_samples = warmup_samples
+        self.samples = 0
+        self.srtt = 0.0
+        self.rttvar = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, seconds: float) -> None:
+        with self._lock:
+            if self.samples == 0:
+                self.srtt = seconds
+                self.rttvar = seconds / 2
+            else:
+                self.rttvar = 0.75 * self.rttvar + 0.25 * abs(self.srtt - seconds)
+                self.srtt = 0.875 * self.srtt + 0.125 * seconds
+            self.samples += 1
+
+    def timeout(self) -> float:
+        """Per-attempt timeout; the configured maximum until enough samples are seen."""
+        if self.samples < self.warmup_samples:
+            return self.max_timeout
+        return min(max(self.srtt + 4 * self.rttvar, self.min_timeout), self.max_timeout)
+
+    def hedge_delay(self) -> float | None:
+        """When to send a hedged duplicate: well past the typical latency; None while warming up."""
+        if self.samples < self.warmup_samples:
+            return None
+        return self.srtt + 2 * self.rttvar
+
+
+class ApiKeyPool:
+    """OpenWeather API keys with per-minute quota accounting and 429 cooldowns; picks the key with most quota left."""
+
+    def __init__(self, keys: list[str], per_minute: int = 60, max_cooldown_s: float = 60.0) -> None:
+        # Порядок сохраняется, повторы и пустые строки отбрасываются; без ключей — один пустой (ответ будет 401).
+        unique = list(dict.fromkeys(k for k in keys if k)) or [""]
+        self.per_minute = per_minute
+        self.max_cooldown_s = max_cooldown_s
+        self._lock = threading.Lock()
+        self._window = 0
+        self._state = {key: {"used": 0, "requests": 0, "throttled": 0, "streak": 0, "cooldown_until": 0.0} for key in unique}
+
+    def __len__(self) -> int:
+        return len(self._state)
+
+    @staticmethod
+    def label(key: str) -> str:
+        """Masked key for stats and metric labels."""
+        return f"…{key[-4:]}" if key else "(пусто)"
+
+    def _roll_window(self, now: float) -> None:
+        window = int(now // 60)
+        if window != self._window:
+            self._window = window
+            for state in self._state.values():
+                state["used"] = 0
+
+    def acquire(self) -> str | None:
+        """Key for the next request, ``None`` if every key is cooling down after 429."""
+        now = time.monotonic()
+        with self._lock:
+            self._roll_window(time.time())
+            ready = [(k, s) for k, s in self._state.items() if s["cooldown_until"] <= now]
+            if not ready:
+                return None
+            # Больше всего остатка квоты на эту минуту; без квоты — наименее загруженный.
+            key, state = min(ready, key=lambda item: item[1]["used"])
+            state["used"] += 1
+            state["requests"] += 1
+        metrics.inc("weather_api_key_requests_total", key=self.label(key))
+        return key
+
+    def available(self) -> bool:
+        now = time.monotonic()
+        with self._lock:
+            return any(s["cooldown_until"] <= now for s in self._state.values())
+
+    def wait_s(self) -> float:
+        """Seconds until some key leaves its cooldown."""
+        now = time.monotonic()
+        with self._lock:
+            return max(min(s["cooldown_until"] for s in self._state.values()) - now, 0.0)
+
+    def report_ok(self, key: str) -> None:
+        with self._lock:
+            self._state[key]["streak"] = 0
+
+    def report_throttled(self, key: str, retry_after: float | None = None) -> None:
+        """429 for ``key``: cool it down for Retry-After or an exponential pause (1, 2, 4 ... s)."""
+        with self._lock:
+            state = self._state[key]
+            state["throttled"] += 1
+            state["streak"] += 1
+            pause = retry_after if retry_after is not None else 2 ** (state["streak"] - 1)
+            state["cooldown_until"] = time.monotonic() + min(pause, self.max_cooldown_s)
+            if self.per_minute:
+                # Ключ упёрся в лимит — до конца минуты считаем его квоту выбранной.
+                state["used"] = max(state["used"], self.per_minute)
+        metrics.inc("weather_api_key_throttled_total", key=self.label(key))
+
+    def stats(self) -> dict[str, Any]:
+        now = time.monotonic()
+        with self._lock:
+            self._roll_window(time.time())
+            return {
+                self.label(key): {
+                    "requests": s["requests"],
+                    "throttled": s["throttled"],
+                    "quota_left": max(self.per_minute - s["used"], 0) if self.per_minute else None,
+                    "cooldown_s": round(max(s["cooldown_until"] - now, 0.0), 1),
+                }
+                for key, s in self._state.items()
+            }
+
+
+class CircuitBreaker:
+    """Stops calling a failing upstream: opens after ``threshold`` consecutive failures, lets one probe through after ``reset_s``."""
+
+    def __init__(self, threshold: int = 5, reset_s: float = 30.0) -> None:
+        self.threshold = max(threshold, 1)
+        self.reset_s = reset_s
+        self._lock = threading.Lock()
+        self._failures = 0
+        self._opened_at: float | None = None
+        self._probing = False
+        self.rejected = 0
+
+    @property
+    def state(self) -> str:
+        if self._opened_at is None:
+            return "closed"
+        return "half_open" if self._probing else "open"
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self._opened_at is None:
+                return True
+            # Открыт: раз в reset_s пропускаем один пробный запрос, остальные — сразу отказ.
+            # Окно отсчитывается заново, так что потерянная проба не оставит предохранитель открытым.
+            if time.monotonic() - self._opened_at >= self.reset_s:
+                self._opened_at = time.monotonic()
+                self._probing = True
+                return True
+            self.rejected += 1
+            return False
+
+    def record_success(self) -> None:
+        with self._lock:
+            if self._opened_at is not None:
+                metrics.set_gauge("weather_circuit_open", 0)
+            self._failures = 0
+            self._opened_at = None
+            self._probing = False
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self._failures += 1
+            if self._probing or self._failures >= self.threshold:
+                if self._opened_at is None:
+                    metrics.inc("weather_circuit_opened_total")
+                metrics.set_gauge("weather_circuit_open", 1)
+                self._opened_at = time.monotonic()
+                self._probing = False
+
+    def stats(self) -> dict[str, Any]:
+        with self._lock:
+            return {"state": self.state, "failures": self._failures, "rejected": self.rejected}
+
+
+class AdmissionGate:
+    """Concurrency limit with a bounded wait queue: callers beyond ``max_queue`` or waiting past their deadline are shed."""
+
+    def __init__(self, name: str, limit: int = 16, max_queue: int = 64, max_wait_s: float = 2.0) -> None:
+        self.name = name
+        self.limit = max(limit, 1)
+        self.max_queue = max(max_queue, 0)
+        self.max_wait_s = max_wait_s
+        self._cond = threading.Condition()
+        self._active = 0
+        self._waiting = 0
+        self.shed = 0
+
+    def _shed(self, reason: str) -> bool:
+        self.shed += 1
+        metrics.inc("admission_shed_total", gate=self.name, reason=reason)
+        return False
+
+    def acquire(self, wait_s: float | None = None) -> bool:
+        """Take a slot, waiting at most ``wait_s`` (and ``max_wait_s``); False if the call is shed."""
+        wait_s = self.max_wait_s if wait_s is None else min(wait_s, self.max_wait_s)
+        started = time.monotonic()
+        with self._cond:
+            if self._active >= self.limit:
+                if self._waiting >= self.max_queue:
+                    return self._shed("queue_full")
+                self._waiting += 1
+                try:
+                    while self._active >= self.limit:
+                        left = started + wait_s - time.monotonic()
+                        if left <= 0:
+                            return self._shed("queue_timeout")
+                        self._cond.wait(left)
+                finally:
+                    self._waiting -= 1
+            self._active += 1
+            metrics.set_gauge("admission_in_flight", self._active, gate=self.name)
+        metrics.observe("admission_queue_seconds", time.monotonic() - started, gate=self.name)
+        return True
+
+    def release(self) -> None:
+        with self._cond:
+            self._active -= 1
+            metrics.set_gauge("admission_in_flight", self._active, gate=self.name)
+            self._cond.notify()
+
+    def stats(self) -> dict[str, Any]:
+        with self._cond:
+            return {"in_flight": self._active, "waiting": self._waiting, "limit": self.limit, "shed": self.shed}
+
+
+def location_bucket(lat: float, lon: float, precision: int = 2) -> str:
+    """Quantized location key: nearby points share one bucket (~1 km at precision 2)."""
+    return f"{round(float(lat), precision):.{precision}f},{round(float(lon), precision):.{precision}f}"
+
+
+def bucket_center(lat: float, lon: float, precision: int = 2) -> tuple[float, float]:
+    """The point OpenWeather is asked about for every location in the bucket."""
+    return round(float(lat), precision), round(float(lon), precision)
+
+
+# Проекции ответов OpenWeather: в кэш (и вызывающему) попадают только поля, которые читают
+# бот и Mini App. Форма ответа сохраняется — те же ключи и вложенность, — так что потребители
+# не меняются. Меняется набор полей — увеличить PROJECTION_VERSION: он входит в ключ кэша.
+PROJECTION_VERSION = 1
+
+
+def _pick(source: Any, keys: tuple[str, ...]) -> dict[str, Any]:
+    if not isinstance(source, dict):
+        return {}
+    return {k: source[k] for k in keys if k in source}
+
+
+def _project_slot(item: dict[str, Any]) -> dict[str, Any]:
+    """Current weather or one forecast slot: time, temperatures, wind and ``weather[0]``."""
+    slot = _pick(item, ("dt", "dt_txt", "name"))
+    main = _pick(item.get("main"), ("temp", "feels_like", "humidity"))
+    if main:
+        slot["main"] = main
+    wind = _pick(item.get("wind"), ("speed",))
+    if wind:
+        slot["wind"] = wind
+    weather = item.get("weather")
+    if isinstance(weather, list) and weather and isinstance(weather[0], dict):
+        slot["weather"] = [_pick(weather[0], ("id", "main", "description", "icon"))]
+    return slot
+
+
+def _project_current(data: Any) -> Any:
+    return _project_slot(data) if isinstance(data, dict) else data
+
+
+def _project_forecast(data: Any) -> Any:
+    if not isinstance(data, dict) or not isinstance(data.get("list"), list):
+        return data
+    return {"list": [_project_slot(i) for i in data["list"] if isinstance(i, dict)]}
+
+
+def _project_air_pollution(data: Any) -> Any:
+    if not isinstance(data, dict) or not isinstance(data.get("list"), list):
+        return data
+    return {"list": [_pick(i, ("dt", "main", "components")) for i in data["list"] if isinstance(i, dict)]}
+
+
+def _project_places(data: Any) -> Any:
+    if not isinstance(data, list):
+        return data
+    places = []
+    for item in data:
+        if not isinstance(item, dict):
+            continue
+        place = _pick(item, ("name", "lat", "lon", "country", "state"))
+        local_names = _pick(item.get("local_names"), ("ru", "en"))
+        if local_names:
+            place["local_names"] = local_names
+        places.append(place)
+    return places
+
+
+PROJECTIONS = {
+    "/data/2.5/weather": _project_current,
+    "/data/2.5/forecast": _project_forecast,
+    "/data/2.5/air_pollution": _project_air_pollution,
+    "/data/2.5/air_pollution/forecast": _project_air_pollution,
+    "/geo/1.0/direct": _project_places,
+    "/geo/1.0/reverse": _project_places,
+}
+
+
+def project_response(endpoint: str, data: Any) -> Any:
+    """Strip an OpenWeather response down to the fields this project reads (unknown endpoints pass through)."""
+    projection = PROJECTIONS.get(endpoint)
+    return projection(data) if projection is not None else data
 
 
 class WeatherClient:
     BASE = "https://api.openweathermap.org"
+    # Endpoints kept warm by the refresh scheduler (see warmup.py).
+    PREFETCH_ENDPOINTS = ("/data/2.5/weather", "/data/2.5/forecast")
 
-    def __init__(self, api_key: str, timeout: int = 8, cache_ttl_min: int = 10) -> None:
-        self.api_key = api_key
+    def __init__(
+        self,
+        api_key: str,
+        timeout: int = 8,
+        cache_ttl_min: int = 10,
+        base_url: str | None = None,
+        gazetteer: Gazetteer | None = None,
+        not_found_ttl_s: int = 300,
+        error_ttl_s: int = 15,
+        raw_cache: bool = False,
+        deadline_s: float = 10.0,
+        hedge: float | str | None = None,
+        breaker_failures: int = 5,
+        breaker_reset_s: float = 30.0,
+        api_keys: list[str] | None = None,
+        key_rpm: int = 60,
+        max_concurrency: int = 16,
+        max_queue: int = 64,
+        queue_wait_s: float = 2.0,
+    ) -> None:
+        # Ключи не входят в ключ кэша: записи общие для всего пула.
+        self.keys = ApiKeyPool([api_key, *(api_keys or [])], per_minute=key_rpm)
+        self.base_url = (base_url or self.BASE).rstrip("/")
+        # Upper bound per attempt; the actual timeout adapts to observed latency (see LatencyTracker).
         self.timeout = timeout
-        self.last_error: str | None = None
+        # Budget of a single call when the caller did not set one with deadline().
+        self.deadline_s = deadline_s
+        # Hedged requests: None/0 — off, "auto" — after the smoothed latency, a number — after N ms.
+        self.hedge = hedge if hedge == "auto" else (float(hedge or 0) or None)
+        self._latency: dict[str, LatencyTracker] = {}
+        self._hedge_pool: ThreadPoolExecutor | None = None
+        self._hedge_pool_lock = threading.Lock()
+        # One breaker for the whole upstream: when OpenWeather is down, it is down for every endpoint.
+        self.breaker = CircuitBreaker(threshold=breaker_failures, reset_s=breaker_reset_s)
+        # Bulkhead for OpenWeather: bounded in-flight calls and wait queue, so a slow upstream sheds load
+        # instead of piling up every bot and API thread behind it.
+        self.upstream_gate = AdmissionGate("openweather", max_concurrency, max_queue, queue_wait_s)
+        # Per-thread state: one client is shared by all gunicorn/bot threads.
+        self._local = threading.local()
         self.cache = OpenWeatherCache(ttl_seconds=max(cache_ttl_min, 1) * 60)
+        # Raw mode (debugging) caches full OpenWeather responses instead of projections.
+        self.raw_cache = raw_cache
+        # Short TTLs: "not found" is stable for minutes, upstream errors only for seconds.
+        self.negative = NegativeCache(not_found_ttl=not_found_ttl_s, error_ttl=error_ttl_s)
+        # Local city index: answers geocoding without a network call when it knows the city.
+        self.gazetteer = gazetteer
+        # Learned aliases: every spelling that resolved once -> canonical location.
+        self.aliases = PersistentMap(self.cache.cache_dir / "geo_aliases.json")
+        # Reverse geocoding per grid cell; places do not move, so entries never expire.
+        self.places = PersistentMap(self.cache.cache_dir / "geo_reverse.json")
+        # Every fetched current weather lands here as a side effect: trends cost no extra calls.
+        self.observations = ObservationStore(self.cache.cache_dir / "observations.bin")
+        # How often each point was asked for, decaying over time; ranks what the warm-up job refreshes first.
+        self._demand: Counter[tuple[float, float]] = Counter()
+        self._demand_lock = threading.Lock()
+        self._demand_decayed_at = time.monotonic()
+
+    @classmethod
+    def from_env(cls, **overrides: Any) -> "WeatherClient":
+        """Client configured from environment variables (see README); ``overrides`` win over the environment.
+
+        Reads ``os.environ`` as is: call ``load_dotenv()`` first. A missing API key is not checked here.
+        """
+        def flag(name: str, default: str = "0") -> bool:
+            return os.getenv(name, default).strip().lower() in ("1", "on", "true", "yes")
+
+        settings: dict[str, Any] = {
+            "api_key": os.getenv("OW_API_KEY", "").strip(),
+            "api_keys": [k.strip() for k in os.getenv("OW_API_KEYS", "").split(",") if k.strip()],
+            "timeout": int(os.getenv("REQUEST_TIMEOUT", "8")),
+            "cache_ttl_min": int(os.getenv("CACHE_TTL_MIN", "10")),
+            "base_url": os.getenv("OW_BASE_URL", "").strip() or None,
+            "gazetteer": get_gazetteer(),
+            "not_found_ttl_s": int(os.getenv("NEG_CACHE_NOT_FOUND_S", "300")),
+            "error_ttl_s": int(os.getenv("NEG_CACHE_ERROR_S", "15")),
+            "raw_cache": flag("OW_CACHE_RAW"),
+            "deadline_s": float(os.getenv("REQUEST_DEADLINE_S", "10")),
+            "hedge": os.getenv("OW_HEDGE_MS", "0").strip().lower(),
+            "breaker_failures": int(os.getenv("OW_BREAKER_FAILURES", "5")),
+            "breaker_reset_s": float(os.getenv("OW_BREAKER_RESET_S", "30")),
+            "key_rpm": int(os.getenv("OW_KEY_RPM", "60")),
+            "max_concurrency": int(os.getenv("OW_MAX_CONCURRENCY", "16")),
+            "max_queue": int(os.getenv("OW_MAX_QUEUE", "64")),
+            "queue_wait_s": float(os.getenv("OW_QUEUE_WAIT_S", "2")),
+        }
+        settings.update(overrides)
+        return cls(**settings)
+
+    @property
+    def last_error(self) -> str | None:
+        return getattr(self._local, "last_error", None)
+
+    @last_error.setter
+    def last_error(self, value: str | None) -> None:
+        self._local.last_error = value
+
+    @property
+    def last_shed(self) -> str | None:
+        """Why the last call in this thread was refused without an answer: "busy" (our queue) or "throttled" (quota)."""
+        return getattr(self._local, "last_shed", None)
+
+    @last_shed.setter
+    def last_shed(self, value: str | None) -> None:
+        self._local.last_shed = value
+
+    @property
+    def last_version(self) -> tuple[str, float] | None:
+        """Version of the data returned by the last call in this thread: (cache key, created_at).
+
+        Changes whenever the underlying cache entry is refreshed.
+        """
+        return getattr(self._local, "last_version", None)
+
+    @last_version.setter
+    def last_version(self, value: tuple[str, float] | None) -> None:
+        self._local.last_version = value
+
+    def _session(self) -> requests.Session:
+        """Keep-alive session per thread (requests.Session is not guaranteed thread-safe)."""
+        session = getattr(self._local, "session", None)
+        if session is None:
+            import requests
+
+            session = requests.Session()
+            self._local.session = session
+        return session
+
+    @contextmanager
+    def deadline(self, seconds: float | None) -> Iterator[None]:
+        """Bound all OpenWeather calls made by this thread inside the block to ``seconds`` in total."""
+        previous = getattr(self._local, "deadline", None)
+        if seconds is not None:
+            at = time.monotonic() + seconds
+            self._local.deadline = at if previous is None else min(previous, at)
+        try:
+            yield
+        finally:
+            self._local.deadline = previous
+
+    @contextmanager
+    def background(self) -> Iterator[None]:
+        """Calls made by this thread inside the block are internal: no demand, no cache lookup metrics."""
+        previous = getattr(self._local, "background", False)
+        self._local.background = True
+        try:
+            yield
+        finally:
+            self._local.background = previous
+
+    def _reset_status(self) -> None:
+        # В начале каждого публичного вызова: иначе отказ прошлого запроса этого потока
+        # (last_shed) превращает ответ без обращения к OpenWeather в 503/429.
+        self.last_error = None
+        self.last_version = None
+        self.last_shed = None
+
+    def _is_background(self) -> bool:
+        return getattr(self._local, "background", False)
+
+    def _deadline_at(self) -> float:
+        own = time.monotonic() + self.deadline_s
+        outer = getattr(self._local, "deadline", None)
+        return own if outer is None else min(outer, own)
+
+    def _tracker(self, endpoint: str) -> LatencyTracker:
+        tracker = self._latency.get(endpoint)
+        if tracker is None:
+            tracker = self._latency.setdefault(endpoint, LatencyTracker(max_timeout=self.timeout))
+        return tracker
+
+    def _hedge_after(self, tracker: LatencyTracker) -> float | None:
+        if self.hedge is None:
+            return None
+        if self.hedge == "auto":
+            return tracker.hedge_delay()
+        return float(self.hedge) / 1000
+
+    def _fetch(self, url: str, params: dict[str, Any], timeout: float) -> requests.Response:
+        return self._session().get(url, params=params, timeout=timeout)
+
+    def _get(self, endpoint: str, url: str, params: dict[str, Any], timeout: float, hedge_after: float | None) -> requests.Response:
+        """GET with an optional hedged duplicate: if the first try is slow, the faster of two answers wins."""
+        if hedge_after is None or hedge_after >= timeout:
+            return self._fetch(url, params, timeout)
+        if self._hedge_pool is None:
+            with self._hedge_pool_lock:
+                if self._hedge_pool is None:
+                    self._hedge_pool = ThreadPoolExecutor(max_workers=32, thread_name_prefix="ow-hedge")
+        first = self._hedge_pool.submit(self._fetch, url, params, timeout)
+        done, _ = wait([first], timeout=hedge_after)
+        if done:
+            return first.result()
+        metrics.inc("weather_upstream_hedged_total", endpoint=endpoint)
+        second = self._hedge_pool.submit(self._fetch, url, params, timeout - hedge_after)
+        done, _ = wait([first, second], return_when=FIRST_COMPLETED)
+        winner = next(iter(done))
+        if winner.exception() is None:
+            return winner.result()
+        # Первый завершившийся упал — ждём второй; его исключение и поднимется.
+        return (second if winner is first else first).result()
 
     def _cache_key(self, endpoint: str, params: dict[str, Any]) -> str:
         normalized = "&".join(f"{k}={params[k]}" for k in sorted(params))
-        return f"{endpoint}?{normalized}"
+        # Сырые ответы и проекции разных версий не должны читаться друг вместо друга.
+        schema = "raw" if self.raw_cache else f"p{PROJECTION_VERSION}"
+        return f"{endpoint}?{normalized}#{schema}"
+
+    def _fail(self, cache_key: str, error: str, ttl: float, use_cache: bool, stale_ok: bool) -> Any | None:
+        """Record a failed call; return the last-known-good entry instead, if there is one."""
+        self.last_error = error
+        if use_cache and ttl:
+            self.negative.set(cache_key, error, ttl)
+        return self._serve_stale(cache_key) if stale_ok else None
+
+    def _serve_stale(self, cache_key: str) -> Any | None:
+        entry = self.cache.get_stale(cache_key)
+        if entry is None:
+            return None
+        metrics.inc("weather_stale_served_total")
+        self.last_error = None
+        self.last_version = (cache_key, entry[1])
+        return entry[0]
 
     def _request_json(
         self,
         endpoint: str,
         params: dict[str, Any],
         use_cache: bool = True,
+        empty_is_not_found: bool = False,
+        refresh: bool = False,
     ) -> Any | None:
-        self.last_error = None
-        merged = {"appid": self.api_key, **params}
-        cache_key = self._cache_key(endpoint, merged)
-        if use_cache:
-            cached = self.cache.get(cache_key)
-            if cached is not None:
+        self._reset_status()
+        cache_key = self._cache_key(endpoint, params)
+        # Устаревшая запись лучше ошибки — но не для прогрева, которому нужны свежие данные.
+        stale_ok = use_cache and not refresh
+        if use_cache and not refresh:
+            entry = self.cache.peek(cache_key) if self._is_background() else self.cache.get_entry(cache_key)
+            if entry is not None:
+                cached, created_at = entry
+                self.last_version = (cache_key, created_at)
+                return cached
+            failed = self.negative.get(cache_key)
+            if failed is not None:
+                metrics.inc("weather_negative_cache_hits_total", endpoint=endpoint)
+                self.last_error, cached = failed
+                if self.last_error is not None:
+                    return self._serve_stale(cache_key)
                 return cached
 
-        url = f"{self.BASE}{endpoint}"
-        delays = [1, 2, 4]
-        attempts = len(delays) + 1
+        import requests
 
-        for attempt in range(attempts):
-            try:
-                response = requests.get(url, params=merged, timeout=self.timeout)
-            except requests.RequestException:
-                self.last_error = "Сетевая ошибка. Проверьте подключение и повторите позже."
-                return None
+        url = f"{self.base_url}{endpoint}"
+        attempts = 4
+        error_ttl = self.negative.error_ttl
+        not_found_ttl = self.negative.not_found_ttl
+        deadline = self._deadline_at()
+        tracker = self._tracker(endpoint)
+        timed_out = False
 
-            if response.status_code == 429:
-                if attempt < len(delays):
-                    time.sleep(delays[attempt])
-                    continue
-                self.last_error = "Слишком много запросов к погодному API. Повторите позже."
-                return None
+        if not self.breaker.allow():
+            metrics.inc("weather_circuit_rejected_total", endpoint=endpoint)
+            return self._fail(cache_key, "Сервис погоды временно недоступен. Повторите позже.", 0, use_cache, stale_ok)
 
-            if 400 <= response.status_code < 600:
-                self.last_error = f"Ошибка сервиса погоды ({response.status_code})."
-                return None
+        # Промахи кэша ждут свободного слота к OpenWeather не дольше очереди и дедлайна; остальным — отказ.
+        if not self.upstream_gate.acquire(deadline - time.monotonic()):
+            self.last_shed = "busy"
+            return self._fail(cache_key, "Сервис перегружен. Повторите через минуту.", 0, use_cache, stale_ok)
+        try:
+            for attempt in range(attempts):
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    metrics.inc("weather_deadline_exceeded_total", endpoint=endpoint)
+                    return self._fail(cache_key, "Сервис погоды не ответил вовремя. Повторите позже.", 0, use_cache, stale_ok)
+                key = self.keys.acquire()
+                if key is None:
+                    # Все ключи на паузе после 429: ждём ближайший, если успеваем.
+                    pause = self.keys.wait_s()
+                    if pause < remaining:
+                        time.sleep(pause)
+                        key = self.keys.acquire()
+                        remaining = deadline - time.monotonic()
+                    if key is None:
+                        self.last_shed = "throttled"
+                        return self._fail(
+                            cache_key, "Слишком много запросов к погодному API. Повторите позже.", error_ttl, use_cache, stale_ok
+                        )
+                # После таймаута повтор получает полный таймаут: медленный, но живой сервис успеет ответить.
+                timeout = min(self.timeout if timed_out else tracker.timeout(), remaining)
+                started = time.perf_counter()
+                try:
+                    with span("upstream"):
+                        response = self._get(endpoint, url, {"appid": key, **params}, timeout, self._hedge_after(tracker))
+                except requests.Timeout:
+                    metrics.observe("weather_upstream_seconds", time.perf_counter() - started, endpoint=endpoint)
+                    metrics.inc("weather_upstream_requests_total", endpoint=endpoint, status="timeout")
+                    self.breaker.record_failure()
+                    if not timed_out:
+                        timed_out = True
+                        continue
+                    return self._fail(
+                        cache_key, "Сервис погоды не ответил вовремя. Повторите позже.", error_ttl, use_cache, stale_ok
+                    )
+                except requests.RequestException:
+                    metrics.observe("weather_upstream_seconds", time.perf_counter() - started, endpoint=endpoint)
+                    metrics.inc("weather_upstream_requests_total", endpoint=endpoint, status="error")
+                    self.breaker.record_failure()
+                    return self._fail(
+                        cache_key, "Сетевая ошибка. Проверьте подключение и повторите позже.", error_ttl, use_cache, stale_ok
+                    )
 
-            try:
-                data = response.json()
-            except ValueError:
-                self.last_error = "Некорректный ответ от сервиса погоды."
-                return None
+                elapsed = time.perf_counter() - started
+                metrics.observe("weather_upstream_seconds", elapsed, endpoint=endpoint)
+                metrics.inc("weather_upstream_requests_total", endpoint=endpoint, status=response.status_code)
+                tracker.observe(elapsed)
+                if response.status_code == 429:
+                    metrics.inc("weather_upstream_throttled_total", endpoint=endpoint)
+                    retry_after = str(response.headers.get("Retry-After") or "")
+                    self.keys.report_throttled(key, float(retry_after) if retry_after.isdigit() else None)
+                    # Повтор — сразу с другим ключом или после паузы (1, 2, 4 с), если она укладывается в дедлайн.
+                    if attempt < attempts - 1 and self.keys.wait_s() < deadline - time.monotonic():
+                        continue
+                    self.breaker.record_failure()
+                    self.last_shed = "throttled"
+                    return self._fail(
+                        cache_key, "Слишком много запросов к погодному API. Повторите позже.", error_ttl, use_cache, stale_ok
+                    )
 
-            if use_cache:
-                self.cache.set(cache_key, data)
-            return data
+                if 400 <= response.status_code < 600:
+                    # 4xx — сервис жив, ответ про сам запрос; 400/404 (опечатка, нет такого места) не изменится.
+                    if response.status_code >= 500:
+                        self.breaker.record_failure()
+                    else:
+                        self.breaker.record_success()
+                    ttl = not_found_ttl if response.status_code in (400, 404) else error_ttl
+                    return self._fail(
+                        cache_key, f"Ошибка сервиса погоды ({response.status_code}).", ttl, use_cache, stale_ok
+                    )
 
-        self.last_error = "Не удалось получить данные о погоде."
-        return None
+                try:
+                    data = response.json()
+                except ValueError:
+                    self.breaker.record_failure()
+                    return self._fail(cache_key, "Некорректный ответ от сервиса погоды.", error_ttl, use_cache, stale_ok)
+                self.breaker.record_success()
+                self.keys.report_ok(key)
+                if not self.raw_cache:
+                    data = project_response(endpoint, data)
+                if endpoint == "/data/2.5/weather" and isinstance(data, dict) and "lat" in params:
+                    self.observations.record_current(location_bucket(params["lat"], params["lon"]), data)
+
+                if use_cache:
+                    if empty_is_not_found and not data:
+                        # Пустой результат геокодинга держим коротко, а не весь TTL файлового кэша.
+                        self.negative.set(cache_key, None, not_found_ttl, data)
+                    else:
+                        self.last_version = (cache_key, self.cache.set(cache_key, data))
+                return data
+
+            return self._fail(cache_key, "Не удалось получить данные о погоде.", error_ttl, use_cache, stale_ok)
+        finally:
+            self.upstream_gate.release()
+
+    @staticmethod
+    def _alias_key(name: str, country: str | None) -> str:
+        return f"{name},{country}" if country else name
+
+    def _learn_aliases(self, name: str, country: str | None, place: dict[str, Any]) -> None:
+        """Remember the query and all names of the found place as aliases of one location."""
+        found_country = str(place.get("country") or "").upper() or None
+        canonical = {
+            "name": str(place.get("name") or name),
+            "country": found_country,
+            "lat": float(place["lat"]),
+            "lon": float(place["lon"]),
+        }
+        names = {name}
+        raw_names = [place.get("name")]
+        local_names = place.get("local_names")
+        if isinstance(local_names, dict):
+            raw_names += [local_names.get("ru"), local_names.get("en")]
+        for raw in raw_names:
+            key = normalize_name(raw) if isinstance(raw, str) else ""
+            if key:
+                names.update((key, transliterate(key)))
+
+        aliases: dict[str, Any] = {}
+        if found_country:
+            # "Город, RU" однозначен для всех написаний найденного города.
+            for alias in names:
+                aliases[self._alias_key(alias, found_country)] = canonical
+        if country is None:
+            # Запрос без страны: API выбрало этот город, значит и другие его названия без страны
+            # ведут сюда. После "Paris, US" голое "paris" не запоминается.
+            for alias in names:
+                if alias == name or self.aliases.get(alias) is None:
+                    aliases[alias] = canonical
+        self.aliases.update(aliases)
 
     def get_coordinates(self, city: str, limit: int = 1) -> tuple[float, float] | None:
-        params = {"q": city, "limit": limit, "lang": "ru"}
-        data = self._request_json("/geo/1.0/direct", params, use_cache=True)
+        self._reset_status()
+        if self.gazetteer is not None:
+            known = self.gazetteer.lookup(city)
+            if known is not None:
+                metrics.inc("weather_geocode_local_total", source="gazetteer")
+                return known.lat, known.lon
+        # "Москва", " москва ", "МОСКВА" — одна запись кэша и один алиас.
+        name, country = split_query(city)
+        if not name:
+            self.last_error = "Город не найден."
+            return None
+        alias = self.aliases.get(self._alias_key(name, country))
+        if alias is not None:
+            metrics.inc("weather_geocode_local_total", source="alias")
+            return float(alias["lat"]), float(alias["lon"])
+
+        params = {"q": self._alias_key(name, country), "limit": limit, "lang": "ru"}
+        data = self._request_json("/geo/1.0/direct", params, use_cache=True, empty_is_not_found=True)
         if not data or not isinstance(data, list):
             if self.last_error is None:
                 self.last_error = "Город не найден."
@@ -127,19 +1112,111 @@ class WeatherClient:
         lat = first.get("lat")
         lon = first.get("lon")
         if isinstance(lat, (int, float)) and isinstance(lon, (int, float)):
+            self._learn_aliases(name, country, first)
             return float(lat), float(lon)
         self.last_error = "Город не найден."
         return None
 
+    def reverse_geocode(self, lat: float, lon: float) -> dict[str, Any] | None:
+        """Locality of a point: ``{"name", "country", "bucket"}``, one upstream call per grid cell."""
+        self._reset_status()
+        bucket = location_bucket(lat, lon)
+        known = self.places.get(bucket)
+        if known is not None:
+            # {} — в этой клетке ничего нет (море, тайга): тоже запомнено.
+            return known or None
+
+        cell_lat, cell_lon = bucket_center(lat, lon)
+        params = {"lat": cell_lat, "lon": cell_lon, "limit": 1}
+        data = self._request_json("/geo/1.0/reverse", params, use_cache=False)
+        if not isinstance(data, list):
+            return None
+        first = data[0] if data and isinstance(data[0], dict) else None
+        place: dict[str, Any] = {}
+        if first is not None and first.get("name"):
+            local_names = first.get("local_names")
+            name = local_names.get("ru") if isinstance(local_names, dict) else None
+            place = {
+                "name": str(name or first["name"]),
+                "country": str(first.get("country") or "").upper() or None,
+                "bucket": bucket,
+            }
+        self.places.update({bucket: place})
+        return place or None
+
+    @staticmethod
+    def _point_params(lat: float, lon: float) -> dict[str, Any]:
+        # Запрос — по центру бакета: точки в пределах ~1 км делят одну запись кэша, и её версия
+        # совпадает с ключом бакета в кэше рендера и микрокэше nginx.
+        lat, lon = bucket_center(lat, lon)
+        return {"lat": lat, "lon": lon}
+
+    @classmethod
+    def _weather_params(cls, lat: float, lon: float) -> dict[str, Any]:
+        return {**cls._point_params(lat, lon), "units": "metric", "lang": "ru"}
+
+    def _note_demand(self, lat: float, lon: float) -> None:
+        if self._is_background():
+            # Опрос SSE и проверки уведомлений — не спрос пользователей.
+            return
+        with self._demand_lock:
+            self._demand[(lat, lon)] += 1
+            if len(self._demand) > 10_000:
+                # Произвольные точки из API не должны раздувать счётчик: держим самые частые.
+                self._demand = Counter(dict(self._demand.most_common(5_000)))
+
+    def hot_locations(self, limit: int = 100) -> list[tuple[tuple[float, float], float]]:
+        """Most requested points with their (decayed) request scores."""
+        with self._demand_lock:
+            return self._demand.most_common(limit)
+
+    def decay_demand(self, half_life_s: float = 3600.0, min_score: float = 0.5, now: float | None = None) -> None:
+        """Age request scores by elapsed time: a score halves every ``half_life_s``, below ``min_score`` it is dropped.
+
+        Decay depends on time, not on how often it is called, so the warm-up pass period does not
+        change how long a point stays hot: a single request keeps it for one half-life.
+        """
+        now = time.monotonic() if now is None else now
+        with self._demand_lock:
+            elapsed, self._demand_decayed_at = max(now - self._demand_decayed_at, 0.0), now
+            factor = 0.5 ** (elapsed / half_life_s) if half_life_s > 0 else 0.0
+            self._demand = Counter({k: v * factor for k, v in self._demand.items() if v * factor >= min_score})
+
+    def expiring(self, lat: float, lon: float, lead_s: float) -> list[str]:
+        """Prefetchable endpoints for a point that are missing or expire within ``lead_s``."""
+        params = self._weather_params(lat, lon)
+        stale = []
+        for endpoint in self.PREFETCH_ENDPOINTS:
+            entry = self.cache.peek(self._cache_key(endpoint, params))
+            if entry is None or self.cache.ttl_left(entry[1]) <= lead_s:
+                stale.append(endpoint)
+        return stale
+
+    def refresh(self, endpoint: str, lat: float, lon: float) -> bool:
+        """Re-fetch one endpoint for a point, bypassing the cache read; True on success."""
+        return self._request_json(endpoint, self._weather_params(lat, lon), refresh=True) is not None
+
     def get_current_weather(self, lat: float, lon: float) -> dict[str, Any]:
-        params = {"lat": lat, "lon": lon, "units": "metric", "lang": "ru"}
+        params = self._weather_params(lat, lon)
+        self._note_demand(params["lat"], params["lon"])
         data = self._request_json("/data/2.5/weather", params, use_cache=True)
         if isinstance(data, dict):
             return data
         return {}
 
+    def get_history(self, lat: float, lon: float, hours: float = 24) -> dict[str, list[float]]:
+        """Observations recorded for the point over the last ``hours``: column -> values in time order."""
+        self._reset_status()
+        return self.observations.series(location_bucket(lat, lon), since=time.time() - hours * 3600)
+
+    def get_observation_at(self, lat: float, lon: float, ts: float, max_gap_s: float = 1800) -> dict[str, float] | None:
+        """The recorded observation closest to ``ts`` (within ``max_gap_s``), or None."""
+        self._reset_status()
+        return self.observations.nearest(location_bucket(lat, lon), ts, max_gap_s)
+
     def get_forecast_5d3h(self, lat: float, lon: float) -> list[dict[str, Any]]:
-        params = {"lat": lat, "lon": lon, "units": "metric", "lang": "ru"}
+        params = self._weather_params(lat, lon)
+        self._note_demand(params["lat"], params["lon"])
         data = self._request_json("/data/2.5/forecast", params, use_cache=True)
         if not isinstance(data, dict):
             return []
@@ -149,7 +1226,7 @@ class WeatherClient:
         return []
 
     def get_air_pollution(self, lat: float, lon: float) -> dict[str, Any]:
-        params = {"lat": lat, "lon": lon}
+        params = self._point_params(lat, lon)
         data = self._request_json("/data/2.5/air_pollution", params, use_cache=True)
         if not isinstance(data, dict):
             return {}
@@ -160,6 +1237,17 @@ class WeatherClient:
                 return components
         return {}
 
+    def get_air_pollution_forecast(self, lat: float, lon: float) -> list[dict[str, Any]]:
+        """Hourly air-pollution forecast (~4 days): items with ``dt`` and ``components``."""
+        params = self._point_params(lat, lon)
+        data = self._request_json("/data/2.5/air_pollution/forecast", params, use_cache=True)
+        if not isinstance(data, dict):
+            return []
+        items = data.get("list")
+        if isinstance(items, list):
+            return [i for i in items if isinstance(i, dict) and isinstance(i.get("components"), dict)]
+        return []
+
 
 class AirQualityAnalyzer:
     def analyze_air_pollution(
@@ -174,29 +1262,8 @@ class AirQualityAnalyzer:
                 "details": {},
             }
 
-        pm25 = float(components.get("pm2_5", 0))
-        pm10 = float(components.get("pm10", 0))
-        no2 = float(components.get("no2", 0))
-        o3 = float(components.get("o3", 0))
-
-        score = 0
-        score += 3 if pm25 > 35 else 2 if pm25 > 15 else 1 if pm25 > 5 else 0
-        score += 3 if pm10 > 50 else 2 if pm10 > 25 else 1 if pm10 > 10 else 0
-        score += 2 if no2 > 100 else 1 if no2 > 40 else 0
-        score += 2 if o3 > 120 else 1 if o3 > 60 else 0
-
-        if score <= 2:
-            status = "Хорошее"
-            summary = "Качество воздуха в норме."
-        elif score <= 5:
-            status = "Умеренное"
-            summary = "Допустимо для большинства людей."
-        elif score <= 8:
-            status = "Повышенное загрязнение"
-            summary = "Чувствительным группам стоит сократить время на улице."
-        else:
-            status = "Высокое загрязнение"
-            summary = "Рекомендуется ограничить активность на открытом воздухе."
+        # Пороги и статусы — общая таблица в air_quality.py (та же, что у оценок компонентов в боте).
+        status, summary = air_status(score_components([components])[0])
 
         result = {
             "status": status,
@@ -218,30 +1285,44 @@ class AirQualityAnalyzer:
 
 
 def _build_default_client() -> WeatherClient:
-    api_key = os.getenv("OW_API_KEY", "")
-    timeout = int(os.getenv("REQUEST_TIMEOUT", "8"))
-    cache_ttl = int(os.getenv("CACHE_TTL_MIN", "10"))
-    return WeatherClient(api_key=api_key, timeout=timeout, cache_ttl_min=cache_ttl)
+    from dotenv import load_dotenv
+
+    load_dotenv()
+    return WeatherClient.from_env()
 
 
-_default_client = _build_default_client()
+_default_client: WeatherClient | None = None
+_default_client_lock = threading.Lock()
 _analyzer = AirQualityAnalyzer()
 
 
+def _get_default_client() -> WeatherClient:
+    global _default_client
+    if _default_client is None:
+        with _default_client_lock:
+            if _default_client is None:
+                _default_client = _build_default_client()
+    return _default_client
+
+
 def get_coordinates(city: str, limit: int = 1) -> tuple[float, float] | None:
-    return _default_client.get_coordinates(city=city, limit=limit)
+    return _get_default_client().get_coordinates(city=city, limit=limit)
 
 
 def get_current_weather(lat: float, lon: float) -> dict[str, Any]:
-    return _default_client.get_current_weather(lat=lat, lon=lon)
+    return _get_default_client().get_current_weather(lat=lat, lon=lon)
 
 
 def get_forecast_5d3h(lat: float, lon: float) -> list[dict[str, Any]]:
-    return _default_client.get_forecast_5d3h(lat=lat, lon=lon)
+    return _get_default_client().get_forecast_5d3h(lat=lat, lon=lon)
 
 
 def get_air_pollution(lat: float, lon: float) -> dict[str, Any]:
-    return _default_client.get_air_pollution(lat=lat, lon=lon)
+    return _get_default_client().get_air_pollution(lat=lat, lon=lon)
+
+
+def get_air_pollution_forecast(lat: float, lon: float) -> list[dict[str, Any]]:
+    return _get_default_client().get_air_pollution_forecast(lat=lat, lon=lon)
 
 
 def analyze_air_pollution(components: dict[str, Any], extended: bool = False) -> dict[str, Any]:
@@ -249,4 +1330,4 @@ def analyze_air_pollution(components: dict[str, Any], extended: bool = False) ->
 
 
 def get_last_error() -> str | None:
-    return _default_client.last_error
+    return _get_default_client().last_error